@@ -7,14 +7,19 @@ Improvements over tasks1:
 - Mark complete
 - Safer JSON storage with automatic file init
 - Single-file CLI (no external deps)
+- The menu keeps the tasks in memory and saves changes in the background
 """
 
 from __future__ import annotations
 import json
-from dataclasses import dataclass, asdict
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
 from datetime import date, datetime
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Set
 import uuid
 
 DATA_PATH = Path("data")
@@ -23,8 +28,13 @@ STORE_FILE = DATA_PATH / "tasks2.json"
 # ---------- Model ----------
 
 PRIORITIES = ("low", "medium", "high")
+_PRIORITY = {p: p for p in PRIORITIES}   # canonical (interned) priority strings
 
-@dataclass
+def _parse_due(due: str) -> int:
+    # YYYY-MM-DD -> date ordinal (ValueError if invalid)
+    return datetime.strptime(due, "%Y-%m-%d").toordinal()
+
+@dataclass(slots=True)
 class Task:
     id: str
     title: str
@@ -33,25 +43,63 @@ class Task:
     priority: str = "medium"          # low | medium | high
     tags: List[str] = None            # list of strings
     completed: bool = False
+    # parsed `due`, valid while _due_src is the string it was parsed from
+    _due_ord: Optional[int] = field(default=None, init=False, repr=False, compare=False)
+    _due_src: Optional[str] = field(default=None, init=False, repr=False, compare=False)
 
     def __post_init__(self):
-        if self.tags is None:
-            self.tags = []
-        if self.priority not in PRIORITIES:
-            self.priority = "medium"
+        self.tags = [sys.intern(t) for t in self.tags] if self.tags else []
+        self.priority = _PRIORITY.get(self.priority, "medium")
         if self.due:
             # Validate date format early (raise ValueError if invalid)
-            datetime.strptime(self.due, "%Y-%m-%d")
+            self._due_ord = _parse_due(self.due)
+        self._due_src = self.due
+
+    @classmethod
+    def from_dicts(cls, raws: List[Dict[str, Any]]) -> List["Task"]:
+        # Trusted records from our own file: skip __init__ validation,
+        # parse due dates lazily.
+        out = []
+        for r in raws:
+            t = object.__new__(cls)
+            t.id = r["id"]
+            t.title = r["title"]
+            t.description = r.get("description", "")
+            t.due = r.get("due")
+            t.priority = _PRIORITY.get(r.get("priority"), "medium")
+            t.tags = [sys.intern(x) for x in r.get("tags") or []]
+            t.completed = r.get("completed", False)
+            t._due_ord = None
+            t._due_src = None if not t.due else ""
+            out.append(t)
+        return out
+
+    def _due_ordinal(self) -> Optional[int]:
+        if self._due_src is not self.due:
+            self._due_ord = _parse_due(self.due) if self.due else None
+            self._due_src = self.due
+        return self._due_ord
 
     def is_overdue(self) -> bool:
         if self.completed or not self.due:
             return False
-        return date.today() > datetime.strptime(self.due, "%Y-%m-%d").date()
+        return date.today().toordinal() > self._due_ordinal()
 
     def is_due_today(self) -> bool:
         if self.completed or not self.due:
             return False
-        return date.today() == datetime.strptime(self.due, "%Y-%m-%d").date()
+        return date.today().toordinal() == self._due_ordinal()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "title": self.title,
+            "description": self.description,
+            "due": self.due,
+            "priority": self.priority,
+            "tags": list(self.tags),
+            "completed": self.completed,
+        }
 
 # ---------- Storage ----------
 
@@ -65,11 +113,167 @@ def _load_all() -> List[Task]:
     _init_store()
     with STORE_FILE.open("r", encoding="utf-8") as f:
         raw = json.load(f)
-    return [Task(**t) for t in raw]
+    return Task.from_dicts(raw)
 
 def _save_all(tasks: List[Task]) -> None:
-    with STORE_FILE.open("w", encoding="utf-8") as f:
-        json.dump([asdict(t) for t in tasks], f, indent=2)
+    # write a new file and rename it over the old one: a save cut short
+    # (Ctrl-C, a crash) leaves the previous contents intact
+    tmp = STORE_FILE.with_name(STORE_FILE.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write(json.dumps([t.to_dict() for t in tasks], indent=2))
+    os.replace(tmp, STORE_FILE)
+
+# ---------- Session ----------
+
+SAVE_DELAY = 0.5   # seconds of further changes folded into one save
+
+class Session:
+    """The tasks of one menu session, loaded once and kept in memory with
+    the filters' answers precomputed. Changes are written back by a
+    background thread, one save per burst of changes; flush() and close()
+    wait for them to be on disk."""
+
+    def __init__(self, delay: float = SAVE_DELAY):
+        self.delay = delay
+        self.tasks: List[Task] = []
+        # filter buckets: positions in self.tasks
+        self.open: Set[int] = set()
+        self.done: Set[int] = set()
+        self.by_priority: Dict[str, Set[int]] = {p: set() for p in PRIORITIES}
+        self.by_tag: Dict[str, Set[int]] = {}
+        self.by_due: Dict[int, Set[int]] = {}   # due ordinal -> open tasks
+        self._text: List[str] = []              # lowercased, for search
+        self._dates: Dict[str, Optional[int]] = {}   # due string -> ordinal
+        for t in _load_all():
+            self._index(t)
+        self._cond = threading.Condition()
+        self._changes = 0    # changes made so far
+        self._saved = 0      # ... and written
+        self._hurry = False
+        self._closing = False
+        self._error: Optional[Exception] = None
+        self._writer = threading.Thread(target=self._write_behind, name="tasks2-writer", daemon=True)
+        self._writer.start()
+
+    def _index(self, t: Task) -> None:
+        i = len(self.tasks)
+        self.tasks.append(t)
+        (self.done if t.completed else self.open).add(i)
+        self.by_priority[t.priority].add(i)
+        for tag in t.tags:
+            self.by_tag.setdefault(tag, set()).add(i)
+        due = self._due(t)
+        if due is not None and not t.completed:
+            self.by_due.setdefault(due, set()).add(i)
+        self._text.append("\n".join([t.title, t.description or "", *t.tags]).lower())
+
+    def _due(self, t: Task) -> Optional[int]:
+        # parsed once per distinct date: tasks share few of them
+        if not t.due:
+            return None
+        try:
+            return self._dates[t.due]
+        except KeyError:
+            pass
+        try:
+            ordinal = _parse_due(t.due)
+        except ValueError:
+            ordinal = None   # a bad date in the file: never overdue
+        self._dates[t.due] = ordinal
+        return ordinal
+
+    # --- queries (answered from memory) ---
+
+    def select(self, filter_: str = "all", value: Optional[str] = None) -> List[Task]:
+        if filter_ == "overdue":
+            today = date.today().toordinal()
+            hits = set().union(*(s for d, s in self.by_due.items() if d < today))
+        elif filter_ == "today":
+            hits = self.by_due.get(date.today().toordinal(), set())
+        elif filter_ == "priority" and value:
+            hits = self.by_priority.get(value, set())
+        elif filter_ == "tag" and value:
+            hits = self.by_tag.get(value, set())
+        elif filter_ == "open":
+            hits = self.open
+        elif filter_ == "done":
+            hits = self.done
+        else:
+            return list(self.tasks)
+        return [self.tasks[i] for i in sorted(hits)]
+
+    def search(self, q: str) -> List[Task]:
+        q = q.lower()
+        return [t for t, text in zip(self.tasks, self._text) if q in text]
+
+    # --- changes (saved in the background) ---
+
+    def add(self, t: Task) -> None:
+        with self._cond:
+            self._index(t)
+            self._changed()
+
+    def complete(self, i: int) -> None:
+        t = self.tasks[i]
+        with self._cond:
+            t.completed = True
+            self.open.discard(i)
+            self.done.add(i)
+            due = self._due(t)
+            if due is not None:
+                self.by_due[due].discard(i)
+            self._changed()
+
+    def _changed(self) -> None:
+        self._changes += 1
+        self._cond.notify_all()
+
+    def _write_behind(self) -> None:
+        while True:
+            with self._cond:
+                while self._saved == self._changes and not self._closing:
+                    self._cond.wait()
+                if self._saved == self._changes:
+                    return   # closing, all saved
+                # let the burst finish, unless someone is waiting on it
+                end = time.monotonic() + self.delay
+                while not (self._closing or self._hurry) and time.monotonic() < end:
+                    self._cond.wait(end - time.monotonic())
+                target, tasks = self._changes, list(self.tasks)
+                self._hurry = False
+            # encode and write without the lock: the menu carries on. A task
+            # completed meanwhile may or may not make it in; the next save
+            # has it either way.
+            try:
+                _save_all(tasks)
+                error = None
+            except Exception as e:   # reported by flush()/close()
+                error = e
+            with self._cond:
+                self._saved, self._error = target, error
+                self._cond.notify_all()
+
+    def flush(self) -> None:
+        """Wait until every change so far is saved; raises what the last
+        save failed with."""
+        with self._cond:
+            target = self._changes
+            if self._saved < target:
+                self._hurry = True
+                self._cond.notify_all()
+            while self._saved < target and self._writer.is_alive():
+                self._cond.wait()
+            if self._error is not None:
+                raise self._error
+
+    def close(self) -> None:
+        """Save what is left and stop the writer."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._writer.join()
+        if self._error is not None:
+            raise self._error
 
 # ---------- Helpers ----------
 
@@ -130,7 +334,8 @@ def _print_task(t: Task) -> None:
     if t.tags:
         print(f"  tags: {', '.join(t.tags)}")
 
-def _choose_task(tasks: List[Task]) -> Optional[Task]:
+def _choose_task(tasks: List[Task]) -> Optional[int]:
+    # the position of the chosen task in `tasks`
     if not tasks:
         print("No tasks available.")
         return None
@@ -144,7 +349,7 @@ def _choose_task(tasks: List[Task]) -> Optional[Task]:
     try:
         i = int(s)
         if 1 <= i <= len(tasks):
-            return tasks[i-1]
+            return i - 1
     except ValueError:
         pass
     print("Invalid selection.")
@@ -152,7 +357,7 @@ def _choose_task(tasks: List[Task]) -> Optional[Task]:
 
 # ---------- Actions ----------
 
-def add_task() -> None:
+def add_task(session: Session) -> None:
     print("\nAdd Task")
     title = _input_nonempty("Title: ")
     desc = _input_optional("Description (optional): ") or ""
@@ -168,26 +373,11 @@ def add_task() -> None:
         priority=prio,
         tags=tags,
     )
-    tasks = _load_all()
-    tasks.append(t)
-    _save_all(tasks)
+    session.add(t)
     print("Task added.\n")
 
-def list_tasks(filter_: str = "all", value: Optional[str] = None) -> None:
-    tasks = _load_all()
-    if filter_ == "overdue":
-        tasks = [t for t in tasks if t.is_overdue()]
-    elif filter_ == "today":
-        tasks = [t for t in tasks if t.is_due_today()]
-    elif filter_ == "priority" and value:
-        tasks = [t for t in tasks if t.priority == value]
-    elif filter_ == "tag" and value:
-        tasks = [t for t in tasks if value in t.tags]
-    elif filter_ == "open":
-        tasks = [t for t in tasks if not t.completed]
-    elif filter_ == "done":
-        tasks = [t for t in tasks if t.completed]
-
+def list_tasks(session: Session, filter_: str = "all", value: Optional[str] = None) -> None:
+    tasks = session.select(filter_, value)
     if not tasks:
         print("\nNo matching tasks.\n")
         return
@@ -197,15 +387,9 @@ def list_tasks(filter_: str = "all", value: Optional[str] = None) -> None:
         _print_task(t)
     print()
 
-def search_tasks() -> None:
-    q = _input_nonempty("\nSearch term: ").lower()
-    tasks = _load_all()
-    hits = [
-        t for t in tasks
-        if q in t.title.lower()
-        or q in (t.description or "").lower()
-        or any(q in tag.lower() for tag in t.tags)
-    ]
+def search_tasks(session: Session) -> None:
+    q = _input_nonempty("\nSearch term: ")
+    hits = session.search(q)
     if not hits:
         print("No results.\n")
         return
@@ -214,16 +398,14 @@ def search_tasks() -> None:
         _print_task(t)
     print()
 
-def mark_complete() -> None:
-    tasks = _load_all()
-    t = _choose_task(tasks)
-    if not t:
+def mark_complete(session: Session) -> None:
+    i = _choose_task(session.tasks)
+    if i is None:
         return
-    if t.completed:
+    if session.tasks[i].completed:
         print("Already completed.\n")
         return
-    t.completed = True
-    _save_all(tasks)
+    session.complete(i)
     print("Marked complete.\n")
 
 # ---------- Menu ----------
@@ -244,33 +426,45 @@ q) Quit
 """
 
 def main() -> None:
-    _init_store()
+    session = Session()
+    try:
+        _menu(session)
+    finally:
+        # quit or Ctrl-C: write what the background writer has not yet
+        try:
+            session.close()
+        except OSError as e:
+            print(f"Could not save tasks: {e}", file=sys.stderr)
+
+def _menu(session: Session) -> None:
     print(MENU)
     while True:
         choice = input("Select: ").strip().lower()
         if choice == "1":
-            add_task()
+            add_task(session)
         elif choice == "2":
-            list_tasks("all")
+            list_tasks(session, "all")
         elif choice == "3":
-            list_tasks("open")
+            list_tasks(session, "open")
         elif choice == "4":
-            list_tasks("done")
+            list_tasks(session, "done")
         elif choice == "5":
-            list_tasks("overdue")
+            list_tasks(session, "overdue")
         elif choice == "6":
-            list_tasks("today")
+            list_tasks(session, "today")
         elif choice == "7":
             pr = input("Priority (low/medium/high): ").strip().lower()
             if pr not in PRIORITIES:
                 print("Invalid priority.\n")
             else:
-                list_tasks("priority", pr)
+                list_tasks(session, "priority", pr)
         elif choice == "8":
             tag = _input_nonempty("Tag: ")
-            list_tasks("tag", tag)
+            list_tasks(session, "tag", tag)
         elif choice == "9":
-            search_tasks()
+            search_tasks(session)
+        elif choice == "10":
+            mark_complete(session)
         elif choice in ("q", "quit", "exit"):
             print("Bye!")
             break
@@ -0,0 +1,23 @@
+# tasks2/tests/conftest.py
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+CLI = Path(__file__).resolve().parents[1] / "cli.py"
+
+
+@pytest.fixture
+def tasks2(tmp_path: Path, monkeypatch):
+    """tasks2/cli.py as a module, with its data file in `tmp_path`."""
+    spec = importlib.util.spec_from_file_location("tasks2_cli", CLI)
+    mod = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = mod   # dataclasses look their module up
+    try:
+        spec.loader.exec_module(mod)
+        monkeypatch.setattr(mod, "DATA_PATH", tmp_path / "data")
+        monkeypatch.setattr(mod, "STORE_FILE", tmp_path / "data" / "tasks2.json")
+        yield mod
+    finally:
+        del sys.modules[spec.name]
@@ -0,0 +1,171 @@
+# tasks2/tests/test_session.py
+import json
+import random
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+
+def _day(offset: int) -> str:
+    return (date.today() + timedelta(days=offset)).isoformat()
+
+
+def _saved(tasks2):
+    return json.loads(tasks2.STORE_FILE.read_text(encoding="utf-8"))
+
+
+def _task(tasks2, n: int, **kw):
+    return tasks2.Task(id=f"t{n}", title=f"Task {n}", **kw)
+
+
+def test_close_saves_pending_changes(tasks2):
+    s = tasks2.Session(delay=60)   # the writer would sit on them for a minute
+    s.add(_task(tasks2, 1))
+    s.add(_task(tasks2, 2, tags=["home"]))
+    s.complete(0)
+    s.close()
+    assert _saved(tasks2) == [t.to_dict() for t in s.tasks]
+    assert _saved(tasks2)[0]["completed"] is True
+    assert not s._writer.is_alive()
+
+
+def test_flush_saves_without_stopping(tasks2):
+    s = tasks2.Session(delay=60)
+    try:
+        s.add(_task(tasks2, 1))
+        s.flush()
+        assert [r["id"] for r in _saved(tasks2)] == ["t1"]
+        s.add(_task(tasks2, 2))
+        s.flush()
+        assert [r["id"] for r in _saved(tasks2)] == ["t1", "t2"]
+        assert s._writer.is_alive()
+    finally:
+        s.close()
+
+
+def _answers(*lines):
+    it = iter(lines)
+
+    def ask(prompt=""):
+        line = next(it)
+        if line is KeyboardInterrupt:
+            raise KeyboardInterrupt
+        return line
+    return ask
+
+
+@pytest.mark.parametrize("last", ["q", KeyboardInterrupt])
+def test_menu_saves_on_quit_and_ctrl_c(tasks2, monkeypatch, capsys, last):
+    monkeypatch.setattr("builtins.input", _answers(
+        "1", "Pay rent", "", _day(1), "high", "home, money", last))
+    if last == "q":
+        tasks2.main()
+    else:
+        with pytest.raises(KeyboardInterrupt):
+            tasks2.main()
+    (rec,) = _saved(tasks2)
+    assert (rec["title"], rec["due"], rec["priority"], rec["tags"]) == (
+        "Pay rent", _day(1), "high", ["home", "money"])
+
+
+def _naive(tasks, filter_, value=None):
+    today = date.today().isoformat()
+    keep = {
+        "open": lambda t: not t.completed,
+        "done": lambda t: t.completed,
+        "overdue": lambda t: not t.completed and t.due is not None and t.due < today,
+        "today": lambda t: not t.completed and t.due == today,
+        "priority": lambda t: t.priority == value,
+        "tag": lambda t: value in t.tags,
+    }[filter_]
+    return [t.id for t in tasks if keep(t)]
+
+
+def test_buckets_follow_adds_and_completions(tasks2):
+    rng = random.Random(299)
+    s = tasks2.Session(delay=0)
+    cases = [("open", None), ("done", None), ("overdue", None), ("today", None),
+             ("priority", "high"), ("priority", "low"), ("tag", "work"), ("tag", "home")]
+
+    def check(session):
+        for filter_, value in cases:
+            got = [t.id for t in session.select(filter_, value)]
+            assert got == _naive(session.tasks, filter_, value), (filter_, value)
+    try:
+        for n in range(200):
+            if n % 3 == 2:
+                s.complete(rng.randrange(len(s.tasks)))   # some twice
+            else:
+                due = rng.choice([None, _day(rng.randint(-3, 3))])
+                tags = rng.sample(["work", "home", "x"], rng.randint(0, 2))
+                s.add(_task(tasks2, n, due=due, priority=rng.choice(tasks2.PRIORITIES), tags=tags))
+            if n % 20 == 0:
+                check(s)
+        check(s)
+        assert [t.id for t in s.select("all")] == [t.id for t in s.tasks]
+    finally:
+        s.close()
+    again = tasks2.Session()   # the same answers from the saved file
+    try:
+        assert [t.to_dict() for t in again.tasks] == [t.to_dict() for t in s.tasks]
+        check(again)
+    finally:
+        again.close()
+
+
+def test_interrupted_save_keeps_the_previous_file(tasks2, monkeypatch):
+    s = tasks2.Session(delay=0)
+    try:
+        s.add(_task(tasks2, 1))
+        s.flush()
+        before = tasks2.STORE_FILE.read_bytes()
+
+        real = tasks2.Task.to_dict
+        calls = []
+
+        def cut_short(self):
+            calls.append(self.id)
+            if len(calls) == 2:
+                raise RuntimeError("interrupted")
+            return real(self)
+        monkeypatch.setattr(tasks2.Task, "to_dict", cut_short)
+        s.add(_task(tasks2, 2))
+        with pytest.raises(RuntimeError, match="interrupted"):
+            s.flush()
+        assert tasks2.STORE_FILE.read_bytes() == before
+
+        monkeypatch.setattr(tasks2.Task, "to_dict", real)
+        s.add(_task(tasks2, 3))
+        s.flush()
+        assert [r["id"] for r in _saved(tasks2)] == ["t1", "t2", "t3"]
+    finally:
+        s.close()
+
+
+def test_from_dicts_matches_the_constructor(tasks2):
+    raws = [
+        {"id": "a", "title": "Full", "description": "d", "due": _day(-1), "priority": "high",
+         "tags": ["work", "home"], "completed": False},
+        {"id": "b", "title": "Today", "due": _day(0), "priority": "low", "tags": []},
+        {"id": "c", "title": "Bare"},
+        {"id": "d", "title": "Done", "due": _day(-5), "completed": True},
+        {"id": "e", "title": "Odd priority", "priority": "urgent", "tags": None},
+    ]
+    loaded = tasks2.Task.from_dicts(raws)
+    built = [tasks2.Task(**r) for r in raws]
+    assert loaded == built
+    assert [t.to_dict() for t in loaded] == [t.to_dict() for t in built]
+    assert loaded[4].priority == "medium"
+    assert all(x is sys.intern(x) for t in loaded for x in t.tags)
+    assert [(t.is_overdue(), t.is_due_today()) for t in loaded] == [
+        (True, False), (False, True), (False, False), (False, False), (False, False)]
+
+    # due dates are parsed when first needed, and again when changed
+    t = tasks2.Task.from_dicts([{"id": "f", "title": "Later", "due": "not a date"}])[0]
+    with pytest.raises(ValueError):
+        t.is_overdue()
+    t.due = _day(-2)
+    assert t.is_overdue()
+    t.due = None
+    assert not t.is_overdue() and not t.is_due_today()
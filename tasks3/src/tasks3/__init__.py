@@ -4,6 +4,5 @@ def inc(n: int) -> int:
     return n + 1
 
 def main() -> None:
-    print("tasks3 running")
     from .cli import main as cli_main
     raise SystemExit(cli_main())
@@ -0,0 +1,169 @@
+from __future__ import annotations
+import heapq
+import json
+import os
+import sys
+import time
+from datetime import date, datetime
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+from .backend import Backend
+from .index import due_ordinal
+from .memstore import MemoryBackend
+from .model import Task
+from .watch import Watcher
+
+# `tasks3 agenda` lists the tasks due in a range of days, soonest first.
+# It runs as a query (open due>=FROM due<=TO), so the stores with a field
+# index answer it by bisecting their sorted due dates.
+#
+# `tasks3 remind` keeps the open tasks' deadlines (their due day at --at
+# o'clock) in a heap and sleeps until the first one, or until the store's
+# files change; then only the records the change touched are pushed again.
+Clock = Tuple[int, int]   # hour, minute
+_MAX_SLEEP = 3600   # seconds; the wall clock can jump (suspend, DST)
+
+
+def parse_day(s: str, today: int) -> int:
+    """A day for --from/--to as a date ordinal: YYYY-MM-DD, today,
+    tomorrow, or +N/-N days from today; ValueError otherwise."""
+    if s == "today":
+        return today
+    if s == "tomorrow":
+        return today + 1
+    if s[:1] in "+-" and s[1:].isdigit():
+        return today + int(s)
+    try:
+        return date.fromisoformat(s).toordinal()
+    except ValueError:
+        raise ValueError(f"bad date {s!r} (expected YYYY-MM-DD, today, tomorrow or +N)") from None
+
+
+def agenda(store: Backend, lo: int, hi: int, done: bool = False) -> List[Task]:
+    """Tasks due on a day in [lo, hi] (ordinals), by due date and then
+    store order; open ones only unless `done`."""
+    from .query import Query
+    text = f"due>={date.fromordinal(lo)} due<={date.fromordinal(hi)}"
+    found = store.iter_query(Query(text if done else "open " + text))
+    return sorted(found, key=Task.due_ordinal)
+
+
+class Reminders:
+    """The deadlines of an in-memory store's open tasks due from `since`
+    on.  Entries are not removed when a task changes: due() checks each
+    against its record and drops the stale ones.  The tasks announced are
+    remembered until they are completed, get another due date, or their
+    day is over (`since` then moves past it)."""
+
+    def __init__(self, store: MemoryBackend, at: Clock = (9, 0), since: Optional[int] = None):
+        self.store = store
+        self.at = at
+        self.since = date.today().toordinal() if since is None else since
+        self.heap: List[Tuple[float, int, int]] = []   # (deadline, due ordinal, position)
+        self.sent: Dict[str, int] = {}                 # id -> due ordinal announced
+        self._drained: Optional[float] = None   # the `now` of the last complete due()
+        self._loaded = False
+
+    def deadline(self, due: int) -> float:
+        d = date.fromordinal(due)
+        return datetime(d.year, d.month, d.day, *self.at).timestamp()
+
+    def _due(self, rec: dict) -> Optional[int]:
+        # the due ordinal of an open task
+        if rec.get("completed"):
+            return None
+        try:
+            return due_ordinal(rec.get("due"))
+        except ValueError:
+            return None
+
+    def _entry(self, pos: int) -> Optional[Tuple[float, int, int]]:
+        due = self._due(self.store.records[pos])
+        if due is None or due < self.since:
+            return None   # undated, or overdue before we started
+        return self.deadline(due), due, pos
+
+    def update(self) -> None:
+        """Catch up with the store's changes."""
+        if self._drained is not None:
+            # every deadline up to the last due() has been dealt with, so
+            # the days before it are done: nothing due then is pushed again
+            day = date.fromtimestamp(self._drained).toordinal()
+            if day > self.since:
+                self.since = day
+                self.sent = {i: d for i, d in self.sent.items() if d >= day}
+        changed = self.store.sync()
+        records = self.store.records
+        if changed is None or not self._loaded:
+            # (re)loaded: every record
+            entries = (self._entry(i) for i in range(len(records)))
+            self.heap = [e for e in entries if e is not None]
+            heapq.heapify(self.heap)
+            self._loaded = True
+            pos = self.store.pos
+            self.sent = {i: d for i, d in self.sent.items()
+                         if i in pos and self._due(records[pos[i]]) == d}
+            return
+        for pos in changed:
+            rec = records[pos]
+            if rec["id"] in self.sent and self._due(rec) != self.sent[rec["id"]]:
+                del self.sent[rec["id"]]   # completed or moved
+            e = self._entry(pos)
+            if e is not None:
+                heapq.heappush(self.heap, e)
+
+    def next_deadline(self) -> Optional[float]:
+        return self.heap[0][0] if self.heap else None
+
+    def due(self, now: float) -> Iterator[dict]:
+        """The records whose deadline has passed by `now`, each once."""
+        records = self.store.records
+        while self.heap and self.heap[0][0] <= now:
+            _, due, pos = heapq.heappop(self.heap)
+            e = self._entry(pos) if pos < len(records) else None
+            if e is None or e[1] != due:
+                continue   # completed or changed since it was pushed
+            rid = records[pos]["id"]
+            if self.sent.get(rid) == due:
+                continue
+            self.sent[rid] = due
+            yield records[pos]
+        self._drained = now
+
+
+def notify(rec: dict, out: IO[str], hook: Optional[str] = None) -> None:
+    """Announce a due task: a DUE line on `out`, or run the `hook` command
+    with the task as a JSON line on stdin and TASKS3_* variables."""
+    if hook is None:
+        out.write(f"DUE {rec['due']} {rec['id']} :: {rec['title']}\n")
+        out.flush()
+        return
+    import shlex
+    import subprocess
+    env = dict(os.environ, TASKS3_ID=rec["id"], TASKS3_TITLE=rec["title"],
+               TASKS3_DUE=rec["due"], TASKS3_PRIORITY=rec.get("priority") or "medium",
+               TASKS3_TAGS=",".join(rec.get("tags") or []))
+    try:
+        rc = subprocess.run(shlex.split(hook), input=json.dumps(rec, ensure_ascii=False) + "\n",
+                            env=env, text=True).returncode
+    except OSError as e:
+        print(f"tasks3: reminder hook failed: {e}", file=sys.stderr)
+        return
+    if rc:
+        print(f"tasks3: reminder hook exited with {rc} for {rec['id']}", file=sys.stderr)
+
+
+def remind(store: Backend, out: IO[str], at: Clock = (9, 0), hook: Optional[str] = None,
+           interval: float = 1.0, poll: bool = False) -> None:
+    """Announce open tasks as their deadlines pass, until interrupted."""
+    rem = Reminders(MemoryBackend(store), at)
+    watcher = Watcher(store.files(), interval, poll)
+    try:
+        while True:
+            rem.update()
+            for rec in rem.due(time.time()):
+                notify(rec, out, hook)
+            nxt = rem.next_deadline()
+            left = _MAX_SLEEP if nxt is None else min(max(nxt - time.time(), 0.0), _MAX_SLEEP)
+            watcher.wait(left)
+    finally:
+        watcher.close()
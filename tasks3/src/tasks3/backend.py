@@ -0,0 +1,154 @@
+from __future__ import annotations
+import os
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from .model import Task
+
+# data files with these extensions are SQLite databases, and directories
+# (named *.shards when they don't exist yet) are sharded stores; anything
+# else is the journaled JSON file store
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+SHARD_SUFFIX = ".shards"
+
+
+class Backend:
+    """Storage interface behind the tasks3.store functions."""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def __enter__(self) -> "Backend":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        pass
+
+    def init(self) -> None:
+        raise NotImplementedError
+
+    def iter_tasks(self) -> Iterator[Task]:
+        raise NotImplementedError
+
+    def load_all(self) -> List[Task]:
+        return list(self.iter_tasks())
+
+    def save_all(self, tasks: List[Task]) -> None:
+        raise NotImplementedError
+
+    def add(self, task: Task) -> None:
+        raise NotImplementedError
+
+    def complete(self, task_id: str) -> bool:
+        raise NotImplementedError
+
+    def get(self, task_id: str) -> Optional[Task]:
+        """The task with `task_id`, or None."""
+        return next((t for t in self.iter_tasks() if t.id == task_id), None)
+
+    def states(self) -> Dict[str, bool]:
+        """Map every task id to its completed flag."""
+        return {t.id: t.completed for t in self.iter_tasks()}
+
+    def apply(self, ops: List[dict]) -> None:
+        """Persist a batch of journal-style ops ({"op": "add", "task": {...}}
+        or {"op": "complete", "id": ...}) in as few writes as possible."""
+        for op in ops:
+            if op["op"] == "add":
+                self.add(Task.from_dicts((op["task"],))[0])
+            elif op["op"] == "complete":
+                self.complete(op["id"])
+
+    def extend(self, records: Iterable[dict], batch: int = 10000) -> None:
+        """Add a stream of tasks (as dicts, with ids the store does not have
+        yet) without holding them all; here as batches of apply() ops."""
+        ops: List[dict] = []
+        for rec in records:
+            ops.append({"op": "add", "task": rec})
+            if len(ops) >= batch:
+                self.apply(ops)
+                ops = []
+        if ops:
+            self.apply(ops)
+
+    def files(self) -> List[Path]:
+        """The files holding this store's data."""
+        return [self.path]
+
+    def stamp(self) -> Tuple:
+        """Changes whenever another writer changes the store's files."""
+        out = []
+        for f in self.files():
+            try:
+                st = os.stat(f)
+                out.append((st.st_ino, st.st_size, st.st_mtime_ns))
+            except FileNotFoundError:
+                out.append(None)
+        return tuple(out)
+
+    def mark(self) -> object:
+        """An opaque position in the store's history, for changes_since."""
+        return None
+
+    def changes_since(self, mark: object) -> Tuple[Optional[List[dict]], object]:
+        """The ops (as for apply) written since `mark`, and a mark for now.
+        The ops are None when the backend cannot tell: the store must be
+        read again.  Ops may repeat ones already seen; replaying them is
+        harmless."""
+        return None, self.mark()
+
+    def iter_search(self, query: str) -> Iterator[Task]:
+        raise NotImplementedError
+
+    def iter_filter(self, mode: str, value: Optional[str] = None) -> Iterator[Task]:
+        raise NotImplementedError
+
+    def iter_query(self, query) -> Iterator[Task]:
+        """Tasks matching a tasks3.query.Query, in store order."""
+        match = query.match
+        return Task.iter_dicts(r for r in (t.to_dict() for t in self.iter_tasks()) if match(r))
+
+    def ranked(self, query: str, limit: int = 20, fuzzy: int = 0) -> List[Tuple[float, Task]]:
+        """The `limit` best (BM25 score, task) matches for `query`, best
+        first; with fuzzy > 0, words within that many edits also match."""
+        from .index import RankIndex
+        records = [t.to_dict() for t in self.iter_tasks()]
+        hits = RankIndex.build(records).top(query, limit, fuzzy)
+        return list(zip((s for s, _ in hits), Task.iter_dicts(records[p] for _, p in hits)))
+
+    def compact(self) -> None:
+        pass
+
+    def convert(self, fmt: Optional[str]) -> None:
+        """Rewrite the store in another snapshot format (JSON stores only)."""
+        raise NotImplementedError(f"{type(self).__name__} has no snapshot formats")
+
+
+def filter_predicate(mode: str, value: Optional[str], today: int) -> Optional[Callable[[Task], bool]]:
+    """The filter_tasks modes as Task predicates; None means every task."""
+    if mode == "overdue":
+        return lambda t: t.is_overdue(today)
+    if mode == "today":
+        return lambda t: t.is_due_today(today)
+    if mode == "priority" and value:
+        return lambda t: t.priority == value
+    if mode == "tag" and value:
+        return lambda t: value in t.tags
+    if mode == "open":
+        return lambda t: not t.completed
+    if mode == "done":
+        return lambda t: t.completed
+    return None
+
+
+def open_backend(path: Path) -> Backend:
+    if path.suffix == SHARD_SUFFIX or path.is_dir():
+        from .shardstore import ShardedBackend
+        return ShardedBackend(path)
+    if path.suffix in SQLITE_SUFFIXES:
+        from .sqlstore import SqliteBackend
+        return SqliteBackend(path)
+    from .filestore import FileBackend
+    return FileBackend(path)
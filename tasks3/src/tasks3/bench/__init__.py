@@ -0,0 +1,8 @@
+# tasks3/src/tasks3/bench/__init__.py
+"""Benchmarks for the tasks3 store: `python -m tasks3.bench --help`."""
+
+from .generate import generate, write_store
+from .runner import compare, run_benchmarks
+from .startup import run_startup
+
+__all__ = ["generate", "write_store", "run_benchmarks", "compare", "run_startup"]
@@ -0,0 +1,68 @@
+from __future__ import annotations
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from .runner import compare, run_benchmarks
+from .startup import IMPORT_BUDGET, run_startup
+
+
+def main(argv: list[str] | None = None) -> int:
+    p = argparse.ArgumentParser(prog="python -m tasks3.bench",
+                                description="Time tasks3 store operations and CLI commands")
+    p.add_argument("--sizes", default="1000,10000,100000",
+                   help="comma-separated store sizes (default: 1000,10000,100000)")
+    p.add_argument("--backend", choices=["json", "db", "shards"], default="json")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--no-cli", action="store_true", help="skip the CLI subprocess timings")
+    p.add_argument("--startup", action="store_true",
+                   help="only time cold starts of short CLI commands, with -X importtime")
+    p.add_argument("-o", "--out", type=Path, help="write results as JSON")
+    p.add_argument("--baseline", type=Path, help="results JSON to compare against")
+    p.add_argument("--threshold", type=float, default=0.25,
+                   help="allowed slowdown vs. the baseline (default: 0.25 = 25%%)")
+    args = p.parse_args(argv)
+
+    if args.startup:
+        res = run_startup(args.repeat)
+        bare = res.pop("bare")["seconds"]
+        print(f"  {'python -c pass':20s} {bare * 1000:10.2f} ms")
+        over = False
+        for name, r in res.items():
+            print(f"  {name:20s} {r['seconds'] * 1000:10.2f} ms  imports {r['imports'] * 1000:.2f} ms"
+                  f"  slowest: {', '.join(r['slowest'])}")
+            if r["heavy"] or r["unexpected"]:
+                print(f"  {'':20s} imports {', '.join(r['heavy'] + r['unexpected'])}")
+            if r["imports"] > IMPORT_BUDGET:
+                print(f"OVER BUDGET {name}: imports take {r['imports'] * 1000:.2f} ms "
+                      f"(budget {IMPORT_BUDGET * 1000:.0f} ms)", file=sys.stderr)
+                over = True
+        if args.out:
+            args.out.write_text(json.dumps(dict(res, bare={"seconds": bare}), indent=2), encoding="utf-8")
+        return 1 if over else 0
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    results = run_benchmarks(sizes, args.backend, args.seed, args.repeat, not args.no_cli)
+    for size, ops in results["results"].items():
+        print(f"== {size} tasks ({args.backend})")
+        for op, r in ops.items():
+            peak = f"{r['peak_bytes'] / 2**20:8.1f} MiB" if r["peak_bytes"] else ""
+            print(f"  {op:20s} {r['seconds'] * 1000:10.2f} ms {peak}")
+    if args.out:
+        args.out.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare(results, baseline, args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['op']} @ {r['size']}: "
+                  f"{r['baseline'] * 1000:.2f} ms -> {r['current'] * 1000:.2f} ms "
+                  f"(x{r['ratio']:.2f})", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,72 @@
+from __future__ import annotations
+import json
+import random
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Iterator, Optional
+
+# Seeded synthetic stores with roughly realistic shapes: a few very common
+# tags and a long tail, mostly medium priority, most tasks due within a
+# couple of months of today, about a third of them done.
+VERBS = ["write", "review", "fix", "plan", "call", "email", "buy", "read",
+         "update", "prepare", "clean", "book", "submit", "check", "draft"]
+NOUNS = ["report", "slides", "budget", "groceries", "dentist", "invoice",
+         "lecture notes", "homework", "garage", "flight", "proposal", "bug",
+         "release", "newsletter", "taxes", "meeting agenda", "CSC299 project"]
+TAGS = ["work", "home", "school", "errand", "urgent", "health", "finance",
+        "travel", "family", "reading"] + [f"proj-{i}" for i in range(40)]
+TAG_WEIGHTS = [1.0 / (i + 1) for i in range(len(TAGS))]   # Zipf-like
+PRIORITY_WEIGHTS = {"low": 0.3, "medium": 0.5, "high": 0.2}
+
+
+def _task_id(i: int) -> str:
+    # a bijection on 32-bit ints, so ids are unique but look random
+    return f"{(i * 2654435761) % 2**32:08x}"
+
+
+def generate(n: int, seed: int = 0, today: Optional[date] = None) -> Iterator[dict]:
+    """Yield `n` task records (the dicts stored in tasks.json)."""
+    rng = random.Random(seed)
+    today = today or date.today()
+    prios, prio_w = list(PRIORITY_WEIGHTS), list(PRIORITY_WEIGHTS.values())
+    for i in range(n):
+        title = f"{rng.choice(VERBS).capitalize()} {rng.choice(NOUNS)} #{i}"
+        desc = ""
+        if rng.random() < 0.5:
+            desc = f"{rng.choice(VERBS)} the {rng.choice(NOUNS)} before {rng.choice(NOUNS)}"
+        due = None
+        if rng.random() < 0.7:
+            due = (today + timedelta(days=rng.randint(-60, 120))).isoformat()
+        k = rng.choices((0, 1, 2, 3), weights=(0.2, 0.45, 0.25, 0.1))[0]
+        tags = sorted(set(rng.choices(TAGS, weights=TAG_WEIGHTS, k=k)))
+        yield {
+            "id": _task_id(i),
+            "title": title,
+            "description": desc,
+            "due": due,
+            "priority": rng.choices(prios, weights=prio_w)[0],
+            "tags": tags,
+            "completed": rng.random() < 0.3,
+        }
+
+
+def write_store(path: Path, n: int, seed: int = 0) -> Path:
+    """Create a store with `n` generated tasks; the backend follows the
+    file extension like everywhere else in tasks3."""
+    from .. import journal
+    from ..backend import open_backend
+    from ..model import Task
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".json":
+        journal.clear(path)
+        # stream it out so million-task stores don't need to fit in memory
+        with path.open("w", encoding="utf-8") as f:
+            f.write("[")
+            for i, rec in enumerate(generate(n, seed)):
+                f.write(",\n" if i else "\n")
+                f.write(json.dumps(rec, ensure_ascii=False))
+            f.write("\n]")
+    else:
+        with open_backend(path) as b:
+            b.save_all(Task.from_dicts(generate(n, seed)))
+    return path
@@ -0,0 +1,191 @@
+from __future__ import annotations
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from .. import store
+from .generate import _task_id, write_store
+
+# op name -> fn(path, n, rng), run against a store of n generated tasks;
+# the store is regenerated before each mutating op
+READ_OPS: Dict[str, Callable] = {
+    "load_all": lambda p, n, rng: store.load_all(p),
+    "iter_tasks": lambda p, n, rng: sum(1 for _ in store.iter_tasks(p)),
+    "search_common": lambda p, n, rng: store.search(p, "report"),
+    "search_rare": lambda p, n, rng: store.search(p, "#12345"),
+    "search_short": lambda p, n, rng: store.search(p, "ax"),
+    "search_ranked": lambda p, n, rng: store.ranked_search(p, "budget report", 20),
+    "search_ranked_fuzzy": lambda p, n, rng: store.ranked_search(p, "budgte reprot", 20, fuzzy=2),
+    **{
+        f"filter_{mode}": (lambda m, v: lambda p, n, rng: store.filter_tasks(p, m, v))(mode, value)
+        for mode, value in [("overdue", None), ("today", None), ("priority", "high"),
+                            ("tag", "work"), ("open", None), ("done", None)]
+    },
+}
+# the same reads answered by the in-process store cache (after a warm-up)
+CACHED_OPS: Dict[str, Callable] = {
+    "cached_load_all": lambda p, n, rng: store.load_all(p),
+    "cached_load_all_view": lambda p, n, rng: store.load_all(p, view=True),
+    "cached_search_common": lambda p, n, rng: store.search(p, "report"),
+    "cached_filter_overdue": lambda p, n, rng: store.filter_tasks(p, "overdue"),
+}
+WRITE_OPS: Dict[str, Callable] = {
+    "add_task": lambda p, n, rng: store.add_task(p, "Benchmark task", tags=["bench"]),
+    "mark_complete": lambda p, n, rng: store.mark_complete(p, _task_id(rng.randrange(n))),
+    "compact": lambda p, n, rng: store.compact(p),
+}
+CLI_COMMANDS: Dict[str, List[str]] = {
+    "cli_list": ["list"],
+    "cli_search": ["search", "report"],
+    "cli_filter_overdue": ["filter", "overdue"],
+    "cli_add": ["add", "Benchmark task", "-t", "bench"],
+    "cli_complete": ["complete", _task_id(0)],
+}
+
+def _time(fn: Callable[[], object], repeat: int) -> List[float]:
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+def _peak(fn: Callable[[], object]) -> int:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# Runs the CLI and reports the child's peak RSS.  getrusage/wait4 would
+# include the benchmark process's own footprint inherited through fork, so
+# read VmHWM (Linux only) instead.
+_CLI_CHILD = """
+import sys
+from tasks3.cli import main
+try:
+    rc = main()
+finally:
+    try:
+        with open("/proc/self/status") as f:
+            hwm = next(l for l in f if l.startswith("VmHWM:")).split()[1]
+        sys.stderr.write(f"\\nVmHWM {hwm}\\n")
+    except (OSError, StopIteration):
+        pass
+sys.exit(rc)
+"""
+
+
+def _run_cli(path: Path, args: Sequence[str]) -> Dict[str, Optional[float]]:
+    env = dict(os.environ, TASKS3_NO_DAEMON="1")
+    src = str(Path(__file__).resolve().parents[2])
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src, env.get("PYTHONPATH")]))
+    cmd = [sys.executable, "-c", _CLI_CHILD, "--file", str(path), *args]
+    t0 = time.perf_counter()
+    proc = subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    seconds = time.perf_counter() - t0
+    peak = None
+    for line in proc.stderr.splitlines():
+        if line.startswith("VmHWM "):
+            peak = int(line.split()[1]) * 1024
+    return {"seconds": seconds, "peak_bytes": peak}
+
+
+def _result(times: List[float], peak: Optional[int]) -> dict:
+    return {"seconds": statistics.median(times), "min": min(times), "peak_bytes": peak}
+
+
+def bench_size(n: int, workdir: Path, backend: str = "json", seed: int = 0,
+               repeat: int = 3, cli: bool = True) -> Dict[str, dict]:
+    path = workdir / f"tasks-{n}.{backend}"
+    rng = random.Random(seed)
+
+    def fresh() -> None:
+        for f in workdir.glob(path.name + "*"):
+            if f.is_dir():
+                shutil.rmtree(f)
+            else:
+                f.unlink()
+        write_store(path, n, seed)
+
+    fresh()
+    results: Dict[str, dict] = {}
+    cache_size = store.CACHE_SIZE
+    store.set_cache_size(0)  # the plain ops measure the backends
+    try:
+        for name, op in READ_OPS.items():
+            op(path, n, rng)  # warm-up; also builds any missing index
+            times = _time(lambda: op(path, n, rng), repeat)
+            results[name] = _result(times, _peak(lambda: op(path, n, rng)))
+        for name, op in WRITE_OPS.items():
+            fresh()
+            times = _time(lambda: op(path, n, rng), repeat)
+            results[name] = _result(times, _peak(lambda: op(path, n, rng)))
+        fresh()
+        store.set_cache_size(max(cache_size, 1))
+        for name, op in CACHED_OPS.items():
+            op(path, n, rng)
+            times = _time(lambda: op(path, n, rng), repeat)
+            results[name] = _result(times, _peak(lambda: op(path, n, rng)))
+    finally:
+        store.clear_cache()
+        store.set_cache_size(cache_size)
+    if cli:
+        for name, args in CLI_COMMANDS.items():
+            fresh()
+            runs = [_run_cli(path, args) for _ in range(repeat)]
+            results[name] = _result([r["seconds"] for r in runs],
+                                    max((r["peak_bytes"] or 0) for r in runs) or None)
+    return results
+
+
+def run_benchmarks(sizes: Sequence[int], backend: str = "json", seed: int = 0,
+                   repeat: int = 3, cli: bool = True,
+                   workdir: Optional[Path] = None) -> dict:
+    with tempfile.TemporaryDirectory(prefix="tasks3-bench-") as tmp:
+        wd = workdir or Path(tmp)
+        return {
+            "meta": {
+                "created": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "backend": backend,
+                "seed": seed,
+                "repeat": repeat,
+            },
+            "results": {
+                str(n): bench_size(n, wd, backend, seed, repeat, cli) for n in sizes
+            },
+        }
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.25) -> List[dict]:
+    """Operations whose median time grew by more than `threshold` (0.25 =
+    25%) over the baseline run, for the sizes both runs measured."""
+    regressions = []
+    for size, ops in current["results"].items():
+        base_ops = baseline.get("results", {}).get(size, {})
+        for op, res in ops.items():
+            base = base_ops.get(op)
+            if not base or not base["seconds"]:
+                continue
+            ratio = res["seconds"] / base["seconds"]
+            if ratio > 1 + threshold:
+                regressions.append({
+                    "size": int(size), "op": op, "baseline": base["seconds"],
+                    "current": res["seconds"], "ratio": ratio,
+                })
+    return regressions
@@ -0,0 +1,108 @@
+from __future__ import annotations
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .generate import _task_id, write_store
+
+# Cold-start timings of short CLI commands: wall time against a bare
+# interpreter, and the `python -X importtime` breakdown of what they import.
+STARTUP_COMMANDS: Dict[str, List[str]] = {
+    "complete": ["complete", _task_id(0)],
+    "add": ["add", "Startup task", "-t", "bench"],
+    "list": ["list"],
+}
+# Modules the quick commands above must not pull in: argparse and the rest
+# only load for the commands that use them.
+HEAVY_MODULES = (
+    "argparse", "asyncio", "concurrent.futures", "csv", "dataclasses", "hashlib",
+    "socket", "sqlite3", "tempfile", "uuid",
+    "tasks3.paging", "tasks3.query", "tasks3.shardstore", "tasks3.sqlstore",
+)
+# The tasks3 modules they may import at all.
+QUICK_MODULES = frozenset({
+    "tasks3", "tasks3.backend", "tasks3.cli", "tasks3.filestore", "tasks3.fsutil",
+    "tasks3.idtable", "tasks3.index", "tasks3.instrument", "tasks3.journal",
+    "tasks3.memstore", "tasks3.model", "tasks3.output", "tasks3.snapshot", "tasks3.store",
+})
+# Budget for everything a quick command imports (the cumulative times of
+# `-X importtime`'s top-level entries, the interpreter's own included).
+# Wall-clock, so checked by `python -m tasks3.bench --startup`, not the tests.
+IMPORT_BUDGET = 0.080   # seconds
+
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ, TASKS3_NO_DAEMON="1")
+    env.pop("PYTHONDONTWRITEBYTECODE", None)   # time what an install runs: bytecode
+    src = str(Path(__file__).resolve().parents[2])
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src, env.get("PYTHONPATH")]))
+    return env
+
+
+def _command(path: Optional[Path], args: Sequence[str]) -> List[str]:
+    if path is None:
+        return [sys.executable, "-c", "pass"]
+    return [sys.executable, "-c", "from tasks3.cli import main; raise SystemExit(main())",
+            "--file", str(path), *args]
+
+
+def wall_time(path: Optional[Path], args: Sequence[str] = (), repeat: int = 5) -> float:
+    """Best-of-`repeat` seconds for one CLI run (a bare `python -c pass`
+    when `path` is None)."""
+    cmd, env = _command(path, args), _env()
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def import_times(path: Path, args: Sequence[str]) -> Dict[str, Tuple[int, int, int]]:
+    """What one CLI run imports: module -> (self, cumulative microseconds,
+    nesting depth), from `python -X importtime`."""
+    cmd = _command(path, args)
+    proc = subprocess.run([cmd[0], "-X", "importtime", *cmd[1:]], env=_env(),
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    out: Dict[str, Tuple[int, int, int]] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        own, cum, name = line[len("import time:"):].split("|")
+        if own.strip().isdigit():   # not the header
+            depth = (len(name) - len(name.lstrip())) // 2
+            out[name.strip()] = (int(own), int(cum), depth)
+    return out
+
+
+def unexpected_modules(times: Dict[str, Tuple[int, int, int]]) -> List[str]:
+    """The tasks3 modules in import_times() that QUICK_MODULES does not allow."""
+    return sorted(m for m in times if m.split(".")[0] == "tasks3" and m not in QUICK_MODULES)
+
+
+def import_total(times: Dict[str, Tuple[int, int, int]]) -> float:
+    """Seconds spent importing, from import_times()."""
+    return sum(cum for _, cum, depth in times.values() if depth == 0) / 1e6
+
+
+def run_startup(repeat: int = 5, workdir: Optional[Path] = None) -> dict:
+    """Wall and import times of STARTUP_COMMANDS against a small store."""
+    with tempfile.TemporaryDirectory(prefix="tasks3-startup-") as tmp:
+        path = write_store(Path(workdir or tmp) / "tasks-startup.json", 100)
+        import_times(path, ["list"])   # writes the bytecode caches
+        bare = wall_time(None, repeat=repeat)
+        results = {"bare": {"seconds": bare}}
+        for name, args in STARTUP_COMMANDS.items():
+            times = min((import_times(path, args) for _ in range(repeat)), key=import_total)
+            results[name] = {
+                "seconds": wall_time(path, args, repeat),
+                "imports": import_total(times),
+                "heavy": [m for m in HEAVY_MODULES if m in times],
+                "unexpected": unexpected_modules(times),
+                "slowest": sorted(times, key=lambda m: times[m][0], reverse=True)[:5],
+            }
+        return results
@@ -1,68 +1,472 @@
 from __future__ import annotations
-import argparse
+import os
+import sys
+import time
 from pathlib import Path
-from .store import (
-    init_store, add_task, load_all, search,
-    filter_tasks, mark_complete
-)
-from .model import PRIORITIES
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Iterable, List, Optional
+from . import instrument
+from .backend import Backend, open_backend
+from .model import PRIORITIES, Task
+
+if TYPE_CHECKING:
+    import argparse
+
+# Most invocations are one short command, so startup time counts: modules
+# only some commands need are imported where they are used, and the common
+# simple command lines skip argparse (see _quick_args).
 
 # default data file: <repo-root>/data/tasks.json
 DEFAULT_DATA_FILE = Path(__file__).resolve().parents[3] / "data" / "tasks.json"
 
-def main(argv: list[str] | None = None) -> int:
+def _print_tasks(tasks: Iterable[Task], fmt: str = "text", fields=None) -> None:
+    # tasks are written in batches as they stream out of the store
+    from .output import write_tasks
+    n = write_tasks(tasks, sys.stdout, fmt, fields)
+    instrument.count("tasks.output", n)
+
+def _print_listing(args: argparse.Namespace, tasks: Iterable[Task]) -> int:
+    # --sort/--limit/--offset/--cursor, when given
+    from itertools import islice
+    from .output import parse_fields
+    try:
+        fields = parse_fields(args.fields) if args.fields else None
+    except ValueError as e:
+        print(f"tasks3: {e}", file=sys.stderr)
+        return 2
+    if args.sort is None and args.limit is None and args.cursor is None:
+        _print_tasks(islice(tasks, args.offset, None), args.format, fields)
+        return 0
+    from .paging import CursorError, page
+    try:
+        got, cursor = page(tasks, args.sort, args.limit, args.offset, args.cursor)
+    except CursorError as e:
+        print(f"tasks3: {e}", file=sys.stderr)
+        return 2
+    _print_tasks(got, args.format, fields)
+    if cursor:
+        print(f"next cursor: {cursor}", file=sys.stderr)
+    return 0
+
+def _count(s: str) -> int:
+    n = int(s)
+    if n < 0:
+        import argparse
+        raise argparse.ArgumentTypeError("must be >= 0")
+    return n
+
+def _clock(s: str) -> tuple:
+    # HH:MM -> (hour, minute)
+    h, _, m = s.partition(":")
+    if h.isdigit() and m.isdigit() and int(h) < 24 and int(m) < 60:
+        return int(h), int(m)
+    import argparse
+    raise argparse.ArgumentTypeError("expected HH:MM")
+
+def build_parser() -> argparse.ArgumentParser:
+    import argparse
+    from . import snapshot
+    from .output import FIELDS, FORMATS
+    from .paging import SORT_KEYS
     p = argparse.ArgumentParser(prog="tasks3", description="CSC299 tasks3 CLI")
-    p.add_argument("-f", "--file", type=Path, default=DEFAULT_DATA_FILE, help="JSON file (default: data/tasks.json)")
+    p.add_argument("-f", "--file", type=Path, default=DEFAULT_DATA_FILE, help="data file: .json, .db/.sqlite for SQLite, or a .shards directory (default: data/tasks.json)")
+    p.add_argument("--profile", action="store_true", help="print a timing breakdown to stderr")
+    p.add_argument("--profile-out", type=Path, metavar="FILE",
+                   help="write the breakdown as JSON (*.json) or cProfile stats (other names)")
 
     sub = p.add_subparsers(dest="cmd", required=True)
 
+    listing = argparse.ArgumentParser(add_help=False)
+    listing.add_argument("--sort", choices=sorted(SORT_KEYS), help="order by (default: store order)")
+    listing.add_argument("--limit", type=_count, metavar="N", help="print at most N tasks")
+    start = listing.add_mutually_exclusive_group()   # a cursor already says where to start
+    start.add_argument("--offset", type=_count, default=0, metavar="N", help="skip the first N tasks")
+    start.add_argument("--cursor", help="continue after the page that printed this cursor (on stderr)")
+    listing.add_argument("--format", choices=FORMATS, default="text",
+                         help="output format (default: text); tsv and csv start with a header")
+    listing.add_argument("--fields", metavar="F,F,...",
+                         help=f"fields for jsonl/tsv/csv (default: all of {','.join(FIELDS)})")
+
     sp_add = sub.add_parser("add", help="Add a new task")
-    sp_add.add_argument("title")
+    sp_add.add_argument("title", help='task title, or "-" to read tasks as JSON lines from stdin')
     sp_add.add_argument("-d", "--description", default="")
     sp_add.add_argument("--due", help="YYYY-MM-DD", default=None)
     sp_add.add_argument("--priority", choices=PRIORITIES, default="medium")
     sp_add.add_argument("-t", "--tag", action="append", default=[])
 
-    sub.add_parser("list", help="List all tasks")
+    sub.add_parser("list", help="List all tasks", parents=[listing])
 
-    sp_f = sub.add_parser("filter", help="Filter tasks")
-    sp_f.add_argument("mode", choices=["overdue", "today", "priority", "tag", "open", "done"])
-    sp_f.add_argument("--value")
+    sp_f = sub.add_parser("filter", help="Filter tasks", parents=[listing])
+    _view_args(sp_f, "filter")
 
-    sp_s = sub.add_parser("search", help="Search tasks by text")
-    sp_s.add_argument("query")
+    sp_s = sub.add_parser("search", help="Search tasks by text", parents=[listing])
+    _view_args(sp_s, "search")
+    sp_s.add_argument("--rank", action="store_true",
+                      help="most relevant first (BM25), top 20 unless --limit is given")
+    sp_s.add_argument("--fuzzy", type=_count, default=0, metavar="N",
+                      help="with --rank, also match words within N edits")
 
-    sp_c = sub.add_parser("complete", help="Mark a task complete by id")
-    sp_c.add_argument("task_id")
+    sp_q = sub.add_parser("query", parents=[listing],
+                          help="List tasks matching a query, e.g. 'open tag:work \"report\"'")
+    _view_args(sp_q, "query")
 
-    args = p.parse_args(argv)
-    datafile: Path = args.file
-    init_store(datafile)
+    sp_a = sub.add_parser("agenda", help="List the open tasks due in a range of days, soonest first")
+    sp_a.add_argument("--from", dest="start", default="today", metavar="DAY",
+                      help="first day: YYYY-MM-DD, today, tomorrow or +N/-N days (default: today)")
+    sp_a.add_argument("--to", dest="end", default="+7", metavar="DAY",
+                      help="last day, included (default: +7)")
+    sp_a.add_argument("--all", action="store_true", help="include completed tasks")
+    sp_a.add_argument("--format", choices=FORMATS, default="text")
+    sp_a.add_argument("--fields", metavar="F,F,...")
+
+    sp_r = sub.add_parser("remind", help="Announce open tasks as they fall due, until interrupted")
+    sp_r.add_argument("--at", type=_clock, default=(9, 0), metavar="HH:MM",
+                      help="time of day a task falls due on its due date (default: 09:00)")
+    sp_r.add_argument("--exec", dest="hook", metavar="CMD",
+                      help="run CMD per due task (the task as JSON on stdin, TASKS3_ID, "
+                      "TASKS3_TITLE, TASKS3_DUE, ... set) instead of printing it")
+    sp_r.add_argument("--interval", type=float, default=1.0, metavar="SECONDS",
+                      help="how often to check the files when polling (default: 1)")
+    sp_r.add_argument("--poll", action="store_true", help="poll even where inotify is available")
+
+    sp_sh = sub.add_parser("show", help="Print tasks by id")
+    sp_sh.add_argument("task_ids", nargs="+", metavar="task_id")
+    sp_sh.add_argument("--format", choices=FORMATS, default="text")
+    sp_sh.add_argument("--fields", metavar="F,F,...")
+
+    sp_c = sub.add_parser("complete", help="Mark tasks complete by id")
+    sp_c.add_argument("task_ids", nargs="*", metavar="task_id",
+                      help='ids to complete; none or "-" reads them from stdin')
+
+    sp_cv = sub.add_parser("convert", help="Rewrite the data file in another snapshot format")
+    sp_cv.add_argument("format", choices=snapshot.FORMATS,
+                       help="json (pretty-printed), or columnar, optionally zlib/lzma compressed")
+
+    sp_m = sub.add_parser("migrate", help="Add the tasks of tasks1/tasks2 data files to the store")
+    sp_m.add_argument("sources", nargs="*", type=Path, metavar="FILE",
+                      help="tasks1 or tasks2 JSON files (default: data/tasks.json while it is "
+                      "a tasks1 file, and data/tasks2.json)")
+
+    sub.add_parser("serve", help="Keep the store in memory and serve other tasks3 calls")
+
+    sp_w = sub.add_parser("watch", help="Print a list, filter, search or query, then what changes in it")
+    sp_w.add_argument("--interval", type=float, default=1.0, metavar="SECONDS",
+                      help="how often to check the files when polling (default: 1)")
+    sp_w.add_argument("--poll", action="store_true", help="poll even where inotify is available")
+    views = sp_w.add_subparsers(dest="view", required=True)
+    views.add_parser("list")
+    for cmd in ("filter", "search", "query"):
+        _view_args(views.add_parser(cmd), cmd)
+    return p
+
+def _view_args(p: argparse.ArgumentParser, cmd: str) -> None:
+    # what a filter, search or query selects; shared with watch
+    if cmd == "filter":
+        p.add_argument("mode", choices=["overdue", "today", "priority", "tag", "open", "done"])
+        p.add_argument("--value")
+    elif cmd == "search":
+        p.add_argument("query")
+    else:
+        p.add_argument("expr", nargs="+", help="terms: open done overdue today tag:X prio:X "
+                       "due:DATE due<DATE id:X text; NOT or -term negates, OR separates alternatives")
+
+def reads_stdin(args: argparse.Namespace) -> bool:
+    if args.cmd == "add":
+        return args.title == "-"
+    if args.cmd == "complete":
+        return args.task_ids in ([], ["-"])
+    return False
+
+def _check_task_json(d) -> None:
+    # the fields of one add-from-stdin object; ValueError if any is bad
+    from .model import parse_due
+    if not isinstance(d, dict) or not isinstance(d.get("title"), str):
+        raise ValueError("expected an object with a string title")
+    for key in ("description", "due"):
+        if d.get(key) is not None and not isinstance(d[key], str):
+            raise ValueError(f"{key} must be a string")
+    if d.get("due"):
+        try:
+            parse_due(d["due"])
+        except ValueError:
+            raise ValueError(f"bad due date {d['due']!r} (expected YYYY-MM-DD)") from None
+    if "priority" in d and d["priority"] not in PRIORITIES:
+        raise ValueError(f"priority must be one of {', '.join(PRIORITIES)}")
+    tags = d.get("tags")
+    if tags is not None and not (isinstance(tags, list) and all(isinstance(t, str) for t in tags)):
+        raise ValueError("tags must be a list of strings")
+
+def _jsonl_tasks(text: str) -> list[Task]:
+    import json
+    from .store import new_task
+    tasks = []
+    for n, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            d = json.loads(line)
+            _check_task_json(d)
+        except ValueError as e:
+            raise ValueError(f"stdin line {n}: {e}") from None
+        tasks.append(new_task(
+            d["title"], d.get("description") or "", d.get("due") or None,
+            d.get("priority", "medium"), d.get("tags") or [],
+        ))
+    return tasks
+
+def run(args: argparse.Namespace, store: Backend) -> int:
+    """Execute one parsed command against an open store.
 
+    Commands reading stdin (see reads_stdin) take it from args.stdin.
+    """
     if args.cmd == "add":
-        t = add_task(datafile, args.title, args.description, args.due, args.priority, args.tag)
-        print(f"ADDED {t.id} :: {t.title} :: {t.tags}")
+        from .store import Transaction, new_task
+        if args.title != "-":
+            t = new_task(args.title, args.description, args.due, args.priority, args.tag)
+            store.add(t)
+            print(f"ADDED {t.id} :: {t.title} :: {t.tags}")
+            return 0
+        try:
+            tasks = _jsonl_tasks(args.stdin)
+        except ValueError as e:
+            print(f"tasks3: {e}", file=sys.stderr)
+            return 2
+        tx = Transaction(store)
+        for t in tasks:
+            tx.add(t)
+        tx.commit()
+        for t in tasks:
+            print(f"ADDED {t.id} :: {t.title} :: {t.tags}")
         return 0
 
     if args.cmd == "list":
-        for t in load_all(datafile):
-            print(f"{t.id} :: {t.title} :: {t.tags} :: prio={t.priority} :: due={t.due} :: done={t.completed}")
-        return 0
+        return _print_listing(args, store.iter_tasks())
 
     if args.cmd == "filter":
-        for t in filter_tasks(datafile, args.mode, args.value):
-            print(f"{t.id} :: {t.title} :: {t.tags} :: prio={t.priority} :: due={t.due} :: done={t.completed}")
-        return 0
+        return _print_listing(args, store.iter_filter(args.mode, args.value))
 
     if args.cmd == "search":
-        for t in search(datafile, args.query):
-            print(f"{t.id} :: {t.title} :: {t.tags} :: prio={t.priority} :: due={t.due} :: done={t.completed}")
+        if not args.rank:
+            return _print_listing(args, store.iter_search(args.query))
+        if args.sort or args.cursor:
+            print("tasks3: --rank cannot be combined with --sort or --cursor", file=sys.stderr)
+            return 2
+        limit = 20 if args.limit is None else args.limit
+        hits = store.ranked(args.query, args.offset + limit, args.fuzzy)[args.offset:]
+        args.offset, args.limit = 0, None
+        return _print_listing(args, (t for _, t in hits))
+
+    if args.cmd == "query":
+        from .query import Query, QueryError
+        try:
+            q = Query(" ".join(args.expr))
+        except QueryError as e:
+            print(f"tasks3: bad query: {e}", file=sys.stderr)
+            return 2
+        return _print_listing(args, store.iter_query(q))
+
+    if args.cmd == "agenda":
+        from datetime import date
+        from .agenda import agenda, parse_day
+        from .output import parse_fields
+        today = date.today().toordinal()
+        try:
+            fields = parse_fields(args.fields) if args.fields else None
+            lo, hi = parse_day(args.start, today), parse_day(args.end, today)
+        except ValueError as e:
+            print(f"tasks3: {e}", file=sys.stderr)
+            return 2
+        _print_tasks(agenda(store, lo, hi, args.all), args.format, fields)
+        return 0
+
+    if args.cmd == "remind":
+        from .agenda import remind
+        try:
+            remind(store, sys.stdout, args.at, args.hook, args.interval, args.poll)
+        except KeyboardInterrupt:
+            pass
         return 0
 
+    if args.cmd == "show":
+        from .output import parse_fields
+        try:
+            fields = parse_fields(args.fields) if args.fields else None
+        except ValueError as e:
+            print(f"tasks3: {e}", file=sys.stderr)
+            return 2
+        found = [store.get(tid) for tid in args.task_ids]
+        _print_tasks([t for t in found if t is not None], args.format, fields)
+        for tid, t in zip(args.task_ids, found):
+            if t is None:
+                print(f"NOT FOUND {tid}", file=sys.stderr)
+        return 0 if all(found) else 1
+
     if args.cmd == "complete":
-        ok = mark_complete(datafile, args.task_id)
-        print("OK" if ok else "NOT FOUND")
-        return 0 if ok else 1
+        ids = args.stdin.split() if reads_stdin(args) else args.task_ids
+        if len(ids) == 1:
+            ok = store.complete(ids[0])
+            print("OK" if ok else "NOT FOUND")
+            return 0 if ok else 1
+        from .store import Transaction
+        tx = Transaction(store)
+        found = [tx.complete(tid) for tid in ids]
+        tx.commit()
+        for tid, ok in zip(ids, found):
+            print(f"{'OK' if ok else 'NOT FOUND'} {tid}")
+        return 0 if all(found) else 1
+
+    if args.cmd == "convert":
+        try:
+            store.convert(args.format)
+        except NotImplementedError as e:
+            print(f"tasks3: {e}", file=sys.stderr)
+            return 2
+        print(f"CONVERTED {args.file} to {args.format}")
+        return 0
+
+    if args.cmd == "migrate":
+        from .migrate import default_sources, migrate
+        sources = args.sources or default_sources(DEFAULT_DATA_FILE.parent)
+        if not sources:
+            print("tasks3: no tasks1/tasks2 data files to migrate", file=sys.stderr)
+            return 1
+        try:
+            stats = migrate(store, sources)
+        except (OSError, ValueError) as e:
+            print(f"tasks3: {e}", file=sys.stderr)
+            return 2
+        for src, st in stats.items():
+            print(f"MIGRATED {src} ({st['format']}): {st['added']} added, "
+                  f"{st['duplicates']} duplicates, {st['skipped']} skipped")
+            if st["kept"]:
+                print(f"KEPT the {st['format']} file as {st['kept']}")
+        return 0
+
+    if args.cmd == "watch":
+        from .query import QueryError
+        from .watch import view_matcher, watch
+        try:
+            matcher = view_matcher(args)
+        except QueryError as e:
+            print(f"tasks3: bad query: {e}", file=sys.stderr)
+            return 2
+        try:
+            watch(store, matcher, sys.stdout, args.interval, args.poll)
+        except KeyboardInterrupt:
+            pass
+        return 0
 
-    p.error("unknown command")
+    print(f"tasks3: unknown command {args.cmd!r}", file=sys.stderr)
     return 2
+
+def _profiled(args: argparse.Namespace, parse_seconds: float) -> int:
+    # run locally (not through a daemon) so the breakdown covers the real work
+    prof = None
+    if args.profile_out and args.profile_out.suffix != ".json":
+        import cProfile
+        prof = cProfile.Profile()
+    instrument.enable()
+    instrument.record("cli.parse", parse_seconds)
+    try:
+        if prof:
+            prof.enable()
+        with instrument.span("cli.command"), open_backend(args.file) as store:
+            store.init()
+            return run(args, store)
+    finally:
+        if prof:
+            prof.disable()
+            prof.dump_stats(args.profile_out)
+        elif args.profile_out:
+            instrument.dump_json(args.profile_out)
+        if args.profile:
+            print(instrument.format_report(), file=sys.stderr)
+        instrument.disable()
+
+# Command lines _quick_args parses by hand: the options each command takes
+# there, all "--opt value" with -t/--tag repeatable.  Anything else, help
+# and every error included, goes to argparse.
+_QUICK_OPTS = {
+    "add": {"-d": "description", "--description": "description", "--due": "due",
+            "--priority": "priority", "-t": "tag", "--tag": "tag"},
+    "complete": {},
+    "list": {},
+}
+_LISTING_DEFAULTS = {"sort": None, "limit": None, "offset": 0, "cursor": None,
+                     "format": "text", "fields": None}
+
+def _quick_args(argv: List[str]) -> Optional[SimpleNamespace]:
+    file = DEFAULT_DATA_FILE
+    if argv[:1] in (["-f"], ["--file"]) and len(argv) > 1 and not argv[1].startswith("-"):
+        file, argv = Path(argv[1]), argv[2:]
+    if not argv or argv[0] not in _QUICK_OPTS:
+        return None
+    cmd, rest = argv[0], argv[1:]
+    opts = _QUICK_OPTS[cmd]
+    args = SimpleNamespace(file=file, profile=False, profile_out=None, cmd=cmd)
+    positional = []
+    i = 0
+    while i < len(rest):
+        a = rest[i]
+        if a in opts and i + 1 < len(rest) and not rest[i + 1].startswith("-"):
+            name = opts[a]
+            if name == "tag":
+                args.tag = getattr(args, "tag", []) + [rest[i + 1]]
+            elif hasattr(args, name):
+                return None   # repeated: let argparse apply its rules
+            else:
+                setattr(args, name, rest[i + 1])
+            i += 2
+        elif a.startswith("-") and a != "-":
+            return None
+        else:
+            positional.append(a)
+            i += 1
+    if cmd == "add":
+        if len(positional) != 1 or getattr(args, "priority", "medium") not in PRIORITIES:
+            return None
+        args.title = positional[0]
+        for name, default in (("description", ""), ("due", None), ("priority", "medium"), ("tag", [])):
+            if not hasattr(args, name):
+                setattr(args, name, default)
+    elif cmd == "complete":
+        args.task_ids = positional
+    elif positional:
+        return None
+    else:
+        vars(args).update(_LISTING_DEFAULTS)
+    return args
+
+def parse_args(argv: Optional[List[str]] = None):
+    """Parse a tasks3 command line (sys.argv[1:] by default)."""
+    args = _quick_args(sys.argv[1:] if argv is None else list(argv))
+    return args if args is not None else build_parser().parse_args(argv)
+
+def main(argv: list[str] | None = None) -> int:
+    t0 = time.perf_counter()
+    args = parse_args(argv)
+    datafile: Path = args.file
+    args.stdin = sys.stdin.read() if reads_stdin(args) else None
+
+    if args.profile or args.profile_out:
+        return _profiled(args, time.perf_counter() - t0)
+
+    if args.cmd == "serve":
+        from .daemon import serve
+        return serve(datafile)
+
+    # hand the command to a running `tasks3 serve` for this file, if any
+    # (watch, remind and migrate run here: the first two stream until
+    # interrupted, the last reads files named relative to this process)
+    if args.cmd not in ("watch", "remind", "migrate") and not os.environ.get("TASKS3_NO_DAEMON"):
+        from .daemon import forward
+        reply = forward(datafile, sys.argv[1:] if argv is None else list(argv), args.stdin)
+        if reply is not None:
+            rc, out, err = reply
+            sys.stdout.write(out)
+            sys.stderr.write(err)
+            return rc
+
+    with open_backend(datafile) as store:
+        store.init()
+        return run(args, store)
@@ -0,0 +1,218 @@
+from __future__ import annotations
+import json
+import os
+import stat
+import sys
+import zlib
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import socket
+
+# `tasks3 serve` keeps the store and its indexes in memory and answers CLI
+# invocations over a Unix socket; writes are flushed to disk in batches.
+# Every CLI invocation looks for the socket first, so the client side
+# imports nothing heavy until a daemon is actually there.
+#
+# The sockets live in a directory only their user can enter (mode 0700).
+# The client talks only to a socket in such a directory that it owns, and
+# where the OS tells (SO_PEERCRED), to a daemon running as the same user;
+# the daemon answers only clients running as its user.
+FLUSH_DELAY = 0.05   # seconds to coalesce writes before flushing
+
+
+def socket_path(datafile: Path) -> Path:
+    name = str(datafile.resolve()).encode("utf-8")
+    key = f"{zlib.crc32(name):08x}{zlib.adler32(name):08x}"
+    return Path(_runtime_dir()) / f"tasks3-{os.getuid()}" / f"{key}.sock"
+
+
+def _runtime_dir() -> str:
+    # where tempfile.gettempdir() usually points, without importing it
+    for var in ("XDG_RUNTIME_DIR", "TMPDIR", "TEMP", "TMP"):
+        if os.environ.get(var):
+            return os.environ[var]
+    if os.name == "posix":
+        return "/tmp"
+    import tempfile
+    return tempfile.gettempdir()
+
+
+def _private(path: Path, is_dir: bool) -> bool:
+    # `path` is ours, not a symlink, and a directory only we can use (or,
+    # not is_dir, a socket)
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return False
+    if st.st_uid != os.getuid():
+        return False
+    if is_dir:
+        return stat.S_ISDIR(st.st_mode) and not st.st_mode & 0o077
+    return stat.S_ISSOCK(st.st_mode)
+
+
+def _make_private_dir(path: Path) -> None:
+    # the socket directory: created 0700, or checked if it exists
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    if not _private(path, is_dir=True):
+        raise PermissionError(f"{path} must be a directory only this user can access (mode 0700)")
+
+
+def _peer_uid(sock: socket.socket) -> Optional[int]:
+    # the user at the other end of a Unix socket, where the OS tells
+    import socket
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+    import struct
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+    return struct.unpack("3i", creds)[1]   # pid, uid, gid
+
+
+def forward(datafile: Path, argv: List[str], stdin: Optional[str] = None) -> Optional[Tuple[int, str, str]]:
+    """Run a command in the daemon serving `datafile`, passing along the
+    client's standard input if the command reads it.
+
+    Returns (exit code, stdout, stderr), or None when no daemon is running.
+    """
+    s = _connect(socket_path(datafile))
+    if s is None:
+        return None
+    import socket
+    with s:
+        s.sendall(json.dumps({"argv": argv, "stdin": stdin}).encode("utf-8") + b"\n")
+        s.shutdown(socket.SHUT_WR)
+        chunks = []
+        while chunk := s.recv(1 << 16):
+            chunks.append(chunk)
+    reply = json.loads(b"".join(chunks))
+    return reply["rc"], reply["out"], reply["err"]
+
+
+def _connect(path: Path) -> Optional[socket.socket]:
+    if not (_private(path.parent, is_dir=True) and _private(path, is_dir=False)):
+        return None   # no daemon, or a socket someone else could have put there
+    import socket
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(str(path))
+    except OSError:
+        s.close()
+        return None  # stale socket left by a daemon that died
+    if _peer_uid(s) not in (None, os.getuid()):
+        s.close()
+        return None
+    return s
+
+
+class Daemon:
+    def __init__(self, datafile: Path):
+        from .backend import open_backend
+        from .memstore import MemoryBackend
+        self.datafile = datafile
+        self.sock = socket_path(datafile)
+        self.store = MemoryBackend(open_backend(datafile))
+        self._flush_pending = False
+        self._loop = None
+        self._stop = None
+
+    def execute(self, argv: List[str], stdin: Optional[str] = None) -> Tuple[int, str, str]:
+        import io
+        from contextlib import redirect_stderr, redirect_stdout
+        from .cli import parse_args, run
+        out, err = io.StringIO(), io.StringIO()
+        with redirect_stdout(out), redirect_stderr(err):
+            try:
+                args = parse_args(argv)
+                args.stdin = stdin or ""
+                if args.cmd == "serve":
+                    print("tasks3: a daemon is already serving this file", file=sys.stderr)
+                    rc = 1
+                else:
+                    self.store.refresh()
+                    rc = run(args, self.store)
+            except SystemExit as e:
+                rc = e.code if isinstance(e.code, int) else 2
+        if self.store.pending and not self._flush_pending:
+            self._flush_pending = True
+            self._loop.call_later(FLUSH_DELAY, self._flush)
+        return rc, out.getvalue(), err.getvalue()
+
+    def _flush(self) -> None:
+        self._flush_pending = False
+        self.store.flush()
+
+    async def _handle(self, reader, writer) -> None:
+        sock = writer.get_extra_info("socket")
+        if sock is not None and _peer_uid(sock) not in (None, os.getuid()):
+            writer.close()
+            return
+        try:
+            try:
+                line = await reader.readline()
+            except ConnectionError:
+                return
+            if not line:
+                return   # connected and left (a liveness probe)
+            try:
+                req = json.loads(line)
+                rc, out, err = self.execute(req["argv"], req.get("stdin"))
+            except Exception as e:  # keep serving whatever one client sent
+                rc, out, err = 1, "", f"tasks3 daemon: {e}\n"
+            try:
+                writer.write(json.dumps({"rc": rc, "out": out, "err": err}).encode("utf-8"))
+                await writer.drain()
+            except ConnectionError:
+                pass   # the client is gone
+        finally:
+            writer.close()
+
+    async def _serve(self) -> None:
+        import asyncio
+        import signal
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self._loop.add_signal_handler(sig, self._stop.set)
+            except (NotImplementedError, RuntimeError, ValueError):
+                pass  # not the main thread
+        server = await asyncio.start_unix_server(self._handle, path=str(self.sock))
+        async with server:
+            await self._stop.wait()
+
+    def run(self) -> int:
+        import asyncio
+        live = _connect(self.sock)
+        if live is not None:
+            live.close()
+            print(f"tasks3: a daemon is already serving {self.datafile}", file=sys.stderr)
+            return 1
+        try:
+            _make_private_dir(self.sock.parent)
+        except OSError as e:
+            print(f"tasks3: cannot serve: {e}", file=sys.stderr)
+            return 1
+        self.sock.unlink(missing_ok=True)
+        try:
+            asyncio.run(self._serve())
+        finally:
+            self.sock.unlink(missing_ok=True)
+            self.store.close()
+        return 0
+
+    def stop(self) -> None:
+        """Stop serving; safe to call from another thread."""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._stop.set)
+
+
+def serve(datafile: Path) -> int:
+    return Daemon(datafile).run()
@@ -0,0 +1,382 @@
+from __future__ import annotations
+import os
+from datetime import date
+from itertools import chain
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from . import fsutil, idtable, instrument, journal, snapshot
+from .backend import Backend, filter_predicate
+from .idtable import IdTable
+from .index import FieldIndex, RankIndex, TextIndex, text_fields
+from .model import Task
+
+_INDEXES = (TextIndex, FieldIndex, RankIndex)
+
+
+class _State(NamedTuple):
+    records: Sequence[dict]   # snapshot + journal replay, as raw dicts
+    base: int             # how many records came from the snapshot
+    touched: Dict[int, dict]  # snapshot records the journal modified -> originals
+    stat: os.stat_result  # of the snapshot file the records were read from
+
+
+def _catch_up(idx, state: _State) -> None:
+    # bring an index of the snapshot up to date with the journal
+    for i, old in state.touched.items():
+        idx.replace(i, old, state.records[i])
+    idx.extend(state.records)
+
+
+class _Patched(Sequence):
+    # the records _catch_up reads after a spliced compaction: the changed
+    # snapshot positions and the appended records
+    def __init__(self, base: int, changed: Dict[int, dict], added: List[dict]):
+        self.base, self.changed, self.added = base, changed, added
+
+    def __len__(self) -> int:
+        return self.base + len(self.added)
+
+    def __getitem__(self, i: int) -> dict:
+        return self.added[i - self.base] if i >= self.base else self.changed[i]
+
+
+class FileBackend(Backend):
+    """The default store: a JSON snapshot plus an append-only journal, with
+    sidecar text, field, rank and id indexes.
+
+    Readers take no lock: they read the journal before opening the snapshot,
+    so a compaction in between gives them the new snapshot and a journal
+    whose ops it already holds, which replay skips.
+    """
+
+    def init(self) -> None:
+        if not self.path.exists():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fsutil.create(self.path, b"[]")
+
+    def _load_state(self) -> _State:
+        self.init()
+        ops = journal.read(self.path)
+        records, st = snapshot.load_stat(self.path)
+        base = len(records)
+        touched = journal.replay(records, ops)
+        return _State(records, base, touched, st)
+
+    def _scan(self) -> Iterator[Tuple[int, dict, Optional[dict]]]:
+        """Stream (position, current record, snapshot record) in store order.
+
+        The snapshot record is None for tasks added by the journal; the two
+        are the same object when the journal did not modify the task.
+        """
+        return self._scan_stat()[1]
+
+    def _scan_stat(self) -> Tuple[os.stat_result, Iterator[Tuple[int, dict, Optional[dict]]]]:
+        # _scan, and the stat of the snapshot file it streams
+        self.init()
+        overlay = journal.Overlay(journal.read(self.path))
+        st, records = snapshot.iter_load_stat(self.path)
+        return st, self._overlaid(overlay, records)
+
+    @staticmethod
+    def _overlaid(overlay: journal.Overlay, records: Iterator[dict]) -> Iterator[Tuple[int, dict, Optional[dict]]]:
+        n = 0
+        for n, rec in enumerate(records, 1):
+            cur = overlay.apply(rec) if overlay.touches(rec["id"]) else rec
+            yield n - 1, cur, rec
+        for k, rec in enumerate(overlay.tail(), n):
+            yield k, rec, None
+
+    def load_all(self) -> List[Task]:
+        return Task.from_dicts(self._load_state().records)
+
+    def iter_tasks(self) -> Iterator[Task]:
+        scan = instrument.timed_iter("store.scan", self._scan())
+        return instrument.timed_iter("task.build", Task.iter_dicts(rec for _, rec, _ in scan))
+
+    def save_all(self, tasks: List[Task]) -> None:
+        self.init()
+        with fsutil.locked(self.path):
+            snapshot.dump(self.path, [t.to_dict() for t in tasks])
+            journal.clear(self.path)
+
+    def compact(self) -> None:
+        """Fold the journal into the snapshot file."""
+        self.convert(None)
+
+    def convert(self, fmt: Optional[str]) -> None:
+        """Rewrite the snapshot in `fmt` (see snapshot.FORMATS; None keeps
+        the current one), folding the journal in."""
+        self.init()
+        with fsutil.locked(self.path):
+            self._rewrite(fmt)
+
+    def _rewrite(self, fmt: Optional[str]) -> None:
+        # with the store lock held exclusively
+        if fmt in (None, "json") and self._splice():
+            return
+        state = self._load_state()
+        carried = [idx for idx in (cls.load(self.path) for cls in _INDEXES) if idx is not None]
+        st = snapshot.dump(self.path, state.records, fmt)
+        journal.clear(self.path)
+        # compaction keeps record positions, so fresh indexes carry over
+        for idx in carried:
+            _catch_up(idx, state)
+            idx.save(self.path, st)
+
+    def _splice(self) -> bool:
+        # (with the store lock held exclusively, as _rewrite)
+        # Compact a JSON snapshot by encoding only the records the journal
+        # changed or added; the rest are copied as bytes through the id
+        # table.  False when there is no table (columnar snapshot) or it
+        # lacks a task the journal changes, which a full rewrite then sorts
+        # out rather than the change being dropped.
+        ops = journal.read(self.path)
+        table = IdTable.open(self.path)
+        if table is None:
+            return False
+        with table:
+            overlay = journal.Overlay(ops)
+            touched: Dict[int, dict] = {}
+            changed: Dict[int, tuple] = {}
+            for tid, tops in overlay.by_id.items():
+                found = table.find(tid)
+                if found is None:
+                    if not any(op.get("op") == "add" for op in tops):
+                        return False
+                    continue
+                span, rec = found
+                cur = overlay.apply(rec)
+                if cur is not rec:
+                    touched[span.pos] = rec
+                    changed[span.pos] = (span, cur)
+            added = list(overlay.tail())
+            base = table.count
+            carried = [idx for idx in (cls.load(self.path) for cls in _INDEXES) if idx is not None]
+            st = idtable.rewrite(self.path, table, changed, added)
+        journal.clear(self.path)
+        current = {pos: rec for pos, (_, rec) in changed.items()}
+        state = _State(_Patched(base, current, added), base, touched, st)
+        for idx in carried:
+            _catch_up(idx, state)
+            idx.save(self.path, st)
+        return True
+
+    def _log(self, *ops: dict) -> None:
+        self.init()
+        with fsutil.locked(self.path, shared=True):
+            size = journal.append(self.path, ops)
+        if size > journal.COMPACT_BYTES:
+            with fsutil.locked(self.path):
+                # writers that were queued on the lock may have compacted
+                if journal.journal_size(self.path) > journal.COMPACT_BYTES:
+                    self._rewrite(None)
+
+    def add(self, task: Task) -> None:
+        self._log({"op": "add", "task": task.to_dict()})
+
+    def apply(self, ops: List[dict]) -> None:
+        # one journal append for the whole batch
+        if ops:
+            self._log(*ops)
+
+    def extend(self, records: Iterable[dict], batch: int = 10000) -> None:
+        # one pass for a JSON snapshot: the store as it is, then the new
+        # records, streamed into a new snapshot that absorbs the journal
+        self.init()
+        if snapshot.format_of(self.path) != "json":
+            super().extend(records, batch)
+            return
+        with fsutil.locked(self.path):
+            current = (rec for _, rec, _ in self._scan())
+            snapshot.dump_iter(self.path, chain(current, records))
+            journal.clear(self.path)
+
+    def states(self) -> Dict[str, bool]:
+        return {r["id"]: bool(r.get("completed")) for _, r, _ in self._scan()}
+
+    def files(self) -> List[Path]:
+        return [self.path, journal.journal_path(self.path)]
+
+    def mark(self) -> tuple:
+        # (snapshot identity, journal inode, how much of the journal)
+        snap = os.stat(self.path)
+        try:
+            st = os.stat(journal.journal_path(self.path))
+            ino, size = st.st_ino, st.st_size
+        except FileNotFoundError:
+            ino, size = None, 0
+        return (snap.st_ino, snap.st_size, snap.st_mtime_ns), ino, size
+
+    def changes_since(self, mark: tuple) -> Tuple[Optional[List[dict]], tuple]:
+        # the journal lines appended since `mark`, while the snapshot is the
+        # same file; a compaction or save_all means reading it again
+        now = self.mark()
+        if mark is None or now[0] != mark[0]:
+            return None, now
+        offset = mark[2] if mark[1] is not None else 0
+        if mark[1] is not None and (now[1] != mark[1] or now[2] < offset):
+            return None, now
+        ops, end = journal.read_from(self.path, offset)
+        return ops, (now[0], now[1], end)
+
+    def _record(self, task_id: str) -> Optional[dict]:
+        # the current record for one id: the snapshot's bytes for it through
+        # the id table, with the journal applied; a scan for columnar files.
+        # The journal, the table (built here if need be) and the snapshot
+        # are read under the shared lock, so no compaction runs in between.
+        self.init()
+        with fsutil.locked(self.path, shared=True):
+            ops = journal.read(self.path)
+            table = IdTable.open(self.path)
+            if table is None:
+                return next((r for _, r, _ in self._scan() if r["id"] == task_id), None)
+            with table:
+                rec = table.get(task_id)
+        overlay = journal.Overlay(ops)
+        if not overlay.touches(task_id):
+            return rec
+        if rec is not None:
+            return overlay.apply(rec)
+        return next((r for r in overlay.tail(set()) if r["id"] == task_id), None)
+
+    def get(self, task_id: str) -> Optional[Task]:
+        rec = self._record(task_id)
+        return None if rec is None else Task.from_dicts((rec,))[0]
+
+    def complete(self, task_id: str) -> bool:
+        r = self._record(task_id)
+        if r is None:
+            return False
+        if not r.get("completed"):
+            self._log({"op": "complete", "id": task_id})
+        return True
+
+    def _indexed_scan(self, classes, lookup, match) -> Iterator[Task]:
+        # The tasks `match` accepts, with `lookup` (given one of each of
+        # `classes`) narrowing them down to candidate positions, or None for
+        # all.  With fresh indexes and an id table only the candidates and
+        # the records the journal touched are read, by offset.  Otherwise
+        # the store is streamed, snapshot records the journal left alone
+        # decided by the indexes, and stale indexes rebuilt in the same pass.
+        match = instrument.timed("filter.match", match)
+        build = instrument.timed("task.build", Task.from_dicts)
+        self.init()
+        ops = journal.read(self.path)   # before the snapshot, as in _scan
+        fresh = False
+        table = IdTable.open(self.path)
+        if table is not None:
+            with table:
+                loaded = [cls.load(self.path, table.stat) for cls in classes]
+                fresh = all(idx is not None for idx in loaded)
+                with instrument.span("index.lookup"):
+                    hits = lookup(*loaded) if fresh else None
+                if hits is not None:
+                    found = self._fetch(table, journal.Overlay(ops), hits)
+                    for rec in instrument.timed_iter("store.fetch", found):
+                        if match(rec):
+                            yield build((rec,))[0]
+                    return
+
+        st, scan = self._scan_stat()   # the indexes used or built must describe this file
+        loaded = [None if fresh else cls.load(self.path, st) for cls in classes]
+        building = [] if fresh else [cls() for cls, idx in zip(classes, loaded) if idx is None]
+        with instrument.span("index.lookup"):
+            hits = None if fresh or building else lookup(*loaded)
+        for pos, rec, orig in instrument.timed_iter("store.scan", scan):
+            if building and orig is not None:
+                for idx in building:
+                    idx.add(pos, orig)
+            if rec is orig and hits is not None and pos not in hits:
+                continue
+            if match(rec):
+                yield build((rec,))[0]
+        for idx in building:
+            idx.save(self.path, st)
+
+    @staticmethod
+    def _fetch(table: IdTable, overlay: journal.Overlay, hits) -> Iterator[dict]:
+        # the snapshot records at the `hits` positions and the current
+        # versions of those the journal changed, in store order, then the
+        # records the journal added
+        changed: Dict[int, dict] = {}
+        for tid in overlay.by_id:
+            found = table.find(tid)
+            if found is not None:
+                span, rec = found
+                changed[span.pos] = overlay.apply(rec)
+        for pos in sorted(set(hits).union(changed)):
+            if pos in changed:
+                yield changed[pos]
+            elif pos < table.count:
+                yield table.record(pos)
+        yield from overlay.tail()
+
+    def ranker(self) -> Tuple[RankIndex, Callable[[List[tuple]], List[Tuple[float, Task]]]]:
+        """The rank index, caught up with the journal, and a function turning
+        its (score, position) hits into (score, task) pairs."""
+        self.init()
+        idx = RankIndex.load(self.path)
+        if idx is None:
+            state = self._load_state()
+            idx = RankIndex.build(state.touched.get(i, r) for i, r in enumerate(state.records[:state.base]))
+            idx.save(self.path, state.stat)
+            _catch_up(idx, state)
+            return idx, lambda hits: list(zip(
+                (s for s, _ in hits), Task.iter_dicts(state.records[p] for _, p in hits)))
+
+        # the index covers the snapshot; journal adds follow it, as in _scan
+        overlay = journal.Overlay(journal.read(self.path))
+        base = idx.count
+        tail = list(overlay.tail(idx.known_ids()))
+        for k, rec in enumerate(tail, base):
+            idx.add(k, rec)
+
+        def fetch(hits: List[tuple]) -> List[Tuple[float, Task]]:
+            found = {p: tail[p - base] for _, p in hits if p >= base}
+            wanted = {p for _, p in hits if p < base}
+            if wanted:
+                # stream the snapshot only as far as the last hit
+                for pos, rec, _ in self._scan():
+                    if pos in wanted:
+                        found[pos] = rec
+                        wanted.discard(pos)
+                        if not wanted:
+                            break
+            return list(zip((s for s, _ in hits), Task.iter_dicts(found[p] for _, p in hits)))
+        return idx, fetch
+
+    def ranked(self, query: str, limit: int = 20, fuzzy: int = 0) -> List[Tuple[float, Task]]:
+        idx, fetch = self.ranker()
+        with instrument.span("index.lookup"):
+            hits = idx.top(query, limit, fuzzy)
+        return fetch(hits)
+
+    def iter_search(self, query: str) -> Iterator[Task]:
+        q = query.lower()
+        return self._indexed_scan(
+            (TextIndex,),
+            lambda idx: idx.candidates(q),
+            lambda rec: any(q in part for part in text_fields(rec)),
+        )
+
+    def iter_filter(self, mode: str, value: Optional[str] = None) -> Iterator[Task]:
+        today = date.today().toordinal()
+        pred = filter_predicate(mode, value, today)
+
+        def lookup(idx: FieldIndex):
+            positions = idx.lookup(mode, value, today)
+            return None if positions is None else set(positions)
+
+        def match(rec: dict) -> bool:
+            return pred is None or pred(Task.from_dicts((rec,))[0])
+
+        return self._indexed_scan((FieldIndex,), lookup, match)
+
+    def iter_query(self, query) -> Iterator[Task]:
+        classes = tuple(cls for cls in _INDEXES if cls in query.indexes())
+
+        def lookup(*idxs):
+            found = dict(zip(classes, idxs))
+            return query.candidates(found.get(TextIndex), found.get(FieldIndex))
+
+        return self._indexed_scan(classes, lookup, query.match)
@@ -0,0 +1,104 @@
+from __future__ import annotations
+import os
+import stat
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Iterator
+
+try:
+    import fcntl
+except ImportError:   # no advisory locks (Windows): single-writer only
+    fcntl = None
+
+# Several processes may write one store.  Appending to the journal takes the
+# store lock shared (appends of whole lines do not interleave); anything that
+# rewrites the snapshot or removes the journal takes it exclusively.  Files
+# other processes may be reading are replaced by rename, never rewritten in
+# place.
+LOCK_SUFFIX = ".lock"
+
+
+def lock_path(path: Path) -> Path:
+    return path.with_name(path.name + LOCK_SUFFIX)
+
+
+def flock(fd: int, shared: bool = False) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+
+
+def funlock(fd: int) -> None:
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+@contextmanager
+def locked(path: Path, shared: bool = False) -> Iterator[int]:
+    """Hold the advisory lock of the store at `path`; yields the lock
+    file's descriptor.  Not reentrant: do not nest for the same store."""
+    fd = os.open(lock_path(path), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        flock(fd, shared)
+        yield fd
+    finally:
+        os.close(fd)   # releases the lock
+
+
+@contextmanager
+def _temp(path: Path, sync: bool) -> Iterator[tuple]:
+    # a new file next to `path` (same filesystem, so it can be renamed over
+    # it), with the mode a plain write would have given; yields (its path,
+    # the open file) and removes it if the block fails
+    tmp = path.with_name(f".{path.name}.{os.urandom(4).hex()}.tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield tmp, f
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        try:
+            os.chmod(tmp, stat.S_IMODE(os.stat(path).st_mode))
+        except FileNotFoundError:
+            pass
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+@contextmanager
+def replacing(path: Path, sync: bool = True) -> Iterator[IO[bytes]]:
+    """Write the new contents of `path` to the yielded file; they replace
+    the old ones when the block ends, as with write_atomic."""
+    with _temp(path, sync) as (tmp, f):
+        yield f
+    try:
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def write_atomic(path: Path, data: bytes, sync: bool = True) -> os.stat_result:
+    """Replace `path` with `data` so that readers see the old or the new
+    contents, never a mix; with `sync`, the new contents are on disk first.
+    Returns the stat of the new file, taken before it was renamed into
+    place (so it cannot be another writer's file)."""
+    with replacing(path, sync) as f:
+        f.write(data)
+        f.flush()
+        st = os.fstat(f.fileno())
+    return st
+
+
+def create(path: Path, data: bytes) -> bool:
+    """Write a new file unless one exists; False if it already did."""
+    with _temp(path, sync=False) as (tmp, f):
+        f.write(data)
+    try:
+        os.link(tmp, path)   # atomic, and fails if `path` exists
+        return True
+    except FileExistsError:
+        return False
+    finally:
+        tmp.unlink()
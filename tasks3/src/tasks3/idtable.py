@@ -0,0 +1,321 @@
+from __future__ import annotations
+import json
+import mmap
+import os
+import re
+import struct
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+from . import fsutil, instrument, snapshot
+from .index import sidecar_path
+
+# An id -> byte range table for a JSON snapshot, so that one task can be read
+# without parsing the store.  The sidecar is a fixed header (magic, the
+# snapshot's size and mtime, slot and record counts) followed by an
+# open-addressing hash table of (crc32 of id, record length, position,
+# record offset) slots, and then the (offset, length, id hash) of each
+# record by position, for reading index hits.  Both files are
+# memory-mapped: a lookup probes a slot or two and decodes only the bytes
+# of the record it points at.  Columnar snapshots have no per-record bytes
+# and get no table.
+#
+# The table also lets compaction rewrite a JSON snapshot without encoding
+# it again (rewrite()).  Records the journal left alone are copied as bytes.
+# A changed record that fits in its old bytes (a completion does) is
+# patched in place, padded with spaces, so nothing after it moves and the
+# table only gains the appended records.
+ID_SUFFIX = ".ididx"
+_HEADER = struct.Struct("<8sQqQQ")
+_SLOT = struct.Struct("<IIIQ")
+_SPAN = struct.Struct("<QII")
+_MAGIC = b"T3IDTBL3"
+_SEP = re.compile(r"[\s,]*")
+
+
+class Span(NamedTuple):
+    pos: int
+    offset: int
+    length: int
+
+
+def _hash(task_id: str) -> int:
+    return zlib.crc32(task_id.encode("utf-8"))
+
+
+def record_spans(data: bytes) -> Iterator[Tuple[str, int, int]]:
+    """(id, byte offset, byte length) of each record of a JSON snapshot."""
+    text = data.decode("utf-8")
+    ascii_only = data.isascii()
+    decode = json.JSONDecoder().raw_decode
+    pos = _SEP.match(text).end()
+    if text[pos:pos + 1] != "[":
+        raise ValueError("snapshot is not a JSON array")
+    pos = _SEP.match(text, pos + 1).end()
+    char, byte = 0, 0   # a char offset and its byte offset, for non-ASCII text
+    while text[pos:pos + 1] != "]":
+        if pos >= len(text):
+            raise ValueError("snapshot array is not terminated")
+        rec, end = decode(text, pos)
+        if ascii_only:
+            start, length = pos, end - pos
+        else:
+            start = byte + len(text[char:pos].encode("utf-8"))
+            length = len(text[pos:end].encode("utf-8"))
+            char, byte = end, start + length
+        yield rec["id"], start, length
+        pos = _SEP.match(text, end).end()
+
+
+def _insert(table: bytearray, nslots: int, h: int, length: int, pos: int, off: int) -> None:
+    mask = nslots - 1
+    i = h & mask
+    while _SLOT.unpack_from(table, _HEADER.size + i * _SLOT.size)[1]:
+        i = (i + 1) & mask
+    _SLOT.pack_into(table, _HEADER.size + i * _SLOT.size, h, length, pos, off)
+
+
+def _write(path: Path, table: bytearray, spans: bytes, count: int, st: os.stat_result) -> None:
+    # stamp the table (header and slots) with the snapshot it describes
+    # (`st`, the stat of the bytes it was built from, not of whatever `path`
+    # is by now) and save it with the spans
+    nslots = _HEADER.unpack_from(table)[3]
+    _HEADER.pack_into(table, 0, _MAGIC, st.st_size, st.st_mtime_ns, nslots, count)
+    with instrument.span("index.save"):
+        fsutil.write_atomic(sidecar_path(path, ID_SUFFIX), bytes(table) + spans, sync=False)
+    instrument.count("bytes.written", len(table) + len(spans))
+
+
+def _size(table) -> int:
+    # how long a sidecar with `table`'s header is
+    nslots, count = _HEADER.unpack_from(table)[3:]
+    return _HEADER.size + nslots * _SLOT.size + count * _SPAN.size
+
+
+def _save(path: Path, entries: List[Tuple[int, int, int]], st: os.stat_result) -> None:
+    # entries: (offset, length, id hash) of every record, in snapshot order
+    nslots = 8
+    while nslots < 2 * len(entries):
+        nslots *= 2
+    table = bytearray(_HEADER.size + nslots * _SLOT.size)
+    _HEADER.pack_into(table, 0, _MAGIC, 0, 0, nslots, 0)
+    mask = nslots - 1
+    taken = bytearray(nslots)
+    spans = bytearray(len(entries) * _SPAN.size)
+    for pos, (off, length, h) in enumerate(entries):
+        i = h & mask
+        while taken[i]:
+            i = (i + 1) & mask
+        taken[i] = 1
+        _SLOT.pack_into(table, _HEADER.size + i * _SLOT.size, h, length, pos, off)
+        _SPAN.pack_into(spans, pos * _SPAN.size, off, length, h)
+    _write(path, table, spans, len(entries), st)
+
+
+def build(path: Path) -> bool:
+    """Write the table for `path`'s snapshot; False if it is not JSON (or
+    does not exist)."""
+    with instrument.span("index.build"):
+        try:
+            with path.open("rb") as f:
+                # the stamp is of the file read, even if a compaction
+                # renames another one over `path` meanwhile
+                st = os.fstat(f.fileno())
+                data = f.read()
+        except FileNotFoundError:
+            return False
+        if snapshot.head_format(data[:64]) != "json":
+            return False
+        spans = record_spans(data)
+        _save(path, [(off, length, _hash(tid)) for tid, off, length in spans], st)
+    return True
+
+
+def encode(rec: dict, one_line: bool = False) -> bytes:
+    """A record as snapshot.dump lays it out inside the array (or on one
+    line, for snapshots written that way)."""
+    if one_line:
+        return json.dumps(rec, ensure_ascii=False).encode("utf-8")
+    return json.dumps(rec, indent=2, ensure_ascii=False).replace("\n", "\n  ").encode("utf-8")
+
+
+class IdTable:
+    """An open table; use as a context manager so the maps are closed."""
+
+    def __init__(self, path: Path, table: mmap.mmap, data: mmap.mmap, st: os.stat_result):
+        self.path = path
+        self.table = table
+        self.data = data
+        self.stat = st   # of the snapshot file mapped
+        self.nslots, self.count = _HEADER.unpack_from(table)[3:]
+        self.spans = _HEADER.size + self.nslots * _SLOT.size   # where they start
+
+    @classmethod
+    def open(cls, path: Path) -> Optional["IdTable"]:
+        """Map the table for `path`, building it first if it is missing or
+        stale; None for snapshots without one (columnar)."""
+        t = cls._map(path)
+        if t is None and build(path):
+            t = cls._map(path)
+        return t
+
+    @classmethod
+    def _map(cls, path: Path) -> Optional["IdTable"]:
+        try:
+            with sidecar_path(path, ID_SUFFIX).open("rb") as f:
+                table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None   # ValueError: an empty file cannot be mapped
+        try:
+            # the stamp is checked against the very file that gets mapped
+            with path.open("rb") as f:
+                st = os.fstat(f.fileno())
+                if (len(table) >= _HEADER.size and _HEADER.unpack_from(table)[:3]
+                        == (_MAGIC, st.st_size, st.st_mtime_ns) and len(table) == _size(table)):
+                    return cls(path, table, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), st)
+        except (FileNotFoundError, ValueError):
+            pass
+        table.close()
+        return None
+
+    def __enter__(self) -> "IdTable":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.table.close()
+        self.data.close()
+
+    def find(self, task_id: str) -> Optional[Tuple[Span, dict]]:
+        """Where the snapshot record with `task_id` is, and the record."""
+        h = _hash(task_id)
+        mask = self.nslots - 1
+        i = h & mask
+        view = memoryview(self.data)
+        try:
+            while True:
+                slot_h, length, pos, off = _SLOT.unpack_from(
+                    self.table, _HEADER.size + i * _SLOT.size)
+                if not length:
+                    return None
+                if slot_h == h:
+                    rec = json.loads(bytes(view[off:off + length]))
+                    instrument.count("bytes.read", length)
+                    if rec["id"] == task_id:
+                        return Span(pos, off, length), rec
+                i = (i + 1) & mask
+        finally:
+            view.release()
+
+    def get(self, task_id: str) -> Optional[dict]:
+        """The snapshot record with `task_id`, or None."""
+        found = self.find(task_id)
+        return None if found is None else found[1]
+
+    def record(self, pos: int) -> dict:
+        """The snapshot record at position `pos`."""
+        off, length, _ = _SPAN.unpack_from(self.table, self.spans + pos * _SPAN.size)
+        instrument.count("bytes.read", length)
+        return json.loads(self.data[off:off + length])
+
+    def entries(self) -> List[Tuple[int, int, int]]:
+        """(offset, length, id hash) of every record, in snapshot order."""
+        return list(_SPAN.iter_unpack(self._span_bytes()))
+
+    def _span_bytes(self) -> bytes:
+        return self.table[self.spans:self.spans + self.count * _SPAN.size]
+
+
+def rewrite(path: Path, table: IdTable, changed: Dict[int, Tuple[Span, dict]],
+            added: List[dict]) -> os.stat_result:
+    """Replace `path`'s snapshot with the records at the `changed` positions
+    swapped for new versions and `added` appended, copying the bytes of the
+    rest, and save the table for the result; returns the new file's stat."""
+    data = table.data
+    first = data.find(b"{")
+    one_line = first >= 0 and data[first + 1:first + 2] != b"\n"
+    with instrument.span("snapshot.encode"):
+        patches = [(span, encode(rec, one_line), _hash(rec["id"]))
+                   for span, rec in (changed[pos] for pos in sorted(changed))]
+        fresh = [(encode(rec, one_line), _hash(rec["id"])) for rec in added]
+    if all(len(raw) <= span.length for span, raw, _ in patches):
+        return _patch(path, table, patches, fresh, b",\n" if one_line else b",\n  ")
+    return _splice(path, table, patches, fresh)
+
+
+def _patch(path: Path, table: IdTable, patches: list, fresh: list, sep: bytes) -> os.stat_result:
+    # nothing moves: changed records are padded to their old length, and
+    # added ones go in before the closing bracket
+    data = table.data
+    out: List[bytes] = []
+    last = 0
+    for span, raw, _ in patches:
+        out.append(data[last:span.offset])
+        out.append(raw[:-1] + b" " * (span.length - len(raw)) + raw[-1:])
+        last = span.offset + span.length
+    new: List[Tuple[int, int, int]] = []
+    if fresh:
+        out.append(data[last:data.rfind(b"]")].rstrip())
+        size = sum(map(len, out))
+        for raw, h in fresh:
+            lead = sep if table.count or new else sep[1:]
+            new.append((size + len(lead), len(raw), h))
+            out += [lead, raw]
+            size += len(lead) + len(raw)
+        out.append(b"\n]")
+    else:
+        out.append(data[last:])
+    raw = b"".join(out)
+    with instrument.span("snapshot.write"):
+        st = fsutil.write_atomic(path, raw)
+    instrument.count("bytes.written", len(raw))
+
+    count = table.count + len(new)
+    if 2 * count > table.nslots:
+        _save(path, table.entries() + new, st)
+        return st
+    slots = bytearray(table.table[:table.spans])
+    for pos, (off, length, h) in enumerate(new, table.count):
+        _insert(slots, table.nslots, h, length, pos, off)
+    spans = table._span_bytes() + b"".join(_SPAN.pack(*e) for e in new)
+    _write(path, slots, spans, count, st)
+    return st
+
+
+def _splice(path: Path, table: IdTable, patches: list, fresh: list) -> os.stat_result:
+    # a changed record grew: the records after it move, so every offset is
+    # recomputed and the table rebuilt
+    data = table.data
+    entries = table.entries()
+    out: List[bytes] = []
+    new: List[Tuple[int, int, int]] = []
+    size = 0
+
+    def put(piece: bytes) -> None:
+        nonlocal size
+        out.append(b",\n  " if out else b"[\n  ")
+        out.append(piece)
+        size += 4 + len(piece)
+
+    start = 0
+    for span, raw, h in patches + [(Span(len(entries), 0, 0), None, 0)]:
+        if start < span.pos:
+            # a run of untouched records, separators and all
+            end = entries[span.pos - 1]
+            lo, hi = entries[start][0], end[0] + end[1]
+            shift = size + 4 - lo
+            new.extend((off + shift, n, eh) for off, n, eh in entries[start:span.pos])
+            put(data[lo:hi])
+        if raw is not None:
+            new.append((size + 4, len(raw), h))
+            put(raw)
+        start = span.pos + 1
+    for raw, h in fresh:
+        new.append((size + 4, len(raw), h))
+        put(raw)
+    out.append(b"\n]" if out else b"[]")
+    raw = b"".join(out)
+    with instrument.span("snapshot.write"):
+        st = fsutil.write_atomic(path, raw)
+    instrument.count("bytes.written", len(raw))
+    _save(path, new, st)
+    return st
@@ -0,0 +1,584 @@
+from __future__ import annotations
+import heapq
+import json
+import math
+import os
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from itertools import chain, repeat
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+from . import fsutil, instrument
+from .model import PRIORITIES, parse_due
+
+# Sidecar indexes live next to the data file and describe the snapshot they
+# were built from (its size and mtime).  Records appended by the journal sit
+# after the snapshot's records and are folded into the index in memory
+# (add/replace); an index whose stamp no longer matches the snapshot is
+# rebuilt.  The stamp saved is the stat of the file the index was built
+# from, taken on the handle it was read through (or written to): stat()ing
+# the path when saving could stamp a snapshot a compaction renamed in since.
+TEXT_SUFFIX = ".textidx"
+FIELD_SUFFIX = ".fieldidx"
+INDEX_VERSION = 1
+
+
+def sidecar_path(path: Path, suffix: str) -> Path:
+    return path.with_name(path.name + suffix)
+
+
+def snapshot_stamp(path: Path) -> List[int]:
+    return stat_stamp(path.stat())
+
+
+def stat_stamp(st: os.stat_result) -> List[int]:
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _read_sidecar(path: Path, suffix: str, st: Optional[os.stat_result] = None) -> Optional[dict]:
+    # None unless the index describes `st` (by default, the snapshot now)
+    try:
+        with instrument.span("index.load"):
+            raw = sidecar_path(path, suffix).read_bytes()
+            data = json.loads(raw)
+    except (FileNotFoundError, ValueError):
+        return None
+    instrument.count("bytes.read", len(raw))
+    if data.get("version") != INDEX_VERSION or data.get("stamp") != (
+            snapshot_stamp(path) if st is None else stat_stamp(st)):
+        return None
+    return data
+
+
+def _write_sidecar(path: Path, suffix: str, st: os.stat_result, data: dict) -> None:
+    # `st`: the snapshot the index describes
+    data = {"version": INDEX_VERSION, "stamp": stat_stamp(st), **data}
+    with instrument.span("index.save"):
+        raw = json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        fsutil.write_atomic(sidecar_path(path, suffix), raw, sync=False)
+    instrument.count("bytes.written", len(raw))
+
+
+def text_fields(rec: dict) -> List[str]:
+    return [
+        rec["title"].lower(),
+        (rec.get("description") or "").lower(),
+        *[tag.lower() for tag in rec.get("tags") or []],
+    ]
+
+
+def trigrams(s: str) -> Set[str]:
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+class TextIndex:
+    """Trigram -> record positions, over title, description and tags.
+
+    Grams are taken per field, so every record containing a query as a
+    substring of one of its fields holds all of the query's trigrams; the
+    candidates still have to be verified against the real text.
+
+    The sidecar is binary: a header stamped like the idtable's, a JSON
+    directory of gram -> [offset, count, dense], and the postings, each
+    gram's positions as little-endian uint32s or, for grams in more than a
+    32nd of the records, a bitmap over the records.  A loaded index
+    decodes only the grams a query looks up or add/replace change.
+    """
+
+    def __init__(self, count: int = 0, grams: Optional[Dict[str, List[int]]] = None):
+        self.count = count
+        self.grams: Dict[str, List[int]] = grams or {}   # built or changed in memory
+        self._dir: Dict[str, list] = {}   # the other grams, in the sidecar's postings
+        self._blob = b""
+        self._bits = 0   # records the stored bitmaps cover
+
+    @staticmethod
+    def _record_grams(rec: dict) -> Set[str]:
+        return {part[i:i + 3] for part in text_fields(rec) for i in range(len(part) - 2)}
+
+    def _stored(self, g: str) -> List[int]:
+        off, n, dense = self._dir[g]
+        if dense:
+            return _bit_positions(self._blob[off:off + (self._bits + 7) // 8])
+        return _uint32s(self._blob[off:off + 4 * n]).tolist()
+
+    def _own(self, g: str) -> List[int]:
+        postings = self.grams.get(g)
+        if postings is None:
+            postings = self.grams[g] = self._stored(g) if g in self._dir else []
+        return postings
+
+    def add(self, pos: int, rec: dict) -> None:
+        grams = self.grams
+        for g in self._record_grams(rec):
+            postings = grams.get(g)
+            if postings is None:
+                postings = self._own(g)
+            postings.append(pos)
+        self.count = max(self.count, pos + 1)
+
+    def replace(self, pos: int, old: dict, new: dict) -> None:
+        for g in self._record_grams(old):
+            self._own(g).remove(pos)
+        self.add(pos, new)
+
+    def extend(self, records: List[dict]) -> None:
+        for i in range(self.count, len(records)):
+            self.add(i, records[i])
+
+    def candidates(self, q: str) -> Optional[Set[int]]:
+        """Positions that may contain ``q`` (lowercased); None if the query
+        is too short for the index to narrow anything down."""
+        grams = trigrams(q)
+        if not grams:
+            return None
+        lists, maps = [], []
+        for g in grams:
+            if g in self.grams:
+                lists.append(self.grams[g])
+            elif g not in self._dir:
+                return set()
+            elif self._dir[g][2]:
+                off = self._dir[g][0]
+                maps.append(self._blob[off:off + (self._bits + 7) // 8])
+            else:
+                lists.append(self._stored(g))
+        if not lists:
+            # only common grams: AND their bitmaps
+            acc = int.from_bytes(maps[0], "little")
+            for m in maps[1:]:
+                acc &= int.from_bytes(m, "little")
+            return set(_bit_positions(acc.to_bytes(len(maps[0]), "little")))
+        lists.sort(key=len)
+        hits = set(lists[0])
+        for p in lists[1:]:
+            if not hits:
+                break
+            hits.intersection_update(p)
+        # positions past the bitmaps were added since, to grams in `lists`
+        bits = self._bits
+        for m in maps:
+            hits = {p for p in hits if p < bits and m[p >> 3] >> (p & 7) & 1}
+        return hits
+
+    @classmethod
+    def build(cls, records: Iterable[dict]) -> "TextIndex":
+        idx = cls()
+        for i, rec in enumerate(records):
+            idx.add(i, rec)
+        return idx
+
+    @classmethod
+    def load(cls, path: Path, st: Optional[os.stat_result] = None) -> Optional["TextIndex"]:
+        try:
+            with instrument.span("index.load"):
+                with sidecar_path(path, TEXT_SUFFIX).open("rb") as f:
+                    head = f.read(_TEXT_HEADER.size)
+                    if len(head) < _TEXT_HEADER.size:
+                        return None
+                    magic, size, mtime, count, dlen = _TEXT_HEADER.unpack(head)
+                    want = snapshot_stamp(path) if st is None else stat_stamp(st)
+                    if magic != _TEXT_MAGIC or [size, mtime] != want:
+                        return None
+                    directory = json.loads(f.read(dlen))
+                    blob = f.read()
+        except (FileNotFoundError, ValueError):
+            return None
+        instrument.count("bytes.read", _TEXT_HEADER.size + dlen + len(blob))
+        idx = cls(count)
+        idx._dir, idx._blob, idx._bits = directory, blob, count
+        return idx
+
+    def save(self, path: Path, st: os.stat_result) -> None:
+        count, nbytes = self.count, (self.count + 7) // 8
+        directory: Dict[str, list] = {}
+        parts: List[bytes] = []
+        size = 0
+        for g in chain(self._dir, (g for g in self.grams if g not in self._dir)):
+            postings = self.grams.get(g)
+            if postings is None:
+                # unchanged since loaded: copied as stored
+                off, n, dense = self._dir[g]
+                if dense:
+                    raw = self._blob[off:off + (self._bits + 7) // 8].ljust(nbytes, b"\0")
+                else:
+                    raw = self._blob[off:off + 4 * n]
+            elif not postings:
+                continue
+            else:
+                n, dense = len(postings), 32 * len(postings) > count
+                raw = _bitmap(postings, nbytes) if dense else _uint32_bytes(sorted(postings))
+            directory[g] = [size, n, int(dense)]
+            parts.append(raw)
+            size += len(raw)
+        head = json.dumps(directory, separators=(",", ":")).encode("ascii")
+        raw = b"".join([_TEXT_HEADER.pack(_TEXT_MAGIC, st.st_size, st.st_mtime_ns, count, len(head)),
+                        head, *parts])
+        with instrument.span("index.save"):
+            fsutil.write_atomic(sidecar_path(path, TEXT_SUFFIX), raw, sync=False)
+        instrument.count("bytes.written", len(raw))
+
+
+_TEXT_HEADER = struct.Struct("<8sQqQQ")   # magic, snapshot size and mtime, count, directory length
+_TEXT_MAGIC = b"T3TEXT01"
+_ONE = re.compile("1")
+
+
+def _uint32s(data: bytes) -> array:
+    a = array("I", data)   # the sidecar is little-endian
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a
+
+
+def _uint32_bytes(positions: List[int]) -> bytes:
+    a = array("I", positions)
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a.tobytes()
+
+
+def _bitmap(positions: List[int], nbytes: int) -> bytes:
+    # through a string of binary digits, so the loops run in C
+    digits = bytearray(b"0") * (nbytes * 8)
+    any(map(digits.__setitem__, positions, repeat(49)))   # "1"
+    digits.reverse()
+    return int(digits, 2).to_bytes(nbytes, "little")
+
+
+def _bit_positions(bits: bytes) -> List[int]:
+    digits = format(int.from_bytes(bits, "little"), "b")[::-1]
+    return [m.start() for m in _ONE.finditer(digits)]
+
+
+def due_ordinal(due: Optional[str]) -> Optional[int]:
+    if not due:
+        return None
+    return parse_due(due)
+
+
+class FieldIndex:
+    """Secondary indexes for filter_tasks: tag and priority postings, a
+    completion bitmap and due dates sorted for range lookups."""
+
+    def __init__(
+        self,
+        count: int = 0,
+        tags: Optional[Dict[str, List[int]]] = None,
+        priority: Optional[Dict[str, List[int]]] = None,
+        done: Optional[bytearray] = None,
+        due_keys: Optional[List[int]] = None,
+        due_pos: Optional[List[int]] = None,
+    ):
+        self.count = count
+        self.tags: Dict[str, List[int]] = tags or {}
+        self.priority: Dict[str, List[int]] = priority or {}
+        self.done = done if done is not None else bytearray()
+        # parallel lists, ordered by due ordinal once _sort_due() has run
+        self.due_keys: List[int] = due_keys or []
+        self.due_pos: List[int] = due_pos or []
+        self._due_sorted = True
+
+    def is_done(self, pos: int) -> bool:
+        return bool(self.done[pos >> 3] & (1 << (pos & 7)))
+
+    @staticmethod
+    def _priority(rec: dict) -> str:
+        p = rec.get("priority")
+        return p if p in PRIORITIES else "medium"
+
+    def add(self, pos: int, rec: dict) -> None:
+        while len(self.done) <= pos >> 3:
+            self.done.append(0)
+        if rec.get("completed"):
+            self.done[pos >> 3] |= 1 << (pos & 7)
+        for tag in rec.get("tags") or []:
+            self.tags.setdefault(tag, []).append(pos)
+        self.priority.setdefault(self._priority(rec), []).append(pos)
+        key = due_ordinal(rec.get("due"))
+        if key is not None:
+            # append now, sort once before the next range lookup
+            if self.due_keys and key < self.due_keys[-1]:
+                self._due_sorted = False
+            self.due_keys.append(key)
+            self.due_pos.append(pos)
+        self.count = max(self.count, pos + 1)
+
+    def _sort_due(self) -> None:
+        if not self._due_sorted:
+            pairs = sorted(zip(self.due_keys, self.due_pos))
+            self.due_keys = [k for k, _ in pairs]
+            self.due_pos = [p for _, p in pairs]
+            self._due_sorted = True
+
+    def replace(self, pos: int, old: dict, new: dict) -> None:
+        self.done[pos >> 3] &= ~(1 << (pos & 7)) & 0xFF
+        for tag in old.get("tags") or []:
+            self.tags[tag].remove(pos)
+        self.priority[self._priority(old)].remove(pos)
+        key = due_ordinal(old.get("due"))
+        if key is not None:
+            self._sort_due()
+            i = bisect_left(self.due_keys, key)
+            while self.due_pos[i] != pos:
+                i += 1
+            del self.due_keys[i], self.due_pos[i]
+        self.add(pos, new)
+
+    def extend(self, records: List[dict]) -> None:
+        for i in range(self.count, len(records)):
+            self.add(i, records[i])
+
+    def due_between(self, lo: int, hi: int) -> List[int]:
+        """Positions due on an ordinal in [lo, hi), done or not."""
+        self._sort_due()
+        a = bisect_left(self.due_keys, lo)
+        b = bisect_left(self.due_keys, hi)
+        return self.due_pos[a:b]
+
+    def _due_range(self, lo: int, hi: int) -> List[int]:
+        return [p for p in self.due_between(lo, hi) if not self.is_done(p)]
+
+    def lookup(self, mode: str, value: Optional[str], today: int) -> Optional[List[int]]:
+        """Positions matching a filter_tasks mode, or None for "everything"."""
+        if mode == "overdue":
+            return self._due_range(-1, today)
+        if mode == "today":
+            return self._due_range(today, today + 1)
+        if mode == "priority" and value:
+            return list(self.priority.get(value, ()))
+        if mode == "tag" and value:
+            return list(self.tags.get(value, ()))
+        if mode == "open":
+            return [p for p in range(self.count) if not self.is_done(p)]
+        if mode == "done":
+            return [p for p in range(self.count) if self.is_done(p)]
+        return None
+
+    @classmethod
+    def build(cls, records: Iterable[dict]) -> "FieldIndex":
+        idx = cls()
+        for i, rec in enumerate(records):
+            idx.add(i, rec)
+        return idx
+
+    @classmethod
+    def load(cls, path: Path, st: Optional[os.stat_result] = None) -> Optional["FieldIndex"]:
+        data = _read_sidecar(path, FIELD_SUFFIX, st)
+        if data is None:
+            return None
+        return cls(
+            data["count"], data["tags"], data["priority"],
+            bytearray.fromhex(data["done"]), data["due_keys"], data["due_pos"],
+        )
+
+    def save(self, path: Path, st: os.stat_result) -> None:
+        self._sort_due()
+        _write_sidecar(path, FIELD_SUFFIX, st, {
+            "count": self.count,
+            "tags": self.tags,
+            "priority": self.priority,
+            "done": self.done.hex(),
+            "due_keys": self.due_keys,
+            "due_pos": self.due_pos,
+        })
+
+
+RANK_SUFFIX = ".rankidx"
+# BM25F: field boosts for title, description and tags, and the usual
+# saturation/length-normalisation constants
+RANK_FIELDS = ("title", "description", "tags")
+RANK_BOOSTS = (3.0, 1.0, 2.0)
+BM25_K1 = 1.2
+BM25_B = 0.75
+_WORD = re.compile(r"\w+")
+
+
+def words(s: str) -> List[str]:
+    return _WORD.findall(s.lower())
+
+
+def _rank_fields(rec: dict) -> List[List[str]]:
+    return [
+        words(rec["title"]),
+        words(rec.get("description") or ""),
+        [w for tag in rec.get("tags") or [] for w in words(tag)],
+    ]
+
+
+def merge_stats(parts: Iterable[dict]) -> dict:
+    out = {"docs": 0, "totals": [0, 0, 0], "df": {}}
+    for s in parts:
+        out["docs"] += s["docs"]
+        out["totals"] = [a + b for a, b in zip(out["totals"], s["totals"])]
+        for w, n in s["df"].items():
+            out["df"][w] = out["df"].get(w, 0) + n
+    return out
+
+
+def within_edits(a: str, b: str, k: int) -> Optional[int]:
+    """Levenshtein distance of a and b if it is at most k, else None."""
+    if abs(len(a) - len(b)) > k:
+        return None
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if min(cur) > k:
+            return None
+        prev = cur
+    return prev[-1] if prev[-1] <= k else None
+
+
+class RankIndex:
+    """Term statistics for BM25-ranked search.
+
+    Postings hold, per word, flat [position, tf title, tf description,
+    tf tags, ...] runs; field lengths and totals give the averages BM25F
+    normalises by.  Record ids are kept so journal adds already in the
+    snapshot can be recognised without reading it.
+    """
+
+    def __init__(
+        self,
+        count: int = 0,
+        ids: Optional[List[Optional[str]]] = None,
+        lengths: Optional[List[int]] = None,
+        postings: Optional[Dict[str, List[int]]] = None,
+    ):
+        self.count = count
+        self.ids: List[Optional[str]] = ids or []
+        self.lengths: List[int] = lengths or []   # 3 per position
+        self.postings: Dict[str, List[int]] = postings or {}
+        self.totals = [sum(self.lengths[f::3]) for f in range(3)]
+        self.docs = sum(1 for i in self.ids if i is not None)
+        self._known: Optional[Set[str]] = None
+        self._vocab: Optional[Dict[int, List[str]]] = None
+
+    def known_ids(self) -> Set[str]:
+        if self._known is None:
+            self._known = {i for i in self.ids if i is not None}
+        return self._known
+
+    def add(self, pos: int, rec: dict) -> None:
+        fields = _rank_fields(rec)
+        tfs: Dict[str, List[int]] = {}
+        for f, ws in enumerate(fields):
+            for w in ws:
+                tfs.setdefault(w, [0, 0, 0])[f] += 1
+        for w, tf in tfs.items():
+            if w not in self.postings:
+                self._vocab = None
+            self.postings.setdefault(w, []).extend((pos, *tf))
+        while len(self.ids) <= pos:
+            self.ids.append(None)
+            self.lengths.extend((0, 0, 0))
+        self.ids[pos] = rec["id"]
+        if self._known is not None:
+            self._known.add(rec["id"])
+        for f, ws in enumerate(fields):
+            self.lengths[3 * pos + f] = len(ws)
+            self.totals[f] += len(ws)
+        self.docs += 1
+        self.count = max(self.count, pos + 1)
+
+    def replace(self, pos: int, old: dict, new: dict) -> None:
+        if _rank_fields(old) == _rank_fields(new):
+            return  # e.g. a completion: nothing ranked changed
+        for w in {w for ws in _rank_fields(old) for w in ws}:
+            p = self.postings[w]
+            i = next(i for i in range(0, len(p), 4) if p[i] == pos)
+            del p[i:i + 4]
+        for f in range(3):
+            self.totals[f] -= self.lengths[3 * pos + f]
+        self.docs -= 1
+        self.add(pos, new)
+
+    def extend(self, records: List[dict]) -> None:
+        for i in range(self.count, len(records)):
+            self.add(i, records[i])
+
+    def _expand(self, term: str, fuzzy: int) -> List[tuple]:
+        # (word, weight) pairs: the term itself and, with fuzzy > 0,
+        # vocabulary words within that many edits (numbers match exactly)
+        out = [(term, 1.0)] if term in self.postings else []
+        if fuzzy <= 0 or len(term) < 3 or any(c.isdigit() for c in term):
+            return out
+        if self._vocab is None:
+            self._vocab = {}
+            for w in self.postings:
+                if len(w) >= 3 and not any(c.isdigit() for c in w):
+                    self._vocab.setdefault(len(w), []).append(w)
+        for n in range(len(term) - fuzzy, len(term) + fuzzy + 1):
+            for w in self._vocab.get(n, ()):
+                if w != term:
+                    d = within_edits(term, w, fuzzy)
+                    if d is not None:
+                        out.append((w, 1.0 / (1 + d)))
+        return out
+
+    def _terms(self, query: str, fuzzy: int) -> List[tuple]:
+        return [x for term in dict.fromkeys(words(query)) for x in self._expand(term, fuzzy)]
+
+    def stats(self, query: str, fuzzy: int = 0) -> dict:
+        """The collection statistics top() needs for `query`; those of
+        several indexes add up (see merge_stats) to rank across them."""
+        return {
+            "docs": self.docs,
+            "totals": list(self.totals),
+            "df": {w: len(self.postings[w]) // 4 for w, _ in self._terms(query, fuzzy)},
+        }
+
+    def top(self, query: str, limit: int, fuzzy: int = 0,
+            stats: Optional[dict] = None) -> List[tuple]:
+        """The best (score, position) pairs for `query`, best first.  With
+        `stats`, scores are computed with those collection statistics
+        instead of this index's own."""
+        stats = stats or self.stats(query, fuzzy)
+        docs = stats["docs"]
+        if not docs:
+            return []
+        avg = [max(t / docs, 1e-9) for t in stats["totals"]]
+        norm = [(boost, 1 - BM25_B, BM25_B / a) for boost, a in zip(RANK_BOOSTS, avg)]
+        lengths = self.lengths
+        scores: Dict[int, float] = {}
+        for w, weight in self._terms(query, fuzzy):
+            p = self.postings[w]
+            df = stats["df"][w]
+            idf = weight * math.log(1 + (docs - df + 0.5) / (df + 0.5))
+            for i in range(0, len(p), 4):
+                pos = p[i]
+                tf = 0.0
+                for f in range(3):
+                    if p[i + 1 + f]:
+                        boost, base, per = norm[f]
+                        tf += boost * p[i + 1 + f] / (base + per * lengths[3 * pos + f])
+                scores[pos] = scores.get(pos, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + BM25_K1)
+        best = heapq.nlargest(limit, scores.items(), key=lambda kv: (kv[1], -kv[0]))
+        return [(s, pos) for pos, s in best]
+
+    @classmethod
+    def build(cls, records: Iterable[dict]) -> "RankIndex":
+        idx = cls()
+        for i, rec in enumerate(records):
+            idx.add(i, rec)
+        return idx
+
+    @classmethod
+    def load(cls, path: Path, st: Optional[os.stat_result] = None) -> Optional["RankIndex"]:
+        data = _read_sidecar(path, RANK_SUFFIX, st)
+        if data is None:
+            return None
+        return cls(data["count"], data["ids"], data["lengths"], data["postings"])
+
+    def save(self, path: Path, st: os.stat_result) -> None:
+        _write_sidecar(path, RANK_SUFFIX, st, {
+            "count": self.count,
+            "ids": self.ids,
+            "lengths": self.lengths,
+            "postings": self.postings,
+        })
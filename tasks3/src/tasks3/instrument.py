@@ -0,0 +1,154 @@
+from __future__ import annotations
+import json
+from collections import defaultdict
+from time import perf_counter
+from typing import Callable, Dict, Iterable, Iterator, List, TypeVar
+
+# Timing spans and counters for the store and CLI.  Everything here is off
+# unless enable() is called; the hooks then cost one attribute check.
+#
+# Spans nest: a span's "self" time excludes the spans opened inside it, so
+# e.g. building Tasks from a streamed file is not charged with the JSON
+# decoding it pulls in.
+
+enabled = False
+total: Dict[str, float] = defaultdict(float)
+self_time: Dict[str, float] = defaultdict(float)
+calls: Dict[str, int] = defaultdict(int)
+counters: Dict[str, int] = defaultdict(int)
+_stack: List[list] = []   # [name, start, time spent in child spans]
+
+T = TypeVar("T")
+
+
+def enable() -> None:
+    global enabled
+    reset()
+    enabled = True
+
+
+def disable() -> None:
+    global enabled
+    enabled = False
+
+
+def reset() -> None:
+    for d in (total, self_time, calls, counters):
+        d.clear()
+    _stack.clear()
+
+
+def _push(name: str) -> None:
+    _stack.append([name, perf_counter(), 0.0])
+
+
+def _pop() -> None:
+    name, start, child = _stack.pop()
+    dt = perf_counter() - start
+    total[name] += dt
+    self_time[name] += dt - child
+    calls[name] += 1
+    if _stack:
+        _stack[-1][2] += dt
+
+
+class _Span:
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        _push(self.name)
+
+    def __exit__(self, *exc):
+        _pop()
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL = _NullSpan()
+
+
+def span(name: str):
+    """Context manager timing a phase (a no-op while disabled)."""
+    return _Span(name) if enabled else _NULL
+
+
+def record(name: str, seconds: float) -> None:
+    """Add a phase timed by the caller (e.g. before enable() was called)."""
+    if enabled:
+        total[name] += seconds
+        self_time[name] += seconds
+        calls[name] += 1
+
+
+def count(name: str, n: int = 1) -> None:
+    if enabled:
+        counters[name] += n
+
+
+def timed(name: str, fn: Callable[..., T]) -> Callable[..., T]:
+    """`fn`, timed under `name` when instrumentation is on; meant for hot
+    loops, which pick the wrapper or the bare function once up front."""
+    if not enabled:
+        return fn
+
+    def wrapper(*args, **kwargs):
+        _push(name)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _pop()
+    return wrapper
+
+
+def timed_iter(name: str, it: Iterable[T]) -> Iterable[T]:
+    """Time the work done producing each item of `it`."""
+    return _timed_iter(name, it) if enabled else it
+
+
+def _timed_iter(name: str, it: Iterable[T]) -> Iterator[T]:
+    it = iter(it)
+    while True:
+        _push(name)
+        try:
+            item = next(it)
+        except StopIteration:
+            return
+        finally:
+            _pop()
+        yield item
+
+
+def report() -> dict:
+    return {
+        "spans": {
+            name: {"calls": calls[name], "total": total[name], "self": self_time[name]}
+            for name in sorted(total, key=self_time.get, reverse=True)
+        },
+        "counters": dict(sorted(counters.items())),
+    }
+
+
+def format_report() -> str:
+    rep = report()
+    lines = [f"{'phase':24s} {'calls':>8s} {'self ms':>10s} {'total ms':>10s}"]
+    for name, s in rep["spans"].items():
+        lines.append(f"{name:24s} {s['calls']:8d} {s['self'] * 1000:10.2f} {s['total'] * 1000:10.2f}")
+    for name, n in rep["counters"].items():
+        lines.append(f"{name:24s} {n:>8d}")
+    return "\n".join(lines)
+
+
+def dump_json(path) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report(), f, indent=2)
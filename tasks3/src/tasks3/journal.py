@@ -0,0 +1,204 @@
+from __future__ import annotations
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from . import fsutil, instrument
+
+# Mutations are appended here as one JSON object per line and replayed on
+# top of the snapshot (the plain tasks.json array) when the store is loaded.
+JOURNAL_SUFFIX = ".journal"
+
+# compact (fold the journal into the snapshot) once the journal is this big
+COMPACT_BYTES = 1 << 20
+
+# fsync appends before returning.  Concurrent writers share syncs (group
+# commit): whoever syncs covers every line appended so far, and the writers
+# queued behind it find their lines already on disk.
+SYNC = True
+_MARK = "{:20d} {:20d}\n"   # (journal inode, bytes known synced), in the lock file
+
+
+def journal_path(path: Path) -> Path:
+    return path.with_name(path.name + JOURNAL_SUFFIX)
+
+
+def journal_size(path: Path) -> int:
+    try:
+        return journal_path(path).stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+def append(path: Path, ops: Iterable[dict]) -> int:
+    """Append `ops` as one write; returns the journal's size after it.
+    Callers hold the store lock shared, so compaction cannot remove the
+    journal underneath."""
+    data = "".join(json.dumps(op, ensure_ascii=False) + "\n" for op in ops)
+    with journal_path(path).open("ab") as f:
+        # terminate a torn line left by a crashed append so ours parses
+        if f.tell() and _last_byte(f) != b"\n":
+            data = "\n" + data
+        raw = data.encode("utf-8")
+        with instrument.span("journal.append"):
+            f.write(raw)
+            f.flush()
+        instrument.count("bytes.written", len(raw))
+        end = f.tell()
+        if SYNC:
+            _group_sync(path, f.fileno(), end)
+        return end
+
+
+def _group_sync(path: Path, fd: int, end: int) -> None:
+    # the journal's own flock orders the syncs; the mark says how far the
+    # last one got
+    fsutil.flock(fd)
+    try:
+        mark_fd = os.open(fsutil.lock_path(path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            ino = os.fstat(fd).st_ino
+            mark = os.pread(mark_fd, 64, 0).split()
+            if len(mark) == 2 and int(mark[0]) == ino and int(mark[1]) >= end:
+                instrument.count("journal.sync.shared")
+                return
+            size = os.fstat(fd).st_size
+            with instrument.span("journal.sync"):
+                os.fsync(fd)
+            os.pwrite(mark_fd, _MARK.format(ino, size).encode("ascii"), 0)
+        finally:
+            os.close(mark_fd)
+    finally:
+        fsutil.funlock(fd)
+
+
+def _last_byte(f) -> bytes:
+    with open(f.name, "rb") as r:
+        r.seek(-1, 2)
+        return r.read(1)
+
+
+def read(path: Path) -> List[dict]:
+    jp = journal_path(path)
+    if not jp.exists():
+        return []
+    ops = []
+    with instrument.span("journal.read"), jp.open("r", encoding="utf-8") as f:
+        instrument.count("bytes.read", jp.stat().st_size)
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                ops.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue  # torn write from a crashed append
+    return ops
+
+
+def read_from(path: Path, offset: int) -> Tuple[List[dict], int]:
+    """The ops in the whole lines after byte `offset` of the journal, and
+    the offset just past them, to continue from."""
+    try:
+        with journal_path(path).open("rb") as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], 0
+    instrument.count("bytes.read", len(data))
+    end = data.rfind(b"\n") + 1   # a line still being written waits
+    ops = []
+    for line in data[:end].splitlines():
+        if not line.strip():
+            continue
+        try:
+            ops.append(json.loads(line))
+        except ValueError:
+            continue  # torn write from a crashed append
+    return ops, offset + end
+
+
+def clear(path: Path) -> None:
+    """Remove the journal; callers hold the store lock exclusively."""
+    journal_path(path).unlink(missing_ok=True)
+    # a new journal may reuse the inode: forget how far the old one was synced
+    try:
+        os.truncate(fsutil.lock_path(path), 0)
+    except FileNotFoundError:
+        pass
+
+
+def _apply(rec: dict, op: dict) -> None:
+    # apply a non-add op to the record it targets
+    if op.get("op") == "complete":
+        rec["completed"] = True
+
+
+def replay(records: List[dict], ops: Iterable[dict]) -> Dict[int, dict]:
+    """Apply journal ops to raw task dicts in place.
+
+    Returns {position: original record} for the pre-existing records that
+    the ops modified, so indexes built over the snapshot can catch up.
+    """
+    pos = {r["id"]: i for i, r in enumerate(records)}
+    base = len(records)
+    touched: Dict[int, dict] = {}
+    for op in ops:
+        kind = op.get("op")
+        if kind == "add":
+            rec = op["task"]
+            # a crash between compaction and clearing the journal leaves
+            # adds that are already in the snapshot: replay must be idempotent
+            if rec["id"] not in pos:
+                pos[rec["id"]] = len(records)
+                records.append(dict(rec))
+        else:
+            i = pos.get(op.get("id"))
+            if i is not None:
+                if i < base and i not in touched:
+                    touched[i] = dict(records[i])
+                _apply(records[i], op)
+    return touched
+
+
+class Overlay:
+    """The journal grouped by task id, for applying it while the snapshot
+    is streamed instead of replaying it onto a loaded list."""
+
+    def __init__(self, ops: List[dict]):
+        self.ops = ops
+        self.by_id: Dict[str, List[dict]] = {}
+        for op in ops:
+            tid = op["task"]["id"] if op.get("op") == "add" else op.get("id")
+            self.by_id.setdefault(tid, []).append(op)
+        self.seen: set = set()
+
+    def touches(self, tid: str) -> bool:
+        return tid in self.by_id
+
+    def apply(self, rec: dict) -> dict:
+        """The current state of a snapshot record (a copy if it changed)."""
+        self.seen.add(rec["id"])
+        ops = [op for op in self.by_id[rec["id"]] if op.get("op") != "add"]
+        if not ops:
+            return rec
+        rec = dict(rec)
+        for op in ops:
+            _apply(rec, op)
+        return rec
+
+    def tail(self, seen: Optional[Set[str]] = None) -> Iterator[dict]:
+        """Records added by the journal, in order; call after the snapshot
+        has been streamed through apply(), or pass the snapshot's ids."""
+        seen = self.seen if seen is None else seen
+        created: Dict[str, dict] = {}
+        for op in self.ops:
+            if op.get("op") == "add":
+                tid = op["task"]["id"]
+                if tid not in seen and tid not in created:
+                    created[tid] = dict(op["task"])
+            else:
+                rec = created.get(op.get("id"))
+                if rec is not None:
+                    _apply(rec, op)
+        yield from created.values()
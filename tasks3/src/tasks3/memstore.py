@@ -0,0 +1,240 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from . import instrument
+from .backend import Backend
+from .index import FieldIndex, RankIndex, TextIndex, text_fields
+from .model import Task
+
+
+class MemoryBackend(Backend):
+    """A store held in memory over another backend.
+
+    Reads are answered from the records and in-memory indexes; writes are
+    applied immediately and queued, and flush() hands the queue to the
+    underlying backend as one batch.  If someone else changes the
+    underlying files, the next refresh() catches up: with just the ops
+    they added when the backend can tell (Backend.changes_since), by
+    reloading otherwise.
+    """
+
+    def __init__(self, inner: Backend):
+        super().__init__(inner.path)
+        self.inner = inner
+        self.pending: List[dict] = []
+        self._stamp = None
+        self.reload()
+
+    def reload(self) -> None:
+        self.inner.init()
+        # marked before loading: ops that land in between are replayed
+        # again by the next sync, which is harmless
+        self._mark = self.inner.mark()
+        self.records: List[dict] = [t.to_dict() for t in self.inner.iter_tasks()]
+        self.pos: Dict[str, int] = {r["id"]: i for i, r in enumerate(self.records)}
+        # the indexes and the Task view are built on first use
+        self._tasks: Optional[List[Task]] = None
+        self._text: Optional[TextIndex] = None
+        self._fields: Optional[FieldIndex] = None
+        self._rank: Optional[RankIndex] = None
+        self._stamp = self.inner.stamp()
+
+    @property
+    def text(self) -> TextIndex:
+        if self._text is None:
+            self._text = TextIndex.build(self.records)
+        return self._text
+
+    @property
+    def fields(self) -> FieldIndex:
+        if self._fields is None:
+            self._fields = FieldIndex.build(self.records)
+        return self._fields
+
+    @property
+    def rank(self) -> RankIndex:
+        if self._rank is None:
+            self._rank = RankIndex.build(self.records)
+        return self._rank
+
+    def refresh(self) -> None:
+        """Catch up if another process changed the files."""
+        self.sync()
+
+    def sync(self) -> Optional[Set[int]]:
+        """Catch up with other writers.  Returns the positions of the
+        records that changed, or None if the store was reloaded whole
+        (pending writes are flushed first then)."""
+        stamp = self.inner.stamp()
+        if stamp == self._stamp:
+            return set()
+        ops, mark = self.inner.changes_since(self._mark)
+        if ops is None:
+            self.flush()
+            self.reload()
+            return None
+        self._mark, self._stamp = mark, stamp
+        changed: Set[int] = set()
+        for op in ops:
+            if op.get("op") == "add":
+                rec = Task.from_dicts((op["task"],))[0].to_dict()
+                if self._add(rec):
+                    changed.add(len(self.records) - 1)
+            elif op.get("op") == "complete":
+                i = self.pos.get(op.get("id"))
+                if i is not None and self._complete(i):
+                    changed.add(i)
+        instrument.count("records.synced", len(changed))
+        return changed
+
+    def flush(self) -> None:
+        if self.pending:
+            ops, self.pending = self.pending, []
+            with self._settle():
+                self.inner.apply(ops)
+
+    @contextmanager
+    def _settle(self):
+        # around our own writes: if nobody else had written, the files now
+        # hold exactly our records, so there is nothing for sync to read
+        clean = self.inner.stamp() == self._stamp
+        yield
+        if clean:
+            self._mark, self._stamp = self.inner.mark(), self.inner.stamp()
+
+    def close(self) -> None:
+        self.flush()
+        self.inner.close()
+
+    def init(self) -> None:
+        pass
+
+    def view(self, positions: Optional[Iterable[int]] = None) -> List[Task]:
+        """The tasks (at `positions`, or all of them) as shared Task objects,
+        which callers must not modify."""
+        if self._tasks is None:
+            self._tasks = Task.from_dicts(self.records)
+        if positions is None:
+            return list(self._tasks)
+        return [self._tasks[i] for i in positions]
+
+    def iter_tasks(self) -> Iterator[Task]:
+        return Task.iter_dicts(self.records)
+
+    def save_all(self, tasks: List[Task]) -> None:
+        self.pending.clear()
+        self.inner.save_all(tasks)
+        self.reload()
+
+    def compact(self) -> None:
+        self.flush()
+        with self._settle():
+            self.inner.compact()
+
+    def convert(self, fmt: Optional[str]) -> None:
+        self.flush()
+        with self._settle():
+            self.inner.convert(fmt)
+
+    def _changed(self, i: int, old: Optional[dict]) -> None:
+        # keep whatever has been built in step with records[i]
+        rec = self.records[i]
+        for idx in (self._text, self._fields, self._rank):
+            if idx is None:
+                continue
+            if old is None:
+                idx.add(i, rec)
+            else:
+                idx.replace(i, old, rec)
+        if self._tasks is not None:
+            task = Task.from_dicts((rec,))[0]
+            if i < len(self._tasks):
+                self._tasks[i] = task
+            else:
+                self._tasks.append(task)
+
+    def _add(self, rec: dict) -> bool:
+        if rec["id"] in self.pos:
+            return False
+        self.pos[rec["id"]] = len(self.records)
+        self.records.append(rec)
+        self._changed(len(self.records) - 1, None)
+        return True
+
+    def _complete(self, i: int) -> bool:
+        rec = self.records[i]
+        if rec["completed"]:
+            return False
+        old = dict(rec)
+        rec["completed"] = True
+        self._changed(i, old)
+        return True
+
+    def add(self, task: Task) -> None:
+        rec = task.to_dict()
+        if self._add(rec):
+            self.pending.append({"op": "add", "task": rec})
+
+    def complete(self, task_id: str) -> bool:
+        i = self.pos.get(task_id)
+        if i is None:
+            return False
+        if self._complete(i):
+            self.pending.append({"op": "complete", "id": task_id})
+        return True
+
+    def states(self) -> Dict[str, bool]:
+        return {r["id"]: r["completed"] for r in self.records}
+
+    def get(self, task_id: str) -> Optional[Task]:
+        i = self.pos.get(task_id)
+        return None if i is None else Task.from_dicts((self.records[i],))[0]
+
+    def apply(self, ops: List[dict]) -> None:
+        for op in ops:
+            if op["op"] == "add":
+                self.add(Task.from_dicts((op["task"],))[0])
+            elif op["op"] == "complete":
+                self.complete(op["id"])
+
+    def search_positions(self, query: str) -> List[int]:
+        q = query.lower()
+        with instrument.span("index.lookup"):
+            cand = self.text.candidates(q)
+        positions = range(len(self.records)) if cand is None else sorted(cand)
+        return [i for i in positions if any(q in part for part in text_fields(self.records[i]))]
+
+    def filter_positions(self, mode: str, value: Optional[str] = None) -> Optional[List[int]]:
+        """Positions of the matching records; None means every record."""
+        with instrument.span("index.lookup"):
+            positions = self.fields.lookup(mode, value, date.today().toordinal())
+        return None if positions is None else sorted(set(positions))
+
+    def query_positions(self, query) -> List[int]:
+        need = query.indexes()
+        with instrument.span("index.lookup"):
+            cand = query.candidates(
+                self.text if TextIndex in need else None,
+                self.fields if FieldIndex in need else None,
+            )
+        positions = range(len(self.records)) if cand is None else sorted(cand)
+        match = query.match
+        return [i for i in positions if match(self.records[i])]
+
+    def ranked(self, query: str, limit: int = 20, fuzzy: int = 0) -> List[Tuple[float, Task]]:
+        with instrument.span("index.lookup"):
+            hits = self.rank.top(query, limit, fuzzy)
+        return list(zip((s for s, _ in hits), Task.iter_dicts(self.records[p] for _, p in hits)))
+
+    def iter_search(self, query: str) -> Iterator[Task]:
+        return Task.iter_dicts(self.records[i] for i in self.search_positions(query))
+
+    def iter_filter(self, mode: str, value: Optional[str] = None) -> Iterator[Task]:
+        positions = self.filter_positions(mode, value)
+        if positions is None:
+            return self.iter_tasks()
+        return Task.iter_dicts(self.records[i] for i in positions)
+
+    def iter_query(self, query) -> Iterator[Task]:
+        return Task.iter_dicts(self.records[i] for i in self.query_positions(query))
@@ -0,0 +1,287 @@
+from __future__ import annotations
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+from . import fsutil, journal, snapshot
+from .backend import Backend
+from .model import Task
+
+# `tasks3 migrate` adds the tasks of the earlier task managers' data files
+# to a tasks3 store:
+#   tasks1  (tasks1/cli.py)    [{"title", "description"}]
+#   tasks1-store  (store.py)   {"tasks": [{"text", "created"}]}
+#   tasks2  (tasks2/cli.py)    [{"id", "title", "description", "due",
+#                                "priority", "tags", "completed"}]
+# Files are decoded a record at a time and the store takes them as a stream
+# (Backend.extend), so memory does not grow with the input.  Tasks already
+# in the store or seen earlier in the run are dropped by a hash of their
+# content, and clashing ids are replaced; those hashes live in
+# memory-mapped temporary files.
+FORMATS = ("tasks1", "tasks1-store", "tasks2")
+LEGACY_SUFFIX = ".tasks1"   # a legacy file the store replaces is kept as this
+_STAGING_SUFFIX = ".migrating"
+_encode = json.JSONEncoder(ensure_ascii=False).encode
+
+
+class _HashSet:
+    """A set of nonzero 64-bit hashes in a memory-mapped temporary file:
+    open addressing, 0 marks a free slot, doubled when half full."""
+
+    def __init__(self, slots: int = 1 << 16):
+        self.count = 0
+        self._map(slots)
+
+    def _map(self, slots: int) -> None:
+        self.file = tempfile.TemporaryFile()
+        self.file.truncate(slots * 8)
+        self.mm = mmap.mmap(self.file.fileno(), slots * 8)
+        self.slots = memoryview(self.mm).cast("Q")
+        self.mask = slots - 1
+
+    def add(self, h: int) -> bool:
+        """Add `h`; False if it was there already."""
+        slots, mask = self.slots, self.mask
+        i = h & mask
+        while slots[i]:
+            if slots[i] == h:
+                return False
+            i = (i + 1) & mask
+        slots[i] = h
+        self.count += 1
+        if 2 * self.count > mask:
+            self._grow()
+        return True
+
+    def _grow(self) -> None:
+        old, mm, f = self.slots, self.mm, self.file
+        self._map(2 * len(old))
+        slots, mask = self.slots, self.mask
+        for h in old:
+            if h:
+                i = h & mask
+                while slots[i]:
+                    i = (i + 1) & mask
+                slots[i] = h
+        old.release()
+        mm.close()
+        f.close()
+
+    def close(self) -> None:
+        self.slots.release()
+        self.mm.close()
+        self.file.close()
+
+
+def _hash(data: str, kind: bytes) -> int:
+    digest = hashlib.blake2b(data.encode("utf-8"), digest_size=8, person=kind).digest()
+    return int.from_bytes(digest, "little") or 1
+
+
+def content_hash(rec: dict) -> int:
+    """A hash of a task's content, everything but its id."""
+    key = [rec["title"], rec["description"], rec["due"], rec["priority"], rec["tags"], rec["completed"]]
+    return _hash(_encode(key), b"content")
+
+
+class _Prefixed:
+    # a text file with already-read text put back in front of it
+    def __init__(self, head: str, f: IO[str]):
+        self.head, self.f = head, f
+
+    def read(self, n: int) -> str:
+        if self.head:
+            out, self.head = self.head, ""
+            return out
+        return self.f.read(n)
+
+
+def _open_records(f: IO[str]) -> Tuple[bool, Iterator[dict]]:
+    # (is it the {"tasks": [...]} layout, the records)
+    buf = f.read(snapshot.CHUNK).lstrip()
+    if buf.startswith("["):
+        return False, snapshot.iter_array(_Prefixed(buf, f))
+    if not buf.startswith("{"):
+        raise ValueError("not a JSON array or object")
+    decode = json.JSONDecoder().raw_decode
+    pos = 1
+
+    def skip(chars: str) -> bool:
+        # advance past `chars`, reading more as needed; False at EOF
+        nonlocal buf, pos
+        while True:
+            pos = len(buf) - len(buf[pos:].lstrip(chars))
+            if pos < len(buf):
+                return True
+            more = f.read(snapshot.CHUNK)
+            if not more:
+                return False
+            buf += more
+
+    def value():
+        # the next JSON value, reading on until it is whole
+        nonlocal buf, pos
+        while True:
+            try:
+                v, pos = decode(buf, pos)
+                return v
+            except json.JSONDecodeError:
+                more = f.read(snapshot.CHUNK)
+                if not more:
+                    raise
+                buf += more
+
+    while skip(" \t\r\n,"):
+        if buf[pos] == "}":
+            return True, iter(())
+        key = value()
+        if not skip(" \t\r\n:"):
+            break
+        if key == "tasks":
+            if buf[pos] != "[":
+                raise ValueError('"tasks" is not an array')
+            return True, snapshot.iter_array(_Prefixed(buf[pos:], f))
+        value()   # some other member: skipped
+    raise ValueError("object is not terminated")
+
+
+def _format(wrapped: bool, rec: Optional[dict]) -> str:
+    if wrapped:
+        return "tasks1-store"
+    # an empty array is what a new tasks2/tasks3 store holds
+    return "tasks2" if rec is None or "id" in rec else "tasks1"
+
+
+def detect(path: Path) -> str:
+    """The format of a legacy data file (see FORMATS), by its layout and
+    first record; ValueError if it is none of them."""
+    if snapshot.format_of(path) != "json":
+        raise ValueError(f"{path}: not a tasks1/tasks2 data file")
+    with path.open("r", encoding="utf-8") as f:
+        try:
+            wrapped, records = _open_records(f)
+            return _format(wrapped, next(records, None))
+        except ValueError as e:
+            raise ValueError(f"{path}: not a tasks1/tasks2 data file ({e})") from None
+
+
+def normalize(raw: dict) -> Optional[dict]:
+    """A legacy record as a tasks3 record (id None when it had none), or
+    None if it is not a valid task."""
+    if not isinstance(raw, dict):
+        return None
+    title = raw.get("title", raw.get("text"))
+    tags = raw.get("tags") or []
+    if (not isinstance(title, str) or not title.strip()
+            or not isinstance(tags, list) or not all(isinstance(t, str) for t in tags)):
+        return None
+    try:
+        t = Task(str(raw.get("id") or ""), title.strip(), str(raw.get("description") or ""),
+                 raw.get("due") or None, raw.get("priority") or "medium", tags,
+                 bool(raw.get("completed")))
+    except (TypeError, ValueError):
+        return None   # a bad due date
+    rec = t.to_dict()
+    rec["id"] = rec["id"] or None
+    return rec
+
+
+def default_sources(data_dir: Path) -> List[Path]:
+    """The legacy files the earlier versions keep in `data_dir`: tasks.json
+    while it is still in a tasks1 format, and tasks2.json."""
+    out = []
+    for name, formats in (("tasks.json", ("tasks1", "tasks1-store")), ("tasks2.json", FORMATS)):
+        path = data_dir / name
+        try:
+            if detect(path) in formats:
+                out.append(path)
+        except (OSError, ValueError):
+            continue
+    return out
+
+
+def _discard(path: Path) -> None:
+    for p in (path, fsutil.lock_path(path), journal.journal_path(path)):
+        p.unlink(missing_ok=True)
+
+
+def _commit(staging: Path, target: Path, backup: Path) -> None:
+    # replace the legacy file `target` by the staging store, keeping the
+    # legacy file as `backup`: linked first, so it stays in place until the
+    # store is; renamed to `backup` after
+    pending = backup.with_name(backup.name + _STAGING_SUFFIX)
+    pending.unlink(missing_ok=True)
+    try:
+        os.link(target, pending)
+    except OSError:   # no hard links here
+        shutil.copy2(target, pending)
+    try:
+        with fsutil.locked(target):
+            os.replace(staging, target)
+    except BaseException:
+        pending.unlink(missing_ok=True)
+        raise
+    os.replace(pending, backup)
+
+
+def migrate(store: Backend, sources: List[Path]) -> Dict[str, dict]:
+    """Add the tasks of the legacy files `sources` to `store`, skipping ones
+    it already has.  Returns {source: {"format", "added", "duplicates",
+    "skipped", "kept"}}; "kept" names the copy of a legacy file that was
+    the store's own data file, set aside once the store has replaced it."""
+    target = store.path.resolve()
+    plan: List[Tuple[str, Path, str]] = []
+    for src in sources:
+        fmt = detect(src)
+        if src.resolve() == target and fmt == "tasks2":
+            raise ValueError(f"{src} is the store itself")
+        plan.append((str(src), src, fmt))
+    # a legacy file that is the store's own data file is migrated from
+    # where it is into a staging store, which then replaces it; the legacy
+    # file is only set aside (as LEGACY_SUFFIX) once that has committed
+    kept = {name: src.with_name(src.name + LEGACY_SUFFIX)
+            for name, src, _ in plan if src.resolve() == target}
+    dest = store
+    if kept:
+        from .filestore import FileBackend
+        dest = FileBackend(target.with_name(target.name + _STAGING_SUFFIX))
+        _discard(dest.path)   # left by a run that failed
+
+    contents, ids = _HashSet(), _HashSet()
+    stats: Dict[str, dict] = {}
+    try:
+        dest.init()
+        for t in dest.iter_tasks():
+            contents.add(content_hash(t.to_dict()))
+            ids.add(_hash(t.id, b"id"))
+
+        def fresh() -> Iterator[dict]:
+            for name, path, fmt in plan:
+                st = stats[name] = {"format": fmt, "added": 0, "duplicates": 0,
+                                    "skipped": 0, "kept": kept.get(name)}
+                with path.open("r", encoding="utf-8") as f:
+                    for raw in _open_records(f)[1]:
+                        rec = normalize(raw)
+                        if rec is None:
+                            st["skipped"] += 1
+                        elif not contents.add(content_hash(rec)):
+                            st["duplicates"] += 1
+                        else:
+                            while rec["id"] is None or not ids.add(_hash(rec["id"], b"id")):
+                                rec["id"] = os.urandom(4).hex()
+                            st["added"] += 1
+                            yield rec
+
+        dest.extend(fresh())
+        if kept:
+            _commit(dest.path, target, next(iter(kept.values())))
+    finally:
+        contents.close()
+        ids.close()
+        if kept:
+            _discard(dest.path)
+    return stats
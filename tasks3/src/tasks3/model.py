@@ -1,38 +1,114 @@
 from __future__ import annotations
-from dataclasses import dataclass, asdict
+import sys
 from datetime import date, datetime
-from typing import List, Optional
+from typing import Iterable, Iterator, List, Optional
 
 PRIORITIES = ("low", "medium", "high")
+_PRIORITY = {p: p for p in PRIORITIES}   # canonical (interned) priority strings
+_UNPARSED = object()
+
+def parse_due(due: str) -> int:
+    """YYYY-MM-DD -> date ordinal; raises ValueError like strptime."""
+    if len(due) == 10 and due[4] == due[7] == "-" and due.isascii():
+        y, m, d = due[:4], due[5:7], due[8:]
+        if y.isdigit() and m.isdigit() and d.isdigit():
+            return date(int(y), int(m), int(d)).toordinal()
+    return datetime.strptime(due, "%Y-%m-%d").toordinal()
+
+_FIELDS = ("id", "title", "description", "due", "priority", "tags", "completed")
 
-@dataclass
 class Task:
-    id: str
-    title: str
-    description: str = ""
-    due: Optional[str] = None        # ISO date: YYYY-MM-DD
-    priority: str = "medium"         # low | medium | high
-    tags: List[str] = None           # list of strings
-    completed: bool = False
-
-    def __post_init__(self):
-        if self.tags is None:
-            self.tags = []
-        if self.priority not in PRIORITIES:
-            self.priority = "medium"
-        if self.due:
+    # Written out rather than a slots dataclass: importing dataclasses costs
+    # more than the rest of a short CLI command's startup.
+    __slots__ = _FIELDS + ("_due_ord", "_due_src")
+
+    def __init__(
+        self,
+        id: str,
+        title: str,
+        description: str = "",
+        due: Optional[str] = None,   # ISO date: YYYY-MM-DD
+        priority: str = "medium",    # low | medium | high
+        tags: Optional[List[str]] = None,
+        completed: bool = False,
+    ):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.due = due
+        self.priority = _PRIORITY.get(priority, "medium")
+        self.tags = [sys.intern(t) for t in tags] if tags else []
+        self.completed = completed
+        # parsed `due`, valid while _due_src is the string it was parsed from
+        self._due_ord = None
+        if due:
             # validate format early
-            datetime.strptime(self.due, "%Y-%m-%d")
+            self._due_ord = parse_due(due)
+        self._due_src = due
+
+    def __repr__(self) -> str:
+        return "Task(" + ", ".join(f"{f}={getattr(self, f)!r}" for f in _FIELDS) + ")"
+
+    def _key(self) -> tuple:
+        return (self.id, self.title, self.description, self.due,
+                self.priority, self.tags, self.completed)
+
+    def __eq__(self, other: object) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._key() == other._key()
+
+    __hash__ = None   # mutable, so unhashable
+
+    @classmethod
+    def from_dicts(cls, raws: Iterable[dict]) -> List["Task"]:
+        """Build tasks from stored dicts, skipping __init__ validation.
+
+        The due date is parsed lazily, on the first date check.
+        """
+        return list(cls.iter_dicts(raws))
+
+    @classmethod
+    def iter_dicts(cls, raws: Iterable[dict]) -> Iterator["Task"]:
+        new = object.__new__
+        intern = sys.intern
+        for r in raws:
+            t = new(cls)
+            t.id = r["id"]
+            t.title = r["title"]
+            t.description = r.get("description", "")
+            t.due = r.get("due")
+            t.priority = _PRIORITY.get(r.get("priority"), "medium")
+            tags = r.get("tags")
+            t.tags = [intern(x) for x in tags] if tags else []
+            t.completed = r.get("completed", False)
+            t._due_ord = None
+            t._due_src = _UNPARSED
+            yield t
+
+    def due_ordinal(self) -> Optional[int]:
+        if self._due_src is not self.due:
+            self._due_ord = parse_due(self.due) if self.due else None
+            self._due_src = self.due
+        return self._due_ord
 
-    def is_overdue(self) -> bool:
+    def is_overdue(self, today: Optional[int] = None) -> bool:
         if self.completed or not self.due:
             return False
-        return date.today() > datetime.strptime(self.due, "%Y-%m-%d").date()
+        return (today or date.today().toordinal()) > self.due_ordinal()
 
-    def is_due_today(self) -> bool:
+    def is_due_today(self, today: Optional[int] = None) -> bool:
         if self.completed or not self.due:
             return False
-        return date.today() == datetime.strptime(self.due, "%Y-%m-%d").date()
+        return (today or date.today().toordinal()) == self.due_ordinal()
 
     def to_dict(self) -> dict:
-        return asdict(self)
+        return {
+            "id": self.id,
+            "title": self.title,
+            "description": self.description,
+            "due": self.due,
+            "priority": self.priority,
+            "tags": list(self.tags),
+            "completed": self.completed,
+        }
@@ -0,0 +1,112 @@
+from __future__ import annotations
+import io
+import json
+import re
+from operator import attrgetter
+from typing import Callable, Iterable, List, Optional, TextIO
+from . import instrument
+from .model import Task
+
+# How the CLI writes task listings.  "text" is the human format; the others
+# are for pipelines.  Lines are written in batches rather than one print()
+# per task.
+FORMATS = ("text", "jsonl", "tsv", "csv", "ids")
+FIELDS = ("id", "title", "description", "due", "priority", "tags", "completed")
+BATCH = 2048   # tasks per write
+
+
+def parse_fields(spec: str) -> List[str]:
+    fields = [f.strip() for f in spec.split(",") if f.strip()]
+    bad = [f for f in fields if f not in FIELDS]
+    if bad or not fields:
+        raise ValueError(f"unknown field(s) {', '.join(bad) or spec!r}; choose from {', '.join(FIELDS)}")
+    return fields
+
+
+def _text(t: Task) -> str:
+    return f"{t.id} :: {t.title} :: {t.tags} :: prio={t.priority} :: due={t.due} :: done={t.completed}\n"
+
+
+def _flat(v) -> str:
+    # a field value as one csv/tsv cell
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    if isinstance(v, list):
+        return ",".join(v)
+    return v
+
+
+_str = json.encoder.encode_basestring   # JSON string literal, non-ASCII kept
+_JSON_VALUE = {
+    "id": _str, "title": _str, "priority": _str,
+    "description": lambda v: _str(v or ""),
+    "due": lambda v: "null" if v is None else _str(v),
+    "tags": lambda v: "[" + ",".join(map(_str, v)) + "]",
+    "completed": lambda v: "true" if v else "false",
+}
+
+_TSV_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+_TSV_SPECIAL = re.compile(r"[\\\t\n\r]").search
+
+
+def _tsv(v) -> str:
+    s = _flat(v)
+    return s.translate(_TSV_ESCAPES) if _TSV_SPECIAL(s) else s
+
+
+def _getter(fields: List[str]) -> Callable[[Task], tuple]:
+    # attrgetter returns a bare value, not a 1-tuple, for a single field
+    get = attrgetter(*fields)
+    return (lambda t: (get(t),)) if len(fields) == 1 else get
+
+
+def _line_writer(fmt: str, fields: List[str]) -> Callable[[Task], str]:
+    get = _getter(fields)
+    if fmt == "text":
+        return _text
+    if fmt == "ids":
+        return lambda t: t.id + "\n"
+    if fmt == "jsonl":
+        # spelled out per field: much faster than json.dumps per task
+        keys = [f'"{f}":' for f in fields]
+        encs = [_JSON_VALUE[f] for f in fields]
+        return lambda t: "{" + ",".join([
+            k + enc(v) for k, enc, v in zip(keys, encs, get(t))
+        ]) + "}\n"
+    if fmt == "tsv":
+        return lambda t: "\t".join([_tsv(v) for v in get(t)]) + "\n"
+    raise ValueError(f"unknown format {fmt!r}")
+
+
+def write_tasks(tasks: Iterable[Task], out: TextIO, fmt: str = "text",
+                fields: Optional[List[str]] = None) -> int:
+    """Write `tasks` to `out` in `fmt`; returns how many were written."""
+    fields = fields or list(FIELDS)
+    write = instrument.timed("cli.write", out.write)
+    n = 0
+    if fmt == "csv":
+        import csv
+        buf = io.StringIO()
+        w = csv.writer(buf, lineterminator="\n")
+        w.writerow(fields)
+        get = _getter(fields)
+        for n, t in enumerate(tasks, 1):
+            w.writerow([_flat(v) for v in get(t)])
+            if n % BATCH == 0:
+                write(buf.getvalue())
+                buf.seek(0)
+                buf.truncate()
+        write(buf.getvalue())
+        return n
+    line = _line_writer(fmt, fields)
+    batch = ["\t".join(fields) + "\n"] if fmt == "tsv" else []
+    for n, t in enumerate(tasks, 1):
+        batch.append(line(t))
+        if len(batch) >= BATCH:
+            write("".join(batch))
+            batch.clear()
+    if batch:
+        write("".join(batch))
+    return n
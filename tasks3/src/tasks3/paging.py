@@ -0,0 +1,105 @@
+from __future__ import annotations
+import base64
+import heapq
+import json
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from .model import Task
+
+# Sorted and paginated views of a task stream.  A page of k tasks is picked
+# with a bounded heap while the stream goes by, so nothing beyond the page
+# is kept or sorted.  Cursors resume after the last task of a page (keyset
+# pagination), so deep pages cost the same as the first one.
+
+_RANK = {"high": 0, "medium": 1, "low": 2}
+
+
+def _due(t: Task) -> tuple:
+    d = t.due_ordinal() if t.due else None
+    return (1, 0) if d is None else (0, d)
+
+
+SORT_KEYS: Dict[str, Callable[[Task], tuple]] = {
+    "due": lambda t: (*_due(t), t.id),
+    "priority": lambda t: (_RANK[t.priority], *_due(t), t.id),
+    "title": lambda t: (t.title.lower(), t.id),
+}
+# the types in each sort key, which a cursor's key must have
+_KEY_TYPES: Dict[str, Tuple[type, ...]] = {
+    "due": (int, int, str),
+    "priority": (int, int, int, str),
+    "title": (str, str),
+}
+
+
+class CursorError(ValueError):
+    pass
+
+
+def encode_cursor(sort: Optional[str], key) -> str:
+    raw = json.dumps([sort, key], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: Optional[str]):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cur_sort, key = json.loads(raw)
+    except (ValueError, TypeError):
+        raise CursorError("malformed cursor") from None
+    if cur_sort != sort:
+        raise CursorError(f"cursor is for --sort {cur_sort or 'none'}")
+    if sort is None:
+        ok = _is(key, int) and key >= 0
+    else:
+        types = _KEY_TYPES[sort]
+        ok = (isinstance(key, list) and len(key) == len(types)
+              and all(_is(v, t) for v, t in zip(key, types)))
+    if not ok:
+        raise CursorError("malformed cursor")
+    return key
+
+
+def _is(v, t: type) -> bool:
+    # isinstance, but a bool is not an int here
+    return isinstance(v, t) and not isinstance(v, bool)
+
+
+def _tupled(x):
+    return tuple(_tupled(v) for v in x) if isinstance(x, list) else x
+
+
+def page(
+    tasks: Iterable[Task],
+    sort: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+) -> Tuple[List[Task], Optional[str]]:
+    """One page of `tasks` and the cursor for the next page (None when this
+    is the last one).  Without `sort` the store order is kept.
+
+    `offset` skips tasks from where the page would start: from the first
+    task, or from the `cursor` if one is given (the CLI takes only one of
+    the two)."""
+    if sort is None:
+        # store order: the cursor is the number of tasks already seen
+        start = offset + (decode_cursor(cursor, None) if cursor else 0)
+        stop = None if limit is None else start + limit + 1
+        got = list(islice(tasks, start, stop))
+        if limit is None or len(got) <= limit:
+            return got, None
+        return got[:limit], encode_cursor(None, start + limit)
+
+    key = SORT_KEYS[sort]
+    if cursor:
+        after = _tupled(decode_cursor(cursor, sort))
+        tasks = (t for t in tasks if key(t) > after)
+    if limit is None:
+        got = sorted(tasks, key=key)[offset:]
+        return got, None
+    got = heapq.nsmallest(offset + limit + 1, tasks, key=key)[offset:]
+    if len(got) <= limit:
+        return got, None
+    got = got[:limit]
+    return got, encode_cursor(sort, key(got[-1]))
@@ -0,0 +1,235 @@
+from __future__ import annotations
+import re
+from datetime import date
+from typing import Callable, List, NamedTuple, Optional, Set
+from .index import FieldIndex, TextIndex, text_fields
+from .model import PRIORITIES, _PRIORITY, parse_due
+
+# `tasks3 query` expressions: terms separated by spaces must all match, OR
+# separates alternatives, and a leading "-" (or NOT) negates a term.
+#
+#   open done overdue today      status words
+#   tag:work  prio:high          exact tag / priority
+#   due:2025-05-01  due<today    due date (=, <, <=, >, >=; due:none)
+#   id:1a2b3c4d
+#   report  "buy milk"  text:x   case-insensitive substring of title,
+#                                description or tags
+#
+# The expression compiles to one predicate over stored records, and to an
+# index plan giving candidate positions for the stores that have indexes.
+
+Record = dict
+Predicate = Callable[[Record], bool]
+
+
+class QueryError(ValueError):
+    pass
+
+
+class Term(NamedTuple):
+    kind: str       # open/done/overdue/today/tag/prio/due/id/text
+    op: str         # ":" or a comparison for due
+    value: object   # str, or a due ordinal (None for due:none)
+    negate: bool
+
+
+_TOKEN = re.compile(r'\s*(-?)(?:([a-z]+)(<=|>=|<|>|=|:))?(?:"([^"]*)"|([^\s"]+))')
+_STATUS = ("open", "done", "overdue", "today")
+_KEYS = {"tag": "tag", "prio": "prio", "priority": "prio", "due": "due", "id": "id", "text": "text"}
+_ORDER = {"open": 0, "done": 0, "prio": 1, "id": 1, "tag": 2, "overdue": 3, "today": 3, "due": 3, "text": 4}
+
+
+def _due_value(s: str, today: int) -> Optional[int]:
+    if s == "none":
+        return None
+    if s == "today":
+        return today
+    try:
+        return parse_due(s)
+    except ValueError:
+        raise QueryError(f"bad date {s!r} (expected YYYY-MM-DD, today or none)") from None
+
+
+def parse(text: str, today: int) -> List[List[Term]]:
+    """The query as alternatives (OR) of conjunctions (AND) of terms."""
+    clauses: List[List[Term]] = [[]]
+    negate_next = False
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if m is None:
+            raise QueryError(f"cannot parse {text[pos:].strip()!r}")
+        pos = m.end()
+        neg, key, op, quoted, bare = m.groups()
+        value = quoted if quoted is not None else bare
+        if quoted is None and not key and not neg:
+            if bare == "OR":
+                if not clauses[-1] or negate_next:
+                    raise QueryError("OR needs a term on each side")
+                clauses.append([])
+                continue
+            if bare == "AND":
+                continue
+            if bare == "NOT":
+                negate_next = not negate_next
+                continue
+        if key:
+            kind = _KEYS.get(key)
+            if kind is None:
+                raise QueryError(f"unknown field {key!r}")
+            if op not in (":", "=") and kind != "due":
+                raise QueryError(f"{key} only supports ':'")
+        elif quoted is None and bare in _STATUS:
+            kind, op = bare, ":"
+        else:
+            kind, op = "text", ":"
+        if kind == "due":
+            value = _due_value(value, today)
+            if value is None and op not in (":", "="):
+                raise QueryError("due:none cannot be compared")
+        elif kind == "prio" and value not in PRIORITIES:
+            raise QueryError(f"unknown priority {value!r}")
+        elif kind == "text":
+            value = value.lower()
+        clauses[-1].append(Term(kind, op, value, bool(neg) != negate_next))
+        negate_next = False
+    if negate_next:
+        raise QueryError("NOT needs a term after it")
+    if not clauses[-1] and len(clauses) > 1:
+        raise QueryError("OR needs a term on each side")
+    return clauses
+
+
+def _due_test(op: str, ref: Optional[int]) -> Callable[[Optional[int]], bool]:
+    if ref is None:
+        return lambda d: d is None
+    if op in (":", "="):
+        return lambda d: d == ref
+    if op == "<":
+        return lambda d: d is not None and d < ref
+    if op == "<=":
+        return lambda d: d is not None and d <= ref
+    if op == ">":
+        return lambda d: d is not None and d > ref
+    return lambda d: d is not None and d >= ref
+
+
+def _due_of(rec: Record) -> Optional[int]:
+    due = rec.get("due")
+    return parse_due(due) if due else None
+
+
+def _term_predicate(t: Term, today: int) -> Predicate:
+    kind, v = t.kind, t.value
+    if kind == "open":
+        p = lambda r: not r.get("completed")
+    elif kind == "done":
+        p = lambda r: bool(r.get("completed"))
+    elif kind == "overdue":
+        p = lambda r: not r.get("completed") and bool(r.get("due")) and _due_of(r) < today
+    elif kind == "today":
+        p = lambda r: not r.get("completed") and bool(r.get("due")) and _due_of(r) == today
+    elif kind == "tag":
+        p = lambda r: v in (r.get("tags") or ())
+    elif kind == "prio":
+        p = lambda r: _PRIORITY.get(r.get("priority"), "medium") == v
+    elif kind == "id":
+        p = lambda r: r["id"] == v
+    elif kind == "due":
+        test = _due_test(t.op, v)
+        p = lambda r: test(_due_of(r))
+    else:
+        p = lambda r: any(v in part for part in text_fields(r))
+    if t.negate:
+        return lambda r, p=p: not p(r)
+    return p
+
+
+def _all(preds: List[Predicate]) -> Predicate:
+    if not preds:
+        return lambda r: True
+    if len(preds) == 1:
+        return preds[0]
+    first, rest = preds[0], _all(preds[1:])
+    return lambda r: first(r) and rest(r)
+
+
+def _any(preds: List[Predicate]) -> Predicate:
+    if len(preds) == 1:
+        return preds[0]
+    first, rest = preds[0], _any(preds[1:])
+    return lambda r: first(r) or rest(r)
+
+
+class Query:
+    """A parsed query: `match` decides a stored record, `candidates` narrows
+    the positions to check using a store's indexes."""
+
+    def __init__(self, text: str, today: Optional[int] = None):
+        self.text = text
+        self.today = today or date.today().toordinal()
+        # cheap, selective checks first
+        self.clauses = [sorted(c, key=lambda t: (t.negate, _ORDER[t.kind]))
+                        for c in parse(text, self.today)]
+        self.match: Predicate = _any([
+            _all([_term_predicate(t, self.today) for t in c]) for c in self.clauses
+        ])
+
+    def indexes(self) -> Set[type]:
+        """The index classes the plan would use."""
+        need = set()
+        for c in self.clauses:
+            for t in c:
+                if t.negate or t.kind == "id" or (t.kind == "due" and t.value is None):
+                    continue
+                if t.kind == "text":
+                    if len(t.value) >= 3:
+                        need.add(TextIndex)
+                else:
+                    need.add(FieldIndex)
+        return need
+
+    def _term_positions(self, t: Term, text: Optional[TextIndex],
+                        fields: Optional[FieldIndex]) -> Optional[Set[int]]:
+        if t.negate:
+            return None
+        if t.kind == "text":
+            return None if text is None else text.candidates(t.value)
+        if fields is None or t.kind == "id":
+            return None
+        if t.kind == "tag":
+            return set(fields.tags.get(t.value, ()))
+        if t.kind == "prio":
+            return set(fields.priority.get(t.value, ()))
+        if t.kind == "due":
+            if t.value is None:
+                return None
+            lo, hi = {
+                ":": (t.value, t.value + 1), "=": (t.value, t.value + 1),
+                "<": (-1, t.value), "<=": (-1, t.value + 1),
+                ">": (t.value + 1, 1 << 30), ">=": (t.value, 1 << 30),
+            }[t.op]
+            return set(fields.due_between(lo, hi))
+        return set(fields.lookup(t.kind, None, self.today))
+
+    def candidates(self, text: Optional[TextIndex] = None,
+                   fields: Optional[FieldIndex] = None) -> Optional[Set[int]]:
+        """Positions that may match, or None when the indexes cannot narrow
+        the query down (every position must be checked)."""
+        out: Set[int] = set()
+        for c in self.clauses:
+            hits = None
+            for t in sorted(c, key=lambda t: t.kind in ("open", "done")):
+                if hits is not None and t.kind in ("open", "done"):
+                    break  # half the store; the predicate checks it cheaper
+                got = self._term_positions(t, text, fields)
+                if got is None:
+                    continue
+                hits = got if hits is None else hits & got
+                if not hits:
+                    break
+            if hits is None:
+                return None
+            out |= hits
+        return out
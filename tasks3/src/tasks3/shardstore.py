@@ -0,0 +1,195 @@
+from __future__ import annotations
+import heapq
+import json
+import os
+import zlib
+from concurrent.futures import Executor, ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from . import fsutil, instrument
+from .backend import Backend
+from .filestore import FileBackend
+from .index import merge_stats
+from .model import Task
+
+# A sharded store is a directory of journaled JSON stores, shard-000.json
+# and so on, each with its own journal and sidecar indexes.  Tasks go to
+# the shard picked by a hash of their id, so a write touches one shard.
+# Searches and filters scan the shards in parallel worker processes once
+# the store is big enough to pay for them.
+META_NAME = "shards.json"
+DEFAULT_SHARDS = 8
+PARALLEL_BYTES = 4 << 20   # scan in-process below this many snapshot bytes
+
+
+def _cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def shard_of(task_id: str, count: int) -> int:
+    return zlib.crc32(task_id.encode("utf-8")) % count
+
+
+# Worker entry points: they get a shard path and return matching records
+# as dicts, which pickle much faster than Task objects.
+
+def _search_shard(path: str, query: str) -> List[dict]:
+    return [t.to_dict() for t in FileBackend(Path(path)).iter_search(query)]
+
+
+def _filter_shard(path: str, mode: str, value: Optional[str]) -> List[dict]:
+    return [t.to_dict() for t in FileBackend(Path(path)).iter_filter(mode, value)]
+
+
+def _query_shard(path: str, text: str, today: int) -> List[dict]:
+    from .query import Query
+    q = Query(text, today)
+    return [t.to_dict() for t in FileBackend(Path(path)).iter_query(q)]
+
+
+class ShardedBackend(Backend):
+    """A directory of FileBackend shards partitioned by id hash."""
+
+    def __init__(self, path: Path, count: Optional[int] = None):
+        super().__init__(path)
+        self._count = count
+        self._shards: Optional[List[FileBackend]] = None
+        self._pool: Optional[Executor] = None
+
+    @property
+    def shards(self) -> List[FileBackend]:
+        if self._shards is None:
+            self.init()
+        return self._shards
+
+    def init(self) -> None:
+        if self._shards is not None:
+            return
+        meta = self.path / META_NAME
+        if not meta.exists():
+            # another process may be creating it too: the first one wins
+            self.path.mkdir(parents=True, exist_ok=True)
+            meta_data = {"count": self._count or DEFAULT_SHARDS, "by": "id"}
+            fsutil.create(meta, json.dumps(meta_data).encode("utf-8"))
+        count = json.loads(meta.read_text(encoding="utf-8"))["count"]
+        self._shards = [FileBackend(self.path / f"shard-{i:03d}.json") for i in range(count)]
+        for s in self._shards:
+            s.init()
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _owner(self, task_id: str) -> FileBackend:
+        shards = self.shards
+        return shards[shard_of(task_id, len(shards))]
+
+    def iter_tasks(self) -> Iterator[Task]:
+        for s in self.shards:
+            yield from s.iter_tasks()
+
+    def save_all(self, tasks: List[Task]) -> None:
+        parts: List[List[Task]] = [[] for _ in self.shards]
+        for t in tasks:
+            parts[shard_of(t.id, len(parts))].append(t)
+        for s, part in zip(self.shards, parts):
+            s.save_all(part)
+
+    def compact(self) -> None:
+        for s in self.shards:
+            s.compact()
+
+    def convert(self, fmt: Optional[str]) -> None:
+        for s in self.shards:
+            s.convert(fmt)
+
+    def add(self, task: Task) -> None:
+        self._owner(task.id).add(task)
+
+    def complete(self, task_id: str) -> bool:
+        return self._owner(task_id).complete(task_id)
+
+    def get(self, task_id: str) -> Optional[Task]:
+        return self._owner(task_id).get(task_id)
+
+    def apply(self, ops: List[dict]) -> None:
+        parts: Dict[int, List[dict]] = {}
+        n = len(self.shards)
+        for op in ops:
+            tid = op["task"]["id"] if op["op"] == "add" else op["id"]
+            parts.setdefault(shard_of(tid, n), []).append(op)
+        for i, part in sorted(parts.items()):
+            self.shards[i].apply(part)
+
+    def extend(self, records: Iterable[dict], batch: int = 10000) -> None:
+        # spool the records by shard, then stream each shard's share in
+        import tempfile
+        shards = self.shards
+        spools = [tempfile.TemporaryFile("w+", encoding="utf-8") for _ in shards]
+        try:
+            for rec in records:
+                spool = spools[shard_of(rec["id"], len(shards))]
+                spool.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            for s, spool in zip(shards, spools):
+                if spool.tell():
+                    spool.seek(0)
+                    s.extend((json.loads(line) for line in spool), batch)
+        finally:
+            for spool in spools:
+                spool.close()
+
+    def states(self) -> Dict[str, bool]:
+        out: Dict[str, bool] = {}
+        for s in self.shards:
+            out.update(s.states())
+        return out
+
+    def files(self) -> List[Path]:
+        return [f for s in self.shards for f in s.files()]
+
+    def _scan(self, local: Callable[[FileBackend], Iterator[Task]],
+              remote: Callable[..., List[dict]], *args) -> Iterator[Task]:
+        # results come back shard by shard, so the order is stable
+        shards = self.shards
+        workers = min(len(shards), _cpus())
+        if workers < 2 or self._snapshot_bytes() < PARALLEL_BYTES:
+            for s in shards:
+                yield from local(s)
+            return
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(workers)
+        futures = [self._pool.submit(remote, str(s.path), *args) for s in shards]
+        for fut in futures:
+            with instrument.span("shard.wait"):
+                recs = fut.result()
+            yield from Task.iter_dicts(recs)
+
+    def _snapshot_bytes(self) -> int:
+        total = 0
+        for s in self.shards:
+            try:
+                total += s.path.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def ranked(self, query: str, limit: int = 20, fuzzy: int = 0) -> List[Tuple[float, Task]]:
+        # score every shard with the statistics of the whole store, so the
+        # ranking is the one a single file would give
+        rankers = [s.ranker() for s in self.shards]
+        stats = merge_stats(idx.stats(query, fuzzy) for idx, _ in rankers)
+        hits = [h for idx, fetch in rankers for h in fetch(idx.top(query, limit, fuzzy, stats))]
+        return heapq.nlargest(limit, hits, key=lambda h: h[0])
+
+    def iter_search(self, query: str) -> Iterator[Task]:
+        return self._scan(lambda s: s.iter_search(query), _search_shard, query)
+
+    def iter_filter(self, mode: str, value: Optional[str] = None) -> Iterator[Task]:
+        return self._scan(lambda s: s.iter_filter(mode, value), _filter_shard, mode, value)
+
+    def iter_query(self, query) -> Iterator[Task]:
+        return self._scan(lambda s: s.iter_query(query), _query_shard, query.text, query.today)
@@ -0,0 +1,242 @@
+from __future__ import annotations
+import io
+import json
+import os
+from itertools import islice
+from pathlib import Path
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple
+from . import fsutil, instrument
+
+# The snapshot is the data file itself.  It is either a JSON array of task
+# dicts (the original format) or a columnar document: one array per field,
+# priorities and tags dictionary-encoded, behind a one-line header naming
+# the compression.  load() and iter_load() tell them apart by the header;
+# dump() keeps the format a file already has.  The *_stat variants also
+# give the stat of the file the records came from, taken on the open handle,
+# for stamping indexes built from them.
+CHUNK = 1 << 16
+_WS = " \t\r\n"
+FORMATS = ("json", "columnar", "columnar-zlib", "columnar-lzma")
+_MAGIC = b"TASKS3-COLUMNAR 1 "
+_FIELDS = ("id", "title", "description", "due", "priority", "tags", "completed")
+
+
+def _codec(name: str):
+    if name == "zlib":
+        import zlib
+        return zlib
+    if name == "lzma":
+        import lzma
+        return lzma
+    return None
+
+
+def format_of(path: Path) -> Optional[str]:
+    """The snapshot format of `path`, or None if it does not exist."""
+    try:
+        with path.open("rb") as f:
+            head = f.readline(64)
+    except FileNotFoundError:
+        return None
+    return head_format(head)
+
+
+def head_format(head: bytes) -> str:
+    """The snapshot format of a file starting with `head` (its first line)."""
+    if not head.startswith(_MAGIC):
+        return "json"
+    comp = head[len(_MAGIC):].split(b"\n", 1)[0].strip().decode("ascii")
+    return "columnar" if comp == "none" else f"columnar-{comp}"
+
+
+def _encode_columns(records: List[dict]) -> dict:
+    prios: Dict[str, int] = {}
+    tag_codes: Dict[str, int] = {}
+    cols = {"id": [], "title": [], "description": [], "due": [],
+            "priority": [], "tag_counts": [], "tags": []}
+    done = []
+    raw = {}
+    for i, r in enumerate(records):
+        if (tuple(r) != _FIELDS or not isinstance(r["completed"], bool)
+                or not isinstance(r["priority"], str) or not isinstance(r["tags"], list)):
+            raw[i] = r  # not the usual shape: kept as is
+            continue
+        cols["id"].append(r["id"])
+        cols["title"].append(r["title"])
+        cols["description"].append(r["description"])
+        cols["due"].append(r["due"])
+        cols["priority"].append(prios.setdefault(r["priority"], len(prios)))
+        tags = r["tags"]
+        cols["tag_counts"].append(len(tags))
+        cols["tags"].extend(tag_codes.setdefault(t, len(tag_codes)) for t in tags)
+        done.append("1" if r["completed"] else "0")
+    return {"count": len(records), "priorities": list(prios), "tag_names": list(tag_codes),
+            **cols, "completed": "".join(done), "raw": {str(i): r for i, r in raw.items()}}
+
+
+def _iter_columns(doc: dict) -> Iterator[dict]:
+    prios, names = doc["priorities"], doc["tag_names"]
+    raw = {int(i): r for i, r in doc["raw"].items()}
+    tags, t = doc["tags"], 0
+    cols = zip(doc["id"], doc["title"], doc["description"], doc["due"],
+               doc["priority"], doc["tag_counts"], doc["completed"])
+    for i in range(doc["count"]):
+        if i in raw:
+            yield raw[i]
+            continue
+        tid, title, desc, due, prio, k, done = next(cols)
+        yield {"id": tid, "title": title, "description": desc, "due": due,
+               "priority": prios[prio], "tags": [names[c] for c in tags[t:t + k]],
+               "completed": done == "1"}
+        t += k
+
+
+def _decode_columnar(data: bytes) -> dict:
+    head, _, body = data.partition(b"\n")
+    codec = _codec(head[len(_MAGIC):].strip().decode("ascii"))
+    with instrument.span("snapshot.decode"):
+        if codec is not None:
+            body = codec.decompress(body)
+        return json.loads(body)
+
+
+def load(path: Path) -> List[dict]:
+    return load_stat(path)[0]
+
+
+def load_stat(path: Path) -> Tuple[List[dict], os.stat_result]:
+    """The records of `path` and the stat of the file they were read from."""
+    with instrument.span("snapshot.read"):
+        with path.open("rb") as f:
+            st = os.fstat(f.fileno())
+            data = f.read()
+    instrument.count("bytes.read", len(data))
+    if data.startswith(_MAGIC):
+        doc = _decode_columnar(data)
+        with instrument.span("snapshot.decode"):
+            records = list(_iter_columns(doc))
+    else:
+        with instrument.span("snapshot.decode"):
+            records = json.loads(data)
+    instrument.count("records.scanned", len(records))
+    return records, st
+
+
+def dump(path: Path, records: List[dict], fmt: Optional[str] = None) -> os.stat_result:
+    """Write `records` in `fmt`, by default the format `path` already has
+    (JSON for a new file).  The file is replaced atomically; returns the
+    stat of the new one."""
+    fmt = fmt or format_of(path) or "json"
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown snapshot format {fmt!r}")
+    with instrument.span("snapshot.encode"):
+        if fmt == "json":
+            data = json.dumps(records, indent=2, ensure_ascii=False).encode("utf-8")
+        else:
+            comp = fmt.partition("-")[2] or "none"
+            body = json.dumps(_encode_columns(records), separators=(",", ":"),
+                              ensure_ascii=False).encode("utf-8")
+            codec = _codec(comp)
+            if codec is not None:
+                body = codec.compress(body)
+            data = _MAGIC + comp.encode("ascii") + b"\n" + body
+    with instrument.span("snapshot.write"):
+        st = fsutil.write_atomic(path, data)
+    instrument.count("bytes.written", len(data))
+    return st
+
+
+def dump_iter(path: Path, records: Iterable[dict], batch: int = 1000) -> int:
+    """Write `records` as a JSON snapshot while they are produced, the same
+    bytes as dump() without holding them all; returns how many there were.
+    The file is replaced atomically."""
+    n = 0
+    it = iter(records)
+    with fsutil.replacing(path) as f:
+        # encoded `batch` at a time: json.dumps sets up its indenting
+        # encoder per call, which costs more than one small record
+        while True:
+            chunk = list(islice(it, batch))
+            if not chunk:
+                break
+            raw = json.dumps(chunk, indent=2, ensure_ascii=False)[1:-2]   # "\n  {...},\n  {...}"
+            f.write((b"[" if n == 0 else b",") + raw.encode("utf-8"))
+            n += len(chunk)
+        f.write(b"\n]" if n else b"[]")
+        instrument.count("bytes.written", f.tell())
+    return n
+
+
+def iter_array(f: IO[str], chunk: int = CHUNK) -> Iterator[dict]:
+    """Decode a JSON array of objects one element at a time."""
+    decode = instrument.timed("snapshot.decode", json.JSONDecoder().raw_decode)
+    read = instrument.timed("snapshot.read", f.read)
+    buf, pos, eof = "", 0, False
+
+    def skip(chars: str) -> bool:
+        # advance past `chars`, reading more input as needed; False at EOF
+        nonlocal buf, pos, eof
+        while True:
+            while pos < len(buf) and buf[pos] in chars:
+                pos += 1
+            if pos < len(buf):
+                return True
+            if eof:
+                return False
+            buf, pos = read(chunk), 0
+            eof = not buf
+
+    if not skip(_WS) or buf[pos] != "[":
+        raise ValueError("snapshot is not a JSON array")
+    pos += 1
+    while skip(_WS + ","):
+        if buf[pos] == "]":
+            return
+        try:
+            obj, end = decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            more = read(chunk)
+            eof = not more
+            buf, pos = buf[pos:] + more, 0
+            continue
+        yield obj
+        pos = end
+    raise ValueError("snapshot array is not terminated")
+
+
+def iter_load(path: Path) -> Iterator[dict]:
+    return iter_load_stat(path)[1]
+
+
+def iter_load_stat(path: Path) -> Tuple[os.stat_result, Iterator[dict]]:
+    """The stat of `path` and its records, decoded as they are consumed
+    from the file that was open when this was called."""
+    f = path.open("rb")
+    try:
+        st = os.fstat(f.fileno())
+        head = f.read(len(_MAGIC))
+    except BaseException:
+        f.close()
+        raise
+    return st, _iter_file(f, st, head == _MAGIC)
+
+
+def _iter_file(f: IO[bytes], st: os.stat_result, columnar: bool) -> Iterator[dict]:
+    n = 0
+    try:
+        with f:
+            instrument.count("bytes.read", st.st_size)
+            if columnar:
+                # the columns are decoded whole; records are still made one at a time
+                with instrument.span("snapshot.read"):
+                    data = _MAGIC + f.read()
+                for n, rec in enumerate(_iter_columns(_decode_columnar(data)), 1):
+                    yield rec
+                return
+            f.seek(0)
+            for n, rec in enumerate(iter_array(io.TextIOWrapper(f, encoding="utf-8")), 1):
+                yield rec
+    finally:
+        instrument.count("records.scanned", n)
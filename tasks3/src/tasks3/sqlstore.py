@@ -0,0 +1,243 @@
+from __future__ import annotations
+import json
+import sqlite3
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from . import instrument
+from .backend import Backend
+from .index import text_fields
+from .model import Task, parse_due
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    seq         INTEGER PRIMARY KEY AUTOINCREMENT,  -- insertion order
+    id          TEXT NOT NULL UNIQUE,
+    title       TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    due         TEXT,
+    due_ord     INTEGER,
+    priority    TEXT NOT NULL,
+    tags        TEXT NOT NULL DEFAULT '[]',         -- JSON list, as stored
+    tag_text    TEXT NOT NULL DEFAULT '',           -- tags joined, for FTS
+    completed   INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS task_tags (
+    seq INTEGER NOT NULL REFERENCES tasks(seq) ON DELETE CASCADE,
+    tag TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS task_tags_tag ON task_tags(tag, seq);
+CREATE INDEX IF NOT EXISTS tasks_priority ON tasks(priority, seq);
+CREATE INDEX IF NOT EXISTS tasks_completed ON tasks(completed, seq);
+CREATE INDEX IF NOT EXISTS tasks_open_due ON tasks(due_ord) WHERE completed = 0;
+CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+    title, description, tag_text,
+    content='tasks', content_rowid='seq', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS tasks_fts_ins AFTER INSERT ON tasks BEGIN
+    INSERT INTO tasks_fts(rowid, title, description, tag_text)
+    VALUES (new.seq, new.title, new.description, new.tag_text);
+END;
+CREATE TRIGGER IF NOT EXISTS tasks_fts_del AFTER DELETE ON tasks BEGIN
+    INSERT INTO tasks_fts(tasks_fts, rowid, title, description, tag_text)
+    VALUES ('delete', old.seq, old.title, old.description, old.tag_text);
+END;
+CREATE TRIGGER IF NOT EXISTS tasks_fts_upd AFTER UPDATE OF title, description, tag_text ON tasks BEGIN
+    INSERT INTO tasks_fts(tasks_fts, rowid, title, description, tag_text)
+    VALUES ('delete', old.seq, old.title, old.description, old.tag_text);
+    INSERT INTO tasks_fts(rowid, title, description, tag_text)
+    VALUES (new.seq, new.title, new.description, new.tag_text);
+END;
+"""
+
+_COLS = "id, title, description, due, priority, tags, completed"
+
+
+def _row(t: Task) -> tuple:
+    return (
+        t.id, t.title, t.description, t.due,
+        parse_due(t.due) if t.due else None,
+        t.priority, json.dumps(t.tags, ensure_ascii=False),
+        "\n".join(t.tags), int(t.completed),
+    )
+
+
+def _record(row: tuple) -> dict:
+    tid, title, desc, due, prio, tags, done = row
+    return {
+        "id": tid, "title": title, "description": desc, "due": due,
+        "priority": prio, "tags": json.loads(tags), "completed": bool(done),
+    }
+
+
+def _term_sql(t) -> Optional[Tuple[str, tuple]]:
+    # an indexed condition implied by a positive query term, if any
+    if t.negate:
+        return None
+    if t.kind in ("open", "done"):
+        return "completed = ?", (int(t.kind == "done"),)
+    if t.kind in ("overdue", "today"):
+        return f"completed = 0 AND due_ord {'<' if t.kind == 'overdue' else '='} ?", (None,)
+    if t.kind == "tag":
+        return "seq IN (SELECT seq FROM task_tags WHERE tag = ?)", (t.value,)
+    if t.kind == "prio":
+        return "priority = ?", (t.value,)
+    if t.kind == "id":
+        return "id = ?", (t.value,)
+    if t.kind == "due":
+        if t.value is None:
+            return "due_ord IS NULL", ()
+        return f"due_ord {'=' if t.op == ':' else t.op} ?", (t.value,)
+    if len(t.value) >= 3 and t.value.isascii():
+        phrase = '"' + t.value.replace('"', '""') + '"'
+        return "seq IN (SELECT rowid FROM tasks_fts WHERE tasks_fts MATCH ?)", (phrase,)
+    return None
+
+
+class SqliteBackend(Backend):
+    """Tasks in a SQLite database (WAL mode) with indexes for every filter
+    mode and an FTS5 trigram table for search."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def init(self) -> None:
+        self.conn
+
+    def _tasks(self, sql: str, params: Iterable = ()) -> Iterator[Task]:
+        rows = instrument.timed("sqlite.query", self.conn.execute)(sql, tuple(params))
+        rows = instrument.timed_iter("sqlite.fetch", rows)
+        return instrument.timed_iter("task.build", Task.iter_dicts(_record(r) for r in rows))
+
+    def iter_tasks(self) -> Iterator[Task]:
+        return self._tasks(f"SELECT {_COLS} FROM tasks ORDER BY seq")
+
+    def _insert(self, tasks: Iterable[Task]) -> None:
+        conn = self.conn
+        for t in tasks:
+            cur = conn.execute(
+                "INSERT INTO tasks (id, title, description, due, due_ord, priority,"
+                " tags, tag_text, completed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                _row(t),
+            )
+            conn.executemany(
+                "INSERT INTO task_tags (seq, tag) VALUES (?, ?)",
+                [(cur.lastrowid, tag) for tag in t.tags],
+            )
+
+    def save_all(self, tasks: List[Task]) -> None:
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("DELETE FROM tasks")
+            self._insert(tasks)
+
+    def add(self, task: Task) -> None:
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._insert((task,))
+
+    def complete(self, task_id: str) -> bool:
+        with self.conn:
+            cur = self.conn.execute("UPDATE tasks SET completed = 1 WHERE id = ?", (task_id,))
+        return cur.rowcount > 0
+
+    def apply(self, ops: List[dict]) -> None:
+        # one transaction for the whole batch
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._insert(Task.from_dicts(op["task"] for op in ops if op["op"] == "add"))
+            self.conn.executemany(
+                "UPDATE tasks SET completed = 1 WHERE id = ?",
+                [(op["id"],) for op in ops if op["op"] == "complete"],
+            )
+
+    def get(self, task_id: str) -> Optional[Task]:
+        return next(self._tasks(f"SELECT {_COLS} FROM tasks WHERE id = ?", (task_id,)), None)
+
+    def states(self) -> Dict[str, bool]:
+        return {tid: bool(done) for tid, done in self.conn.execute("SELECT id, completed FROM tasks")}
+
+    def files(self) -> List[Path]:
+        return [self.path, self.path.with_name(self.path.name + "-wal")]
+
+    def compact(self) -> None:
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def iter_search(self, query: str) -> Iterator[Task]:
+        q = query.lower()
+        if len(q) >= 3 and q.isascii():
+            # the trigram table narrows the candidates; the substring check
+            # below keeps the results identical to the JSON store's
+            phrase = '"' + q.replace('"', '""') + '"'
+            tasks = self._tasks(
+                f"SELECT {_COLS} FROM tasks WHERE seq IN"
+                " (SELECT rowid FROM tasks_fts WHERE tasks_fts MATCH ?) ORDER BY seq",
+                (phrase,),
+            )
+        else:
+            tasks = self.iter_tasks()
+        for t in tasks:
+            if any(q in part for part in text_fields(t.to_dict())):
+                yield t
+
+    def iter_query(self, query) -> Iterator[Task]:
+        # narrow with whatever each alternative implies, then let the
+        # compiled predicate decide, as the other stores do
+        where, params = [], []
+        for clause in query.clauses:
+            conds = [c for c in map(_term_sql, clause) if c is not None]
+            if not conds:
+                # an alternative the table cannot narrow: every row
+                where, params = None, []
+                break
+            where.append(" AND ".join(f"({sql})" for sql, _ in conds))
+            for _, ps in conds:
+                params.extend(query.today if p is None else p for p in ps)
+        sql = f"SELECT {_COLS} FROM tasks"
+        if where:
+            sql += " WHERE " + " OR ".join(f"({w})" for w in where)
+        rows = instrument.timed("sqlite.query", self.conn.execute)(sql + " ORDER BY seq", params)
+        match = query.match
+        records = (_record(r) for r in instrument.timed_iter("sqlite.fetch", rows))
+        return instrument.timed_iter("task.build", Task.iter_dicts(r for r in records if match(r)))
+
+    def iter_filter(self, mode: str, value: Optional[str] = None) -> Iterator[Task]:
+        today = date.today().toordinal()
+        if mode == "overdue":
+            return self._tasks(
+                f"SELECT {_COLS} FROM tasks WHERE completed = 0 AND due_ord < ? ORDER BY seq",
+                (today,))
+        if mode == "today":
+            return self._tasks(
+                f"SELECT {_COLS} FROM tasks WHERE completed = 0 AND due_ord = ? ORDER BY seq",
+                (today,))
+        if mode == "priority" and value:
+            return self._tasks(
+                f"SELECT {_COLS} FROM tasks WHERE priority = ? ORDER BY seq", (value,))
+        if mode == "tag" and value:
+            return self._tasks(
+                f"SELECT {_COLS} FROM tasks WHERE seq IN"
+                " (SELECT seq FROM task_tags WHERE tag = ?) ORDER BY seq", (value,))
+        if mode in ("open", "done"):
+            return self._tasks(
+                f"SELECT {_COLS} FROM tasks WHERE completed = ? ORDER BY seq",
+                (int(mode == "done"),))
+        return self.iter_tasks()
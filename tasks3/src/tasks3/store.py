@@ -1,28 +1,94 @@
 from __future__ import annotations
-import json
-import uuid
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional
+from .backend import Backend, open_backend
+from .memstore import MemoryBackend
 from .model import Task, PRIORITIES
 
+# The functions below are the store API; the backend (journaled JSON file or
+# SQLite database) is picked from the data file's extension.
+#
+# Parsed stores are kept in memory between calls, most recently used first,
+# and revalidated on each call against the files' (inode, size, mtime_ns).
+# Writes go straight to disk; they update the cached copy of a store that
+# has one, but never load a store just to write to it.  Not thread-safe;
+# set_cache_size(0) turns the cache off.
+CACHE_SIZE = 8
+_cache: "OrderedDict[Path, MemoryBackend]" = OrderedDict()
+
+def set_cache_size(n: int) -> None:
+    global CACHE_SIZE
+    CACHE_SIZE = n
+    _evict()
+
+def clear_cache() -> None:
+    while _cache:
+        _cache.popitem(last=False)[1].close()
+
+def _evict() -> None:
+    while len(_cache) > max(CACHE_SIZE, 0):
+        _cache.popitem(last=False)[1].close()
+
+def _cached(path: Path) -> MemoryBackend:
+    key = Path(path).absolute()
+    b = _cache.get(key)
+    if b is None:
+        b = _cache[key] = MemoryBackend(open_backend(path))
+        _evict()
+    else:
+        _cache.move_to_end(key)
+        b.refresh()
+    return b
+
+@contextmanager
+def _open(path: Path, write: bool = False) -> Iterator[Backend]:
+    # write: the cached copy if there is one, else the backend itself
+    if CACHE_SIZE <= 0 or (write and Path(path).absolute() not in _cache):
+        with open_backend(path) as b:
+            yield b
+        return
+    b = _cached(path)
+    try:
+        yield b
+    finally:
+        b.flush()
+
 def init_store(path: Path) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    if not path.exists():
-        path.write_text("[]", encoding="utf-8")
+    with _open(path, write=True) as b:
+        b.init()
+
+def load_all(path: Path, view: bool = False) -> List[Task]:
+    """All tasks.  With view=True and the cache on, the Task objects are
+    shared with the cache (and later callers) and must not be modified."""
+    with _open(path) as b:
+        if view and isinstance(b, MemoryBackend):
+            return b.view()
+        return b.load_all()
 
-def load_all(path: Path) -> List[Task]:
-    init_store(path)
-    raw = json.loads(path.read_text(encoding="utf-8"))
-    return [Task(**t) for t in raw]
+def iter_tasks(path: Path) -> Iterator[Task]:
+    """Like load_all, but decodes the store incrementally."""
+    with _open(path) as b:
+        yield from b.iter_tasks()
 
 def save_all(path: Path, tasks: List[Task]) -> None:
-    path.write_text(
-        json.dumps([t.to_dict() for t in tasks], indent=2, ensure_ascii=False),
-        encoding="utf-8",
-    )
+    with _open(path, write=True) as b:
+        b.save_all(tasks)
 
-def add_task(
-    path: Path,
+def compact(path: Path) -> None:
+    """Fold pending writes (the JSON store's journal) into the main file."""
+    with _open(path, write=True) as b:
+        b.compact()
+
+def convert(path: Path, fmt: str) -> None:
+    """Rewrite a JSON store's snapshot in another format (snapshot.FORMATS);
+    every later load detects it."""
+    with _open(path, write=True) as b:
+        b.convert(fmt)
+
+def new_task(
     title: str,
     description: str = "",
     due: Optional[str] = None,
@@ -31,57 +97,120 @@ def add_task(
 ) -> Task:
     if priority not in PRIORITIES:
         priority = "medium"
-    t = Task(
-        id=str(uuid.uuid4())[:8],
+    return Task(
+        id=os.urandom(4).hex(),
         title=title,
         description=description or "",
         due=due,
         priority=priority,
         tags=tags or [],
     )
-    tasks = load_all(path)
-    tasks.append(t)
-    save_all(path, tasks)
+
+def add_task(
+    path: Path,
+    title: str,
+    description: str = "",
+    due: Optional[str] = None,
+    priority: str = "medium",
+    tags: Optional[list[str]] = None,
+) -> Task:
+    t = new_task(title, description, due, priority, tags)
+    with _open(path, write=True) as b:
+        b.add(t)
     return t
 
-def search(path: Path, query: str) -> List[Task]:
-    q = query.lower()
-    hits = []
-    for t in load_all(path):
-        hay = [
-            t.title.lower(),
-            (t.description or "").lower(),
-            *[tag.lower() for tag in t.tags],
-        ]
-        if any(q in part for part in hay):
-            hits.append(t)
-    return hits
-
-def filter_tasks(path: Path, mode: str, value: Optional[str] = None) -> List[Task]:
-    tasks = load_all(path)
-    if mode == "overdue":
-        return [t for t in tasks if t.is_overdue()]
-    if mode == "today":
-        return [t for t in tasks if t.is_due_today()]
-    if mode == "priority" and value:
-        return [t for t in tasks if t.priority == value]
-    if mode == "tag" and value:
-        return [t for t in tasks if value in t.tags]
-    if mode == "open":
-        return [t for t in tasks if not t.completed]
-    if mode == "done":
-        return [t for t in tasks if t.completed]
-    return tasks
+class Transaction:
+    """Adds and completions against one open store, written together by
+    commit() (one journal append, or one SQLite transaction)."""
+
+    def __init__(self, backend: Backend):
+        self.backend = backend
+        self.ops: List[dict] = []
+        self._states: Optional[Dict[str, bool]] = None
+
+    def add(self, task: Task) -> Task:
+        self.ops.append({"op": "add", "task": task.to_dict()})
+        if self._states is not None:
+            self._states[task.id] = task.completed
+        return task
+
+    def complete(self, task_id: str) -> bool:
+        if self._states is None:
+            self._states = self.backend.states()
+            for op in self.ops:
+                if op["op"] == "add":
+                    self._states[op["task"]["id"]] = op["task"]["completed"]
+        done = self._states.get(task_id)
+        if done is None:
+            return False
+        if not done:
+            self._states[task_id] = True
+            self.ops.append({"op": "complete", "id": task_id})
+        return True
+
+    def commit(self) -> None:
+        ops, self.ops = self.ops, []
+        self.backend.apply(ops)
+
+    def rollback(self) -> None:
+        self.ops.clear()
+
+@contextmanager
+def transaction(path: Path) -> Iterator[Transaction]:
+    """Batch many changes into one write, made when the block exits
+    cleanly; nothing is written if it raises."""
+    with _open(path, write=True) as b:
+        tx = Transaction(b)
+        yield tx
+        tx.commit()
+
+def iter_search(path: Path, query: str) -> Iterator[Task]:
+    with _open(path) as b:
+        yield from b.iter_search(query)
+
+def search(path: Path, query: str, view: bool = False) -> List[Task]:
+    with _open(path) as b:
+        if view and isinstance(b, MemoryBackend):
+            return b.view(b.search_positions(query))
+        return list(b.iter_search(query))
+
+def ranked_search(path: Path, query: str, limit: int = 20, fuzzy: int = 0) -> List[Task]:
+    """The `limit` most relevant tasks for `query` by BM25 over title,
+    description and tags; with fuzzy > 0, words within that many edits
+    also count (at a discount)."""
+    with _open(path) as b:
+        return [t for _, t in b.ranked(query, limit, fuzzy)]
+
+def iter_filter(path: Path, mode: str, value: Optional[str] = None) -> Iterator[Task]:
+    with _open(path) as b:
+        yield from b.iter_filter(mode, value)
+
+def filter_tasks(path: Path, mode: str, value: Optional[str] = None, view: bool = False) -> List[Task]:
+    with _open(path) as b:
+        if view and isinstance(b, MemoryBackend):
+            return b.view(b.filter_positions(mode, value))
+        return list(b.iter_filter(mode, value))
+
+def iter_query(path: Path, text: str) -> Iterator[Task]:
+    """Tasks matching a query expression (see tasks3.query); raises
+    QueryError for a malformed one."""
+    from .query import Query
+    q = Query(text)
+    with _open(path) as b:
+        yield from b.iter_query(q)
+
+def query_tasks(path: Path, text: str, view: bool = False) -> List[Task]:
+    from .query import Query
+    q = Query(text)
+    with _open(path) as b:
+        if view and isinstance(b, MemoryBackend):
+            return b.view(b.query_positions(q))
+        return list(b.iter_query(q))
+
+def get_task(path: Path, task_id: str) -> Optional[Task]:
+    with _open(path) as b:
+        return b.get(task_id)
 
 def mark_complete(path: Path, task_id: str) -> bool:
-    tasks = load_all(path)
-    found = False
-    for t in tasks:
-        if t.id == task_id:
-            if not t.completed:
-                t.completed = True
-            found = True
-            break
-    if found:
-        save_all(path, tasks)
-    return found
+    with _open(path, write=True) as b:
+        return b.complete(task_id)
@@ -0,0 +1,210 @@
+from __future__ import annotations
+import os
+import select
+import struct
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import IO, Callable, Dict, Iterable, List, Optional, Tuple
+from .backend import Backend, filter_predicate
+from .index import text_fields
+from .memstore import MemoryBackend
+from .model import Task
+
+# `tasks3 watch VIEW` prints a list, filter, search or query once, then
+# only what changes in it.  The store is held in memory (MemoryBackend);
+# when its files change, sync() reads just the journal lines appended
+# since, and only the records those touched are matched again.  Between
+# changes the process sleeps in inotify (Linux) or a stat() poll.
+Matcher = Callable[[int], Optional[Callable[[dict], bool]]]   # today -> predicate
+
+_IN_EVENT = struct.Struct("iIII")   # wd, mask, cookie, name length
+# IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+# | IN_CREATE | IN_DELETE
+_IN_MASK = 0x002 | 0x004 | 0x008 | 0x040 | 0x080 | 0x100 | 0x200
+
+
+def _inotify() -> Optional[Tuple[object, int]]:
+    # (libc, inotify fd), or None where there is no inotify
+    if not sys.platform.startswith("linux"):
+        return None
+    import ctypes
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    return (libc, fd) if fd >= 0 else None
+
+
+class Watcher:
+    """Waits for a set of files to change: inotify on their directories
+    where available, else stat() every `interval` seconds."""
+
+    def __init__(self, files: Iterable[Path], interval: float = 1.0, poll: bool = False):
+        self.files = list(files)
+        self.interval = interval
+        self._fd: Optional[int] = None
+        self._names: Dict[int, set] = {}   # watch descriptor -> file names
+        ino = None if poll else _inotify()
+        if ino is not None:
+            libc, self._fd = ino
+            dirs: Dict[Path, set] = {}
+            for f in self.files:
+                dirs.setdefault(f.parent, set()).add(os.fsencode(f.name))
+            for d, names in dirs.items():
+                wd = libc.inotify_add_watch(self._fd, os.fsencode(d), _IN_MASK)
+                if wd < 0:
+                    self.close()   # e.g. out of watches: poll instead
+                    break
+                self._names[wd] = names
+        self._stamp = self._stat()
+
+    @property
+    def polling(self) -> bool:
+        return self._fd is None
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _stat(self) -> tuple:
+        out = []
+        for f in self.files:
+            try:
+                st = os.stat(f)
+                out.append((st.st_ino, st.st_size, st.st_mtime_ns))
+            except FileNotFoundError:
+                out.append(None)
+        return tuple(out)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the files may have changed (True) or `timeout`
+        seconds pass (False)."""
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            left = None if end is None else end - time.monotonic()
+            if left is not None and left <= 0:
+                return False
+            if self._fd is None:
+                time.sleep(self.interval if left is None else min(self.interval, left))
+                stamp = self._stat()
+                if stamp != self._stamp:
+                    self._stamp = stamp
+                    return True
+                continue
+            if not select.select([self._fd], [], [], left)[0]:
+                return False
+            if self._relevant(os.read(self._fd, 1 << 16)):
+                return True
+
+    def _relevant(self, buf: bytes) -> bool:
+        # events for our files; temp files, locks and indexes are not
+        hit, pos = False, 0
+        while pos < len(buf):
+            wd, _, _, n = _IN_EVENT.unpack_from(buf, pos)
+            name = buf[pos + _IN_EVENT.size:pos + _IN_EVENT.size + n].rstrip(b"\0")
+            hit = hit or name in self._names.get(wd, ())
+            pos += _IN_EVENT.size + n
+        return hit
+
+
+class LiveView:
+    """The records of an in-memory store that match a view, kept current
+    by matching only the records each sync() reports changed."""
+
+    def __init__(self, store: MemoryBackend, matcher: Matcher):
+        self.store = store
+        self.matcher = matcher
+        self.shown: Dict[str, dict] = {}   # id -> record as last printed
+        self.today: Optional[int] = None
+
+    def update(self) -> List[Tuple[str, dict]]:
+        """Catch up with the store.  Returns the changes to the view as
+        (sign, record): "+" now matches, "~" changed, "-" gone."""
+        changed = self.store.sync()
+        today = date.today().toordinal()
+        if changed is None or today != self.today:
+            # reloaded, or a new day for overdue/today: match everything
+            self.today = today
+            self.match = self.matcher(today)
+            return self._diff(range(len(self.store.records)), whole=True)
+        return self._diff(sorted(changed))
+
+    def _diff(self, positions: Iterable[int], whole: bool = False) -> List[Tuple[str, dict]]:
+        out: List[Tuple[str, dict]] = []
+        records, seen = self.store.records, set()
+        for i in positions:
+            rec = records[i]
+            tid = rec["id"]
+            old = self.shown.get(tid)
+            if self.match is None or self.match(rec):
+                seen.add(tid)
+                if old == rec:
+                    continue
+                out.append(("+" if old is None else "~", rec))
+                self.shown[tid] = dict(rec)   # records change in place
+            elif old is not None:
+                out.append(("-", self.shown.pop(tid)))
+        if whole:
+            for tid in [t for t in self.shown if t not in seen]:
+                out.append(("-", self.shown.pop(tid)))
+        return out
+
+
+def view_matcher(args) -> Matcher:
+    """The matcher for a parsed `watch VIEW ...` command line; raises
+    QueryError for a malformed query."""
+    if args.view == "filter":
+        def matcher(today: int):
+            pred = filter_predicate(args.mode, args.value, today)
+            return None if pred is None else lambda rec: pred(Task.from_dicts((rec,))[0])
+        return matcher
+    if args.view == "search":
+        q = args.query.lower()
+        return lambda today: lambda rec: any(q in part for part in text_fields(rec))
+    if args.view == "query":
+        from .query import Query
+        text = " ".join(args.expr)
+        Query(text)   # fail now rather than on the first change
+        return lambda today: Query(text, today).match
+    return lambda today: None
+
+
+def _write(changes: List[Tuple[str, dict]], out: IO[str], first: bool) -> None:
+    from .output import _text
+    lines = []
+    for sign, rec in changes:
+        if sign == "-":
+            lines.append(f"- {rec['id']} :: {rec['title']}\n")
+        else:
+            line = _text(Task.from_dicts((rec,))[0])
+            lines.append(line if first else f"{sign} {line}")
+    out.write("".join(lines))
+    out.flush()
+
+
+def _until_tomorrow() -> float:
+    now = datetime.now()
+    return (datetime.combine(now.date() + timedelta(days=1), datetime.min.time()) - now).total_seconds() + 1
+
+
+def watch(store: Backend, matcher: Matcher, out: IO[str],
+          interval: float = 1.0, poll: bool = False) -> None:
+    """Print the view, then its changes as the store's files change, until
+    interrupted."""
+    mem = MemoryBackend(store)
+    view = LiveView(mem, matcher)
+    watcher = Watcher(store.files(), interval, poll)
+    try:
+        _write(view.update(), out, first=True)
+        while True:
+            # wake at midnight too: overdue/today views change by themselves
+            watcher.wait(_until_tomorrow())
+            changes = view.update()
+            if changes:
+                _write(changes, out, first=False)
+    finally:
+        watcher.close()
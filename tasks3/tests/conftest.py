@@ -0,0 +1,10 @@
+# tasks3/tests/conftest.py
+import pytest
+
+from tasks3 import store
+
+
+@pytest.fixture
+def no_store_cache(monkeypatch):
+    """Send tasks3.store calls to the backends instead of the in-memory cache."""
+    monkeypatch.setattr(store, "CACHE_SIZE", 0)
@@ -0,0 +1,178 @@
+# tasks3/tests/test_agenda.py
+import os
+import subprocess
+import sys
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from pathlib import Path
+
+import pytest
+
+from tasks3.agenda import Reminders, agenda, notify, parse_day
+from tasks3.backend import open_backend
+from tasks3.cli import build_parser, main as cli_main
+from tasks3.filestore import FileBackend
+from tasks3.memstore import MemoryBackend
+from tasks3.store import add_task, compact, mark_complete
+
+pytestmark = pytest.mark.usefixtures("no_store_cache")
+
+TODAY = date.today().toordinal()
+
+
+def _day(offset: int) -> str:
+    return (date.today() + timedelta(days=offset)).isoformat()
+
+
+def _at(offset: int, hour: int, minute: int = 0) -> float:
+    d = date.today() + timedelta(days=offset)
+    return datetime(d.year, d.month, d.day, hour, minute).timestamp()
+
+
+def test_parse_day():
+    assert parse_day("today", TODAY) == TODAY
+    assert parse_day("tomorrow", TODAY) == TODAY + 1
+    assert parse_day("+7", TODAY) == TODAY + 7 and parse_day("-2", TODAY) == TODAY - 2
+    assert parse_day("2030-01-02", TODAY) == date(2030, 1, 2).toordinal()
+    for bad in ("", "+", "next week", "2030-13-01"):
+        with pytest.raises(ValueError):
+            parse_day(bad, TODAY)
+
+
+def _by_day(tasks):
+    return [(due, {t.id for t in ts}) for due, ts in groupby(tasks, lambda t: t.due)]
+
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.db", "tasks.shards"])
+def test_agenda_is_a_due_date_range(tmp_path: Path, name: str):
+    path = tmp_path / name
+    late = add_task(path, "Late", due=_day(5))
+    soon = add_task(path, "Soon", due=_day(0))
+    add_task(path, "Before", due=_day(-1))
+    add_task(path, "After", due=_day(8))
+    add_task(path, "Undated")
+    done = add_task(path, "Done", due=_day(1))
+    mark_complete(path, done.id)
+    soon2 = add_task(path, "Soon too", due=_day(0))
+    # shards keep no order across shards: same-day tasks come in any order
+    order = _by_day if name.endswith(".shards") else (lambda ts: [t.id for t in ts])
+    with open_backend(path) as store:
+        assert order(agenda(store, TODAY, TODAY + 7)) == order([soon, soon2, late])
+        assert order(agenda(store, TODAY, TODAY + 7, done=True)) == order([soon, soon2, done, late])
+        assert agenda(store, TODAY + 2, TODAY + 4) == []
+
+
+def test_agenda_in_memory_matches_the_file_store(tmp_path: Path):
+    path = tmp_path / "tasks.json"
+    ids = [add_task(path, f"Task {i}", due=_day(i % 10)).id for i in range(40)]
+    compact(path)
+    with FileBackend(path) as store:
+        want = [t.id for t in agenda(store, TODAY + 3, TODAY + 4)]
+    mem = MemoryBackend(FileBackend(path))
+    assert [t.id for t in agenda(mem, TODAY + 3, TODAY + 4)] == want
+    assert want == [ids[i] for i in range(3, 40, 10)] + [ids[i] for i in range(4, 40, 10)]
+
+
+def test_agenda_cli(tmp_path: Path, capsys):
+    file = tmp_path / "tasks.json"
+    t = add_task(file, "Soon", due=_day(1))
+    add_task(file, "Later", due=_day(20))
+    assert cli_main(["--file", str(file), "agenda", "--format", "ids"]) == 0
+    assert capsys.readouterr().out == f"{t.id}\n"
+    assert cli_main(["--file", str(file), "agenda", "--to", "+30", "--format", "ids"]) == 0
+    assert len(capsys.readouterr().out.split()) == 2
+    assert cli_main(["--file", str(file), "agenda", "--from", "soon"]) == 2
+    args = build_parser().parse_args(["remind", "--at", "7:30", "--exec", "notify-send x"])
+    assert (args.at, args.hook) == ((7, 30), "notify-send x")
+    with pytest.raises(SystemExit):
+        build_parser().parse_args(["remind", "--at", "25:00"])
+
+
+def test_reminders_fire_in_deadline_order(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    add_task(file, "Overdue", due=_day(-1))
+    tomorrow = add_task(file, "Tomorrow", due=_day(1))
+    today = add_task(file, "Today", due=_day(0))
+    add_task(file, "Undated")
+    rem = Reminders(MemoryBackend(FileBackend(file)), at=(9, 0), since=TODAY)
+    rem.update()
+    assert rem.next_deadline() == _at(0, 9)
+    assert list(rem.due(_at(0, 8, 59))) == []
+    assert [r["id"] for r in rem.due(_at(0, 9))] == [today.id]
+
+    # changes are picked up from the journal, stale entries dropped
+    extra = add_task(file, "Added today", due=_day(0))
+    mark_complete(file, tomorrow.id)
+    rem.update()
+    assert [r["id"] for r in rem.due(_at(0, 10))] == [extra.id]
+    later = add_task(file, "Day after", due=_day(2))
+    rem.update()
+    assert [r["id"] for r in rem.due(_at(3, 0))] == [later.id]
+    assert rem.next_deadline() is None
+
+    compact(file)   # reloaded: nothing is announced twice
+    rem.update()
+    assert list(rem.due(_at(5, 0))) == []
+
+
+def test_reminders_forget_tasks_once_done(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    a = add_task(file, "Today", due=_day(0))
+    b = add_task(file, "Tomorrow", due=_day(1))
+    c = add_task(file, "Also today", due=_day(0))
+    rem = Reminders(MemoryBackend(FileBackend(file)), at=(9, 0), since=TODAY)
+    rem.update()
+    assert [r["id"] for r in rem.due(_at(0, 9))] == [a.id, c.id]
+    assert rem.sent == {a.id: TODAY, c.id: TODAY}
+
+    mark_complete(file, a.id)   # completed: forgotten
+    rem.update()
+    assert rem.sent == {c.id: TODAY}
+    assert [r["id"] for r in rem.due(_at(1, 9))] == [b.id]
+
+    # the next day: the tasks of the day before are forgotten, and not
+    # announced again when the store is reloaded
+    rem.update()
+    assert rem.since == TODAY + 1 and rem.sent == {b.id: TODAY + 1}
+    compact(file)
+    rem.update()
+    assert list(rem.due(_at(1, 10))) == []
+    assert rem.sent == {b.id: TODAY + 1}
+    mark_complete(file, b.id)
+    compact(file)
+    rem.update()
+    assert rem.sent == {}
+
+
+def test_notify_runs_the_hook(tmp_path: Path, capsys):
+    rec = {"id": "ab12", "title": "Pay rent", "due": "2030-01-01", "priority": "high",
+           "tags": ["home", "money"], "completed": False}
+    notify(rec, sys.stdout)
+    assert capsys.readouterr().out == "DUE 2030-01-01 ab12 :: Pay rent\n"
+    out = tmp_path / "hook.txt"
+    script = ("import os, sys; open(sys.argv[1], 'w').write("
+              "os.environ['TASKS3_ID'] + ' ' + os.environ['TASKS3_TAGS'] + ' ' + sys.stdin.read())")
+    notify(rec, sys.stdout, f"{sys.executable} -c \"{script}\" {out}")
+    assert out.read_text().startswith('ab12 home,money {"id": "ab12"')
+    notify(rec, sys.stdout, f"{sys.executable} -c 'raise SystemExit(3)'")
+    assert "exited with 3" in capsys.readouterr().err
+
+
+def test_cli_remind_announces_due_tasks(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    a = add_task(file, "Due today", due=_day(0))
+    add_task(file, "Due tomorrow", due=_day(1))
+    env = dict(os.environ, TASKS3_NO_DAEMON="1")
+    src = str(Path(__file__).resolve().parents[1] / "src")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src, env.get("PYTHONPATH")]))
+    proc = subprocess.Popen(
+        [sys.executable, "-c", "from tasks3.cli import main; raise SystemExit(main())",
+         "--file", str(file), "remind", "--at", "00:00"],
+        env=env, stdout=subprocess.PIPE, text=True)
+    try:
+        assert proc.stdout.readline() == f"DUE {_day(0)} {a.id} :: Due today\n"
+        b = add_task(file, "Also today", due=_day(0))
+        assert proc.stdout.readline() == f"DUE {_day(0)} {b.id} :: Also today\n"
+    finally:
+        proc.terminate()
+        proc.wait(5)
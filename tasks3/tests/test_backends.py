@@ -0,0 +1,57 @@
+# tasks3/tests/test_backends.py
+from datetime import date, timedelta
+from pathlib import Path
+
+import pytest
+
+from tasks3.backend import open_backend
+from tasks3.filestore import FileBackend
+from tasks3.sqlstore import SqliteBackend
+from tasks3.store import (
+    add_task, compact, filter_tasks, iter_tasks, load_all, mark_complete, save_all, search,
+)
+from tasks3.cli import main as cli_main
+
+# compare the backends themselves, not the store cache in front of them
+pytestmark = pytest.mark.usefixtures("no_store_cache")
+
+
+def test_backend_picked_by_extension(tmp_path: Path):
+    assert isinstance(open_backend(tmp_path / "t.json"), FileBackend)
+    for name in ("t.db", "t.sqlite", "t.sqlite3"):
+        with open_backend(tmp_path / name) as b:
+            assert isinstance(b, SqliteBackend)
+
+
+def _seed(file: Path):
+    today = date.today()
+    day = lambda n: (today + timedelta(days=n)).strftime("%Y-%m-%d")
+    a = add_task(file, "Write CSC299 report", due=day(-2), priority="high", tags=["School"])
+    add_task(file, "Buy milk", description="and eggs", due=day(0), tags=["home"])
+    add_task(file, "Report back", due=day(-1), priority="low", tags=["work", "home"])
+    add_task(file, "Plan trip", due=day(4), priority="high")
+    mark_complete(file, a.id)
+
+
+@pytest.mark.parametrize("name", ["tasks.db", "tasks.sqlite"])
+def test_sqlite_matches_json_store(tmp_path: Path, name: str):
+    js, db = tmp_path / "tasks.json", tmp_path / name
+    _seed(js)
+    save_all(db, load_all(js))
+    compact(db)
+    assert load_all(db) == load_all(js)
+    assert list(iter_tasks(db)) == load_all(js)
+    for q in ["", "re", "report", "REPORT", "milk", "ggs", "ool", "zzz", "t b"]:
+        assert search(db, q) == search(js, q), q
+    for mode, value in [("overdue", None), ("today", None), ("priority", "high"),
+                        ("tag", "home"), ("open", None), ("done", None), ("bogus", None)]:
+        assert filter_tasks(db, mode, value) == filter_tasks(js, mode, value), mode
+    assert mark_complete(db, "missing") is False
+
+
+def test_cli_on_sqlite(tmp_path: Path, capsys):
+    db = tmp_path / "tasks.db"
+    assert cli_main(["--file", str(db), "add", "From CLI", "-t", "x"]) == 0
+    capsys.readouterr()
+    assert cli_main(["--file", str(db), "search", "cli"]) == 0
+    assert "From CLI" in capsys.readouterr().out
@@ -0,0 +1,84 @@
+# tasks3/tests/test_batch.py
+import io
+import json
+from pathlib import Path
+
+import pytest
+
+from tasks3 import journal
+from tasks3.cli import main as cli_main
+from tasks3.store import add_task, load_all, new_task, transaction
+
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.db"])
+def test_transaction_writes_once(tmp_path: Path, name: str, monkeypatch):
+    file = tmp_path / name
+    seeded = [add_task(file, f"Seed {i}") for i in range(3)]
+    appends = []
+    real = journal.append
+    monkeypatch.setattr(journal, "append", lambda p, ops: appends.append(list(ops)) or real(p, ops))
+
+    with transaction(file) as tx:
+        new = tx.add(new_task("Batch add", tags=["b"]))
+        assert tx.complete(seeded[0].id) and tx.complete(seeded[0].id)
+        assert tx.complete(new.id)
+        assert not tx.complete("missing")
+    if name.endswith(".json"):
+        assert len(appends) == 1 and len(appends[0]) == 3
+
+    done = {t.id: t.completed for t in load_all(file)}
+    assert done == {seeded[0].id: True, seeded[1].id: False, seeded[2].id: False, new.id: True}
+
+
+def test_transaction_discarded_on_error(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    seeded = add_task(file, "Seed")
+    with pytest.raises(RuntimeError):
+        with transaction(file) as tx:
+            tx.add(new_task("Never written"))
+            tx.complete(seeded.id)
+            raise RuntimeError
+    assert [(t.id, t.completed) for t in load_all(file)] == [(seeded.id, False)]
+
+
+def test_cli_bulk_complete_and_add(tmp_path: Path, monkeypatch, capsys):
+    file = tmp_path / "tasks.json"
+    a, b = add_task(file, "A"), add_task(file, "B")
+    assert cli_main(["--file", str(file), "complete", a.id, "nope"]) == 1
+    assert capsys.readouterr().out.splitlines() == [f"OK {a.id}", "NOT FOUND nope"]
+
+    monkeypatch.setattr("sys.stdin", io.StringIO(f"{a.id}\n{b.id}\n"))
+    assert cli_main(["--file", str(file), "complete"]) == 0
+    assert all(t.completed for t in load_all(file))
+    capsys.readouterr()
+
+    lines = [json.dumps({"title": f"Bulk {i}", "tags": ["bulk"], "priority": "high"}) for i in range(5)]
+    monkeypatch.setattr("sys.stdin", io.StringIO("\n".join(lines) + "\n\n"))
+    assert cli_main(["--file", str(file), "add", "-"]) == 0
+    assert capsys.readouterr().out.count("ADDED") == 5
+    bulk = [t for t in load_all(file) if "bulk" in t.tags]
+    assert [t.title for t in bulk] == [f"Bulk {i}" for i in range(5)]
+    assert {t.priority for t in bulk} == {"high"}
+
+    monkeypatch.setattr("sys.stdin", io.StringIO('{"title": "ok"}\nnot json\n'))
+    assert cli_main(["--file", str(file), "add", "-"]) == 2
+    assert "line 2" in capsys.readouterr().err
+    assert len(load_all(file)) == 7
+
+
+@pytest.mark.parametrize("line, error", [
+    ('{"title": "x", "description": 5}', "description must be a string"),
+    ('{"title": "x", "tags": "abc"}', "tags must be a list of strings"),
+    ('{"title": "x", "tags": [1]}', "tags must be a list of strings"),
+    ('{"title": "x", "due": "2030-02-30"}', "bad due date '2030-02-30'"),
+    ('{"title": "x", "due": 20300101}', "due must be a string"),
+    ('{"title": "x", "priority": "urgent"}', "priority must be one of low, medium, high"),
+    ('{"title": "x", "priority": 1}', "priority must be one of"),
+])
+def test_cli_add_rejects_bad_fields(tmp_path: Path, monkeypatch, capsys, line: str, error: str):
+    file = tmp_path / "tasks.json"
+    ok = json.dumps({"title": "ok", "description": None, "due": "2030-01-01", "tags": ["a"]})
+    monkeypatch.setattr("sys.stdin", io.StringIO(f"{ok}\n{line}\n"))
+    assert cli_main(["--file", str(file), "add", "-"]) == 2
+    assert f"stdin line 2: {error}" in capsys.readouterr().err
+    assert load_all(file) == []   # nothing added
@@ -0,0 +1,30 @@
+# tasks3/tests/test_bench.py
+from pathlib import Path
+
+from tasks3.bench import compare, generate, run_benchmarks, write_store
+from tasks3.store import load_all
+
+
+def test_generator_is_seeded_and_valid(tmp_path: Path):
+    a = list(generate(500, seed=7))
+    assert a == list(generate(500, seed=7))
+    assert a != list(generate(500, seed=8))
+    assert len({r["id"] for r in a}) == 500
+    assert {r["priority"] for r in a} == {"low", "medium", "high"}
+    assert any(r["due"] is None for r in a) and any(r["completed"] for r in a)
+
+    for name in ("tasks.json", "tasks.db"):
+        tasks = load_all(write_store(tmp_path / name, 50, seed=1))
+        assert [t.to_dict() for t in tasks] == list(generate(50, seed=1))
+
+
+def test_run_and_compare(tmp_path: Path):
+    res = run_benchmarks([20], repeat=1, cli=False, workdir=tmp_path)
+    ops = res["results"]["20"]
+    assert {"load_all", "search_common", "filter_overdue", "add_task", "mark_complete"} <= set(ops)
+    assert all(r["seconds"] >= 0 for r in ops.values())
+
+    slower = {"results": {"20": {op: dict(r, seconds=r["seconds"] * 3 + 1) for op, r in ops.items()}}}
+    assert compare(res, res) == []
+    regs = compare(slower, res, threshold=0.5)
+    assert {r["op"] for r in regs} == set(ops)
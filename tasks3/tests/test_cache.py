@@ -0,0 +1,77 @@
+# tasks3/tests/test_cache.py
+import os
+from pathlib import Path
+
+from tasks3 import snapshot, store
+from tasks3.store import add_task, filter_tasks, load_all, mark_complete, save_all, search
+
+
+def test_repeated_reads_skip_io(tmp_path: Path, monkeypatch):
+    file = tmp_path / "tasks.json"
+    a = add_task(file, "Cached report", tags=["work"])
+    load_all(file)
+    for name in ("load", "iter_load", "load_stat", "iter_load_stat"):
+        monkeypatch.setattr(snapshot, name, lambda p: 1 / 0)
+    assert [t.id for t in search(file, "report")] == [a.id]
+    assert [t.id for t in filter_tasks(file, "tag", "work")] == [a.id]
+    # our own writes update the cached copy in place
+    b = add_task(file, "Second report")
+    assert mark_complete(file, a.id)
+    assert [(t.id, t.completed) for t in search(file, "report")] == [(a.id, True), (b.id, False)]
+
+
+def test_outside_writes_invalidate(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    add_task(file, "Original")
+    load_all(file)
+    # a different process rewrites the file; restore the old mtime to show
+    # the size alone is enough to notice
+    st = file.stat()
+    snapshot.dump(file, [{"id": "x", "title": "Outside", "description": "", "due": None,
+                          "priority": "low", "tags": [], "completed": False}])
+    os.utime(file, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert [t.title for t in load_all(file)] == ["Outside", "Original"]
+
+
+def test_views_are_shared_and_copies_are_not(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    add_task(file, "One", tags=["t"])
+    add_task(file, "Two")
+    v1, v2 = load_all(file, view=True), load_all(file, view=True)
+    assert v1 == v2 and all(x is y for x, y in zip(v1, v2))
+    assert search(file, "one", view=True)[0] is v1[0]
+    assert filter_tasks(file, "tag", "t", view=True)[0] is v1[0]
+    fresh = load_all(file)
+    assert fresh == v1 and fresh[0] is not v1[0]
+    save_all(file, fresh[:1])
+    assert [t.title for t in load_all(file, view=True)] == ["One"]
+
+
+def test_lru_bound(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(store, "CACHE_SIZE", 2)
+    store.clear_cache()
+    files = [tmp_path / f"t{i}.json" for i in range(3)]
+    for f in files:
+        add_task(f, f.stem)
+        load_all(f)
+    assert list(store._cache) == [f.absolute() for f in files[1:]]
+    load_all(files[1])
+    assert list(store._cache) == [files[2].absolute(), files[1].absolute()]
+    store.set_cache_size(0)
+    assert not store._cache
+    assert [t.title for t in load_all(files[0])] == ["t0"]
+
+
+def test_writes_do_not_load_the_store(tmp_path: Path, monkeypatch):
+    store.clear_cache()
+    file = tmp_path / "tasks.json"
+    a = add_task(file, "A")
+    assert mark_complete(file, a.id)
+    assert not store._cache   # written through to the backend
+    assert [(t.title, t.completed) for t in load_all(file)] == [("A", True)]
+    cached = store._cache[file.absolute()]
+    reloads = []
+    monkeypatch.setattr(cached, "reload", lambda: reloads.append(1))
+    b = add_task(file, "B")   # the loaded copy is kept up to date
+    assert [r["id"] for r in cached.records] == [a.id, b.id]
+    assert [t.id for t in load_all(file)] == [a.id, b.id] and not reloads
@@ -0,0 +1,123 @@
+# tasks3/tests/test_concurrency.py
+import multiprocessing
+import os
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from tasks3 import fsutil, journal
+from tasks3.filestore import FileBackend
+from tasks3.store import load_all, new_task
+
+pytestmark = pytest.mark.usefixtures("no_store_cache")
+
+fork = pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(),
+                          reason="needs fork")
+
+
+def _writer(path: str, n: int, tag: str) -> None:
+    journal.COMPACT_BYTES = 2048   # compact often, while others append
+    b = FileBackend(Path(path))
+    for i in range(n):
+        t = new_task(f"{tag} {i}")
+        b.add(t)
+        if i % 4 == 0:
+            assert b.complete(t.id)
+
+
+@fork
+def test_concurrent_writers_lose_nothing(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_writer, args=(str(file), 40, f"p{k}")) for k in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+        assert p.exitcode == 0
+    tasks = load_all(file)
+    assert sorted(t.title for t in tasks) == sorted(f"p{k} {i}" for k in range(4) for i in range(40))
+    assert sorted(t.title for t in tasks if t.completed) == sorted(
+        f"p{k} {i}" for k in range(4) for i in range(0, 40, 4))
+    assert not [f for f in os.listdir(tmp_path) if f.endswith(".tmp")]
+
+
+def test_queued_writers_share_a_sync(tmp_path: Path, monkeypatch):
+    file = tmp_path / "tasks.json"
+    FileBackend(file).init()
+    syncs = []
+    real = os.fsync
+
+    def slow_fsync(fd):
+        syncs.append(fd)
+        time.sleep(0.05)   # the others append and queue up meanwhile
+        real(fd)
+    monkeypatch.setattr(os, "fsync", slow_fsync)
+    start = threading.Barrier(8)
+
+    def add(k):
+        start.wait()
+        FileBackend(file).add(new_task(f"t{k}"))
+    threads = [threading.Thread(target=add, args=(k,)) for k in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(load_all(file)) == 8
+    assert 1 <= len(syncs) < 8
+
+
+def test_write_atomic_keeps_old_file_on_failure(tmp_path: Path, monkeypatch):
+    file = tmp_path / "tasks.json"
+    file.write_bytes(b"old")
+    os.chmod(file, 0o600)
+    fsutil.write_atomic(file, b"new")
+    assert file.read_bytes() == b"new" and file.stat().st_mode & 0o777 == 0o600
+
+    def fail(*a):
+        raise OSError("disk full")
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        fsutil.write_atomic(file, b"newer")
+    assert file.read_bytes() == b"new"
+    assert os.listdir(tmp_path) == ["tasks.json"]
+    assert fsutil.create(file, b"x") is False and file.read_bytes() == b"new"
+
+
+def test_lookups_while_compacting(tmp_path: Path):
+    # cold id-table builds race compactions that move every record
+    file = tmp_path / "tasks.json"
+    b = FileBackend(file)
+    tasks = [new_task(f"Task {i}") for i in range(200)]
+    b.apply([{"op": "add", "task": t.to_dict()} for t in tasks])
+    b.compact()
+    stop = threading.Event()
+    errors = []
+
+    def compactor():
+        try:
+            for i in range(0, 200, 10):
+                assert b.complete(tasks[i].id)
+                b.convert("columnar" if i % 20 else "json")
+        except Exception as e:   # pragma: no cover - reported below
+            errors.append(e)
+        finally:
+            stop.set()
+
+    t = threading.Thread(target=compactor)
+    t.start()
+    try:
+        n = 0
+        while not stop.is_set() or n < 50:
+            sidecar = file.with_name(file.name + ".ididx")
+            sidecar.unlink(missing_ok=True)
+            k = n * 7 % 200
+            got = FileBackend(file).get(tasks[k].id)
+            assert got is not None and got.title == f"Task {k}"
+            n += 1
+    finally:
+        t.join()
+    assert not errors
+    assert [t.completed for t in load_all(file)] == [i % 10 == 0 for i in range(200)]
@@ -0,0 +1,123 @@
+# tasks3/tests/test_daemon.py
+import socket
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from tasks3.cli import main as cli_main
+from tasks3.daemon import Daemon, forward, socket_path
+from tasks3.store import add_task, load_all
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+
+
+@pytest.fixture
+def daemon(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    file = tmp_path / "tasks.json"
+    seeded = add_task(file, "Seeded task")
+    d = Daemon(file)
+    th = threading.Thread(target=d.run)
+    th.start()
+    deadline = time.monotonic() + 5
+    while forward(file, ["list"]) is None:
+        assert time.monotonic() < deadline, "daemon did not start"
+        time.sleep(0.01)
+    yield file, seeded, d
+    d.stop()
+    th.join()
+
+
+def test_cli_forwards_to_daemon(daemon, capsys):
+    file, seeded, _ = daemon
+    assert cli_main(["--file", str(file), "add", "Via daemon", "-t", "d"]) == 0
+    assert "ADDED" in capsys.readouterr().out
+    assert cli_main(["--file", str(file), "search", "via"]) == 0
+    assert "Via daemon" in capsys.readouterr().out
+    assert cli_main(["--file", str(file), "complete", seeded.id]) == 0
+    assert cli_main(["--file", str(file), "complete", "missing"]) == 1
+    assert cli_main(["--file", str(file), "filter", "priority"]) == 0
+
+
+def test_daemon_flushes_on_stop_and_sees_outside_writes(daemon, capsys):
+    file, seeded, d = daemon
+    cli_main(["--file", str(file), "complete", seeded.id])
+    outside = add_task(file, "Written without the daemon")
+    capsys.readouterr()
+    cli_main(["--file", str(file), "list"])
+    assert outside.id in capsys.readouterr().out
+    d.stop()
+    deadline = time.monotonic() + 5
+    while socket_path(file).exists():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    tasks = {t.id: t for t in load_all(file)}
+    assert tasks[seeded.id].completed and outside.id in tasks
+
+
+def test_daemon_ignores_clients_that_hang_up(daemon, capsys, caplog):
+    file, seeded, _ = daemon
+    capsys.readouterr()
+    for _ in range(3):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.connect(str(socket_path(file)))
+    assert Daemon(file).run() == 1   # its liveness probe does the same
+    rc, out, err = forward(file, ["list"])
+    assert rc == 0 and seeded.id in out and err == ""
+    time.sleep(0.1)   # the hang-ups are handled by now
+    assert "already serving" in capsys.readouterr().err
+    assert caplog.records == []
+    assert capsys.readouterr().err == ""
+
+
+def test_no_daemon_falls_back(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    file = tmp_path / "tasks.json"
+    assert forward(file, ["list"]) is None
+    socket_path(file).parent.mkdir(mode=0o700)
+    socket_path(file).touch()  # stale socket file
+    assert forward(file, ["list"]) is None
+
+
+def test_socket_is_private(daemon, monkeypatch):
+    import os
+    import stat
+    file, _, _ = daemon
+    sock = socket_path(file)
+    assert stat.S_IMODE(sock.parent.stat().st_mode) == 0o700
+    assert forward(file, ["list"]) is not None
+    # a socket in a directory others can write to is not trusted
+    os.chmod(sock.parent, 0o777)
+    try:
+        assert forward(file, ["list"]) is None
+    finally:
+        os.chmod(sock.parent, 0o700)
+    # nor one owned by another user
+    from tasks3 import daemon as daemon_module
+    uid = os.getuid()
+    monkeypatch.setattr(os, "getuid", lambda: uid + 1)
+    assert daemon_module._connect(sock) is None
+
+
+def test_daemon_refuses_a_shared_socket_dir(tmp_path: Path, monkeypatch, capsys):
+    import os
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    file = tmp_path / "tasks.json"
+    socket_path(file).parent.mkdir(mode=0o755)
+    os.chmod(socket_path(file).parent, 0o755)
+    assert Daemon(file).run() == 1
+    assert "mode 0700" in capsys.readouterr().err
+
+
+def test_daemon_reads_forwarded_stdin(daemon, monkeypatch, capsys):
+    import io
+    file, seeded, _ = daemon
+    monkeypatch.setattr("sys.stdin", io.StringIO('{"title": "Piped in"}\n'))
+    assert cli_main(["--file", str(file), "add", "-"]) == 0
+    monkeypatch.setattr("sys.stdin", io.StringIO(seeded.id + "\n"))
+    assert cli_main(["--file", str(file), "complete", "-"]) == 0
+    assert capsys.readouterr().out.splitlines()[-1] == "OK"
+    cli_main(["--file", str(file), "search", "piped"])
+    assert "Piped in" in capsys.readouterr().out
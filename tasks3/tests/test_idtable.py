@@ -0,0 +1,163 @@
+# tasks3/tests/test_idtable.py
+import json
+from pathlib import Path
+
+import pytest
+
+from tasks3 import idtable, snapshot
+from tasks3.cli import main as cli_main
+from tasks3.filestore import FileBackend
+from tasks3.index import sidecar_path
+from tasks3.store import (
+    add_task, compact, convert, filter_tasks, get_task, load_all, mark_complete, new_task, search,
+)
+
+pytestmark = pytest.mark.usefixtures("no_store_cache")
+
+
+def test_record_spans_bytes(tmp_path: Path):
+    recs = [{"id": "a", "title": "Ünïcode ✓"}, {"id": "b", "title": "plain", "tags": ["x"]}]
+    data = json.dumps(recs, indent=2, ensure_ascii=False).encode("utf-8")
+    spans = list(idtable.record_spans(data))
+    assert [s[0] for s in spans] == ["a", "b"]
+    assert [json.loads(data[off:off + n]) for _, off, n in spans] == recs
+    assert list(idtable.record_spans(b"[]")) == []
+
+
+def test_lookup_reads_one_record(tmp_path: Path, monkeypatch):
+    file = tmp_path / "tasks.json"
+    tasks = [add_task(file, f"Task {i}") for i in range(50)]
+    compact(file)
+    b = FileBackend(file)
+    assert b.get(tasks[7].id).title == "Task 7"    # builds the table
+    assert sidecar_path(file, idtable.ID_SUFFIX).exists()
+
+    def no_scan(*a, **k):
+        raise AssertionError("scanned the snapshot")
+    for name in ("load", "iter_load", "load_stat", "iter_load_stat"):
+        monkeypatch.setattr(snapshot, name, no_scan)
+    assert b.get(tasks[31].id).title == "Task 31"
+    assert b.get("nope") is None
+    assert b.complete(tasks[3].id) and not b.complete("nope")
+    # journal state on top of the snapshot record, and journal-only tasks
+    assert b.get(tasks[3].id).completed
+    new = add_task(file, "Fresh")
+    assert b.get(new.id).title == "Fresh"
+    assert b.complete(new.id) and b.get(new.id).completed
+
+
+def test_table_rebuilt_when_stale(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    a = add_task(file, "A")
+    compact(file)
+    assert get_task(file, a.id).title == "A"
+    b = add_task(file, "B")
+    mark_complete(file, a.id)
+    compact(file)   # new snapshot: offsets move
+    assert get_task(file, b.id).title == "B"
+    assert get_task(file, a.id).completed
+    convert(file, "columnar")   # no table: falls back to a scan
+    assert get_task(file, b.id).title == "B"
+    assert [t.id for t in load_all(file)] == [a.id, b.id]
+
+
+def test_cli_show(tmp_path: Path, capsys):
+    file = tmp_path / "tasks.json"
+    a = add_task(file, "Shown")
+    assert cli_main(["--file", str(file), "show", a.id, "--format", "ids"]) == 0
+    assert capsys.readouterr().out.split() == [a.id]
+    assert cli_main(["--file", str(file), "show", a.id, "zzz"]) == 1
+    out = capsys.readouterr()
+    assert "Shown" in out.out and "NOT FOUND zzz" in out.err
+
+
+def _counting_encode(monkeypatch):
+    calls = []
+    real = idtable.encode
+    monkeypatch.setattr(idtable, "encode", lambda rec, *a: calls.append(rec["id"]) or real(rec, *a))
+    return calls
+
+
+@pytest.mark.parametrize("one_line", [False, True])
+def test_compaction_encodes_only_changed_records(tmp_path: Path, monkeypatch, one_line: bool):
+    file = tmp_path / "tasks.json"
+    tasks = [add_task(file, f"Task {i}", tags=["ü"]) for i in range(30)]
+    compact(file)
+    if one_line:
+        recs = snapshot.load(file)
+        file.write_text("[\n" + ",\n".join(json.dumps(r) for r in recs) + "\n]", encoding="utf-8")
+    assert len(search(file, "task")) == 30 and filter_tasks(file, "done") == []   # builds indexes
+    mark_complete(file, tasks[4].id)
+    mark_complete(file, tasks[29].id)
+    new = add_task(file, "Fresh")
+    expect = [t.to_dict() for t in load_all(file)]
+    monkeypatch.setattr(snapshot, "dump", None)   # no full rewrite
+    calls = _counting_encode(monkeypatch)
+    compact(file)
+    assert sorted(calls) == sorted([tasks[4].id, tasks[29].id, new.id])
+    assert snapshot.load(file) == expect
+    assert get_task(file, new.id).title == "Fresh" and get_task(file, tasks[4].id).completed
+    # the indexes were carried through compaction
+    assert sidecar_path(file, ".textidx").exists() and sidecar_path(file, ".fieldidx").exists()
+    assert [t.title for t in search(file, "Fresh")] == ["Fresh"]
+    assert [t.id for t in filter_tasks(file, "done")] == [tasks[4].id, tasks[29].id]
+
+
+def test_rewrite_moves_records_after_a_grown_one(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    recs = [new_task(f"T{i}").to_dict() for i in range(5)]
+    snapshot.dump(file, recs)
+    assert idtable.build(file)
+    with idtable.IdTable.open(file) as table:
+        span, rec = table.find(recs[1]["id"])
+        grown = dict(rec, title="A much longer title than before")
+        idtable.rewrite(file, table, {span.pos: (span, grown)}, [new_task("X").to_dict()])
+    assert json.loads(file.read_bytes()) == [recs[0], grown, *recs[2:], snapshot.load(file)[-1]]
+    with idtable.IdTable.open(file) as table:   # the saved table is current
+        assert table.count == 6
+        assert [table.get(r["id"])["title"] for r in recs] == ["T0", grown["title"], "T2", "T3", "T4"]
+
+
+def test_adds_to_empty_snapshot(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    FileBackend(file).init()
+    a = add_task(file, "First")
+    compact(file)
+    assert json.loads(file.read_bytes()) == [a.to_dict()]
+    assert get_task(file, a.id).title == "First"
+
+
+def test_table_built_across_a_compaction_is_not_trusted(tmp_path: Path, monkeypatch):
+    file = tmp_path / "tasks.json"
+    tasks = [add_task(file, f"Task {i}") for i in range(5)]
+    compact(file)
+    sidecar_path(file, idtable.ID_SUFFIX).unlink()
+    real = idtable.record_spans
+
+    def racing(data):
+        # another process compacts between the read and the save; the
+        # records after the first move by a byte
+        monkeypatch.setattr(idtable, "record_spans", real)
+        mark_complete(file, tasks[0].id)
+        convert(file, "columnar")
+        convert(file, "json")
+        return real(data)
+    monkeypatch.setattr(idtable, "record_spans", racing)
+    assert idtable.IdTable.open(file) is None   # stamped for the bytes it was built from
+    with idtable.IdTable.open(file) as table:
+        assert [table.get(t.id)["title"] for t in tasks] == [f"Task {i}" for i in range(5)]
+    assert get_task(file, tasks[0].id).completed
+    assert get_task(file, tasks[4].id).title == "Task 4"
+
+
+def test_compaction_rewrites_when_the_table_lacks_a_task(tmp_path: Path, monkeypatch):
+    file = tmp_path / "tasks.json"
+    tasks = [add_task(file, f"Task {i}") for i in range(5)]
+    compact(file)
+    mark_complete(file, tasks[2].id)
+    with monkeypatch.context() as m:
+        real = idtable.IdTable.find
+        m.setattr(idtable.IdTable, "find", lambda self, tid: None if tid == tasks[2].id else real(self, tid))
+        compact(file)
+    assert [r.get("completed", False) for r in snapshot.load(file)] == [False, False, True, False, False]
+    assert get_task(file, tasks[2].id).completed
@@ -0,0 +1,179 @@
+# tasks3/tests/test_index.py
+from pathlib import Path
+
+import pytest
+
+from tasks3 import index
+from tasks3.filestore import FileBackend
+from tasks3.index import FIELD_SUFFIX, TEXT_SUFFIX, FieldIndex, TextIndex, sidecar_path
+from tasks3.store import add_task, compact, filter_tasks, mark_complete, search
+
+# these tests exercise the on-disk sidecar indexes
+pytestmark = pytest.mark.usefixtures("no_store_cache")
+
+
+def _naive(file: Path, query: str):
+    from tasks3.store import load_all
+    q = query.lower()
+    return [
+        t.id for t in load_all(file)
+        if q in t.title.lower()
+        or q in (t.description or "").lower()
+        or any(q in tag.lower() for tag in t.tags)
+    ]
+
+
+def test_search_matches_substring_scan(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    from tasks3.store import mark_complete
+    w = add_task(file, "Write CSC299 report", tags=["School"])
+    add_task(file, "Buy milk", description="and eggs")
+    compact(file)
+    search(file, "report")
+    mark_complete(file, w.id)
+    add_task(file, "Report back", tags=["work"])
+    add_task(file, "Groceries", tags=["MILKRUN"])
+    for q in ["", "r", "re", "report", "REPORT", "milk", "ggs", "ool", "xyz", "csc299 r", "k a"]:
+        assert [t.id for t in search(file, q)] == _naive(file, q), q
+
+
+def test_index_persisted_and_carried_over_compaction(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    a = add_task(file, "alpha")
+    search(file, "alp")  # builds the index for the (empty) snapshot
+    assert TextIndex.load(file) is not None
+    compact(file)
+    idx = TextIndex.load(file)
+    assert idx is not None and idx.count == 1
+    assert idx.candidates("alp") == {0}
+    assert [t.id for t in search(file, "lph")] == [a.id]
+
+
+def test_stale_index_is_rebuilt(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    add_task(file, "first")
+    compact(file)
+    search(file, "fir")
+    sidecar_path(file, TEXT_SUFFIX).write_text("garbage", encoding="utf-8")
+    assert [t.title for t in search(file, "irs")] == ["first"]
+    assert TextIndex.load(file) is not None
+
+
+def _naive_filter(file: Path, mode: str, value=None):
+    from tasks3.store import load_all
+    tasks = load_all(file)
+    preds = {
+        "overdue": lambda t: t.is_overdue(),
+        "today": lambda t: t.is_due_today(),
+        "priority": lambda t: t.priority == value,
+        "tag": lambda t: value in t.tags,
+        "open": lambda t: not t.completed,
+        "done": lambda t: t.completed,
+    }
+    return [t.id for t in tasks if preds[mode](t)]
+
+
+def test_filter_indexes_follow_journal_and_compaction(tmp_path: Path):
+    from datetime import date, timedelta
+    from tasks3.index import FieldIndex
+    from tasks3.store import filter_tasks, mark_complete
+
+    file = tmp_path / "tasks.json"
+    today = date.today()
+    day = lambda n: (today + timedelta(days=n)).strftime("%Y-%m-%d")
+    a = add_task(file, "a", due=day(-2), priority="high", tags=["work"])
+    add_task(file, "b", due=day(0), tags=["home", "work"])
+    c = add_task(file, "c", due=day(-1), priority="low")
+    add_task(file, "d", due=day(3), priority="high", tags=["home"])
+    compact(file)
+    filter_tasks(file, "open")  # persist the index for this snapshot
+    mark_complete(file, a.id)
+    e = add_task(file, "e", due=day(-5), tags=["work"])
+
+    cases = [("overdue", None), ("today", None), ("priority", "high"), ("priority", "low"),
+             ("tag", "work"), ("tag", "home"), ("tag", "nope"), ("open", None), ("done", None)]
+
+    def check():
+        for mode, value in cases:
+            got = [t.id for t in filter_tasks(file, mode, value)]
+            assert got == _naive_filter(file, mode, value), (mode, value)
+
+    check()
+    assert [t.id for t in filter_tasks(file, "overdue")] == [c.id, e.id]
+    compact(file)
+    idx = FieldIndex.load(file)
+    assert idx is not None and idx.count == 5 and idx.is_done(0)
+    check()
+
+
+def test_index_built_across_a_compaction_is_not_trusted(tmp_path: Path, monkeypatch):
+    file = tmp_path / "tasks.json"
+    tasks = [add_task(file, f"Task {i}") for i in range(10)]
+    compact(file)
+    sidecar_path(file, FIELD_SUFFIX).unlink(missing_ok=True)
+    real = FieldIndex.add
+
+    def racing(self, pos, rec):
+        # another process completes a task and compacts mid-scan
+        monkeypatch.setattr(FieldIndex, "add", real)
+        mark_complete(file, tasks[5].id)
+        compact(file)
+        real(self, pos, rec)
+    monkeypatch.setattr(FieldIndex, "add", racing)
+    assert list(FileBackend(file).iter_filter("done")) == []   # the store as it was
+    assert FieldIndex.load(file) is None   # stamped for the file it was built from
+    assert [t.id for t in filter_tasks(file, "done")] == [tasks[5].id]
+    assert FieldIndex.load(file).lookup("done", None, 0) == [5]
+    assert index.snapshot_stamp(file) == index._read_sidecar(file, FIELD_SUFFIX)["stamp"]
+
+
+def test_filter_reads_only_candidates(tmp_path: Path, monkeypatch):
+    from tasks3 import snapshot
+    from tasks3.idtable import IdTable
+
+    file = tmp_path / "tasks.json"
+    tasks = [add_task(file, f"Task {i}", tags=["rare"] if i % 10 == 0 else []) for i in range(50)]
+    compact(file)
+    assert len(filter_tasks(file, "tag", "rare")) == 5   # builds the indexes
+    mark_complete(file, tasks[3].id)
+    new = add_task(file, "Fresh", tags=["rare"])
+
+    def no_scan(*a, **k):
+        raise AssertionError("scanned the snapshot")
+    monkeypatch.setattr(snapshot, "load_stat", no_scan)
+    monkeypatch.setattr(snapshot, "iter_load_stat", no_scan)
+    read = []
+    real = IdTable.record
+    monkeypatch.setattr(IdTable, "record", lambda self, pos: read.append(pos) or real(self, pos))
+    assert [t.id for t in filter_tasks(file, "tag", "rare")] == [
+        tasks[i].id for i in range(0, 50, 10)] + [new.id]
+    assert read == [0, 10, 20, 30, 40]
+    assert [t.id for t in filter_tasks(file, "done")] == [tasks[3].id]
+
+
+def test_text_index_round_trips_sparse_and_dense_grams(tmp_path: Path):
+    import os
+    file = tmp_path / "tasks.json"
+    file.write_text("[]", encoding="utf-8")
+    recs = [{"id": str(i), "title": f"common {'rare' if i % 50 == 0 else 'x'} {i}", "tags": []}
+            for i in range(200)]
+    built = TextIndex.build(recs)
+    built.save(file, os.stat(file))
+    assert sidecar_path(file, TEXT_SUFFIX).stat().st_size < 4 * sum(map(len, built.grams.values()))
+    idx = TextIndex.load(file)
+    for q in ["common", "rare", "rare 1", "mon", "x 19", "zzz", "co"]:
+        assert idx.candidates(q) == built.candidates(q), q
+    assert idx.grams == {}   # nothing decoded for lookups
+
+    # changes after loading go to the grams they touch, and are saved
+    new = {"id": "new", "title": "rare common", "tags": []}
+    idx.replace(0, recs[0], dict(recs[0], title="plain"))
+    idx.add(200, new)
+    assert idx.candidates("rare") == {50, 100, 150, 200}
+    assert idx.candidates("common") == set(range(1, 201))
+    idx.save(file, os.stat(file))
+    again = TextIndex.load(file)
+    assert again.count == 201
+    assert again.candidates("rare") == {50, 100, 150, 200}
+    assert again.candidates("common") == set(range(1, 201))
+    assert again.candidates("plain") == {0}
@@ -0,0 +1,56 @@
+# tasks3/tests/test_instrument.py
+import json
+import pstats
+from pathlib import Path
+
+from tasks3 import instrument
+from tasks3.cli import main as cli_main
+from tasks3.store import add_task
+
+
+def test_spans_are_noops_when_disabled():
+    instrument.disable()
+    instrument.reset()
+    with instrument.span("x"):
+        instrument.count("n")
+    f = lambda: 1
+    assert instrument.timed("f", f) is f
+    it = iter([1])
+    assert instrument.timed_iter("i", it) is it
+    assert instrument.report() == {"spans": {}, "counters": {}}
+
+
+def test_nested_spans_report_self_time():
+    instrument.enable()
+    try:
+        with instrument.span("outer"):
+            with instrument.span("inner"):
+                sum(range(10000))
+            list(instrument.timed_iter("items", iter(range(3))))
+        instrument.count("things", 2)
+        rep = instrument.report()
+    finally:
+        instrument.disable()
+    outer, inner = rep["spans"]["outer"], rep["spans"]["inner"]
+    assert rep["spans"]["items"]["calls"] == 4  # three items + exhaustion
+    assert outer["total"] >= inner["total"] + outer["self"] - 1e-9
+    assert outer["self"] < outer["total"]
+    assert rep["counters"] == {"things": 2}
+
+
+def test_cli_profile_outputs(tmp_path: Path, capsys):
+    file = tmp_path / "tasks.json"
+    add_task(file, "Profile me", tags=["p"])
+    assert cli_main(["--file", str(file), "--profile", "search", "prof"]) == 0
+    err = capsys.readouterr().err
+    assert "cli.command" in err and "records.scanned" in err and "tasks.output" in err
+
+    out = tmp_path / "trace.json"
+    assert cli_main(["--file", str(file), "--profile-out", str(out), "list"]) == 0
+    rep = json.loads(out.read_text())
+    assert rep["counters"]["tasks.output"] == 1 and "cli.parse" in rep["spans"]
+
+    prof = tmp_path / "trace.prof"
+    assert cli_main(["--file", str(file), "--profile-out", str(prof), "filter", "open"]) == 0
+    assert pstats.Stats(str(prof)).total_calls > 0
+    assert not instrument.enabled
@@ -0,0 +1,56 @@
+# tasks3/tests/test_journal.py
+import json
+from pathlib import Path
+
+from tasks3 import journal
+from tasks3.store import add_task, load_all, mark_complete, compact, save_all
+
+
+def test_add_appends_to_journal_not_snapshot(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    t = add_task(file, "Journaled")
+    assert json.loads(file.read_text(encoding="utf-8")) == []
+    ops = journal.read(file)
+    assert ops == [{"op": "add", "task": t.to_dict()}]
+    assert [x.id for x in load_all(file)] == [t.id]
+
+
+def test_complete_replays_and_compact_folds(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    a = add_task(file, "A")
+    b = add_task(file, "B")
+    assert mark_complete(file, a.id) is True
+    assert mark_complete(file, "nope") is False
+
+    compact(file)
+    assert not journal.journal_path(file).exists()
+    raw = json.loads(file.read_text(encoding="utf-8"))
+    assert [(r["id"], r["completed"]) for r in raw] == [(a.id, True), (b.id, False)]
+
+
+def test_compaction_threshold(tmp_path: Path, monkeypatch):
+    file = tmp_path / "tasks.json"
+    monkeypatch.setattr(journal, "COMPACT_BYTES", 1)
+    t = add_task(file, "Compacted right away")
+    assert not journal.journal_path(file).exists()
+    assert [r["id"] for r in json.loads(file.read_text(encoding="utf-8"))] == [t.id]
+
+
+def test_replay_ignores_torn_tail_and_duplicate_adds(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    t = add_task(file, "Once")
+    save_all(file, load_all(file))
+    # journal left behind by a crash after the snapshot was written
+    journal.append(file, [{"op": "add", "task": t.to_dict()}])
+    with journal.journal_path(file).open("a", encoding="utf-8") as f:
+        f.write('{"op": "complete", "id"')
+    tasks = load_all(file)
+    assert [(x.id, x.completed) for x in tasks] == [(t.id, False)]
+
+
+def test_append_after_torn_line(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    journal.append(file, [])
+    journal.journal_path(file).write_text('{"op": "add", "ta', encoding="utf-8")
+    t = add_task(file, "After crash")
+    assert [x.id for x in load_all(file)] == [t.id]
@@ -0,0 +1,164 @@
+# tasks3/tests/test_migrate.py
+import itertools
+import json
+from pathlib import Path
+
+import pytest
+
+from tasks3 import cli, fsutil, snapshot
+from tasks3.backend import open_backend
+from tasks3.bench.generate import generate
+from tasks3.cli import main as cli_main
+from tasks3.filestore import FileBackend
+from tasks3.migrate import LEGACY_SUFFIX, _HashSet, default_sources, detect, migrate
+from tasks3.store import add_task, load_all
+
+pytestmark = pytest.mark.usefixtures("no_store_cache")
+
+TASKS1 = [{"title": "Buy milk"}, {"title": "  Call bob ", "description": "at 5"}, {"title": ""}]
+TASKS1_STORE = {"version": 1, "meta": {"tasks": "not these"},
+                "tasks": [{"text": "Buy milk", "created": "2020-01-01T10:00:00"},
+                          {"text": "Water plants", "created": "2020-01-02T10:00:00"}]}
+TASKS2 = [{"id": "aaaa1111", "title": "Pay rent", "description": "", "due": "2030-01-01",
+           "priority": "high", "tags": ["home"], "completed": True},
+          {"id": "bbbb2222", "title": "Bad date", "due": "someday"},
+          {"id": "aaaa1111", "title": "Same id, other task", "tags": ["x"]}]
+
+
+def _write(tmp_path: Path, name: str, data) -> Path:
+    path = tmp_path / name
+    path.write_text(json.dumps(data), encoding="utf-8")
+    return path
+
+
+@pytest.fixture
+def legacy(tmp_path: Path):
+    return (_write(tmp_path, "t1.json", TASKS1), _write(tmp_path, "t1s.json", TASKS1_STORE),
+            _write(tmp_path, "t2.json", TASKS2))
+
+
+def test_detect(tmp_path: Path, legacy):
+    assert [detect(p) for p in legacy] == ["tasks1", "tasks1-store", "tasks2"]
+    assert detect(_write(tmp_path, "empty.json", [])) == "tasks2"   # as a new store is
+    with pytest.raises(ValueError):
+        detect(_write(tmp_path, "other.json", {"tasks": 3}))
+    with pytest.raises(ValueError):
+        detect(_write(tmp_path, "text.json", "hello"))
+
+
+def test_migrate_dedups_and_renumbers(tmp_path: Path, legacy):
+    file = tmp_path / "tasks.json"
+    mine = add_task(file, "Water plants")
+    with FileBackend(file) as store:
+        stats = migrate(store, list(legacy))
+    counts = [(s["format"], s["added"], s["duplicates"], s["skipped"]) for s in stats.values()]
+    assert counts == [("tasks1", 2, 0, 1), ("tasks1-store", 0, 2, 0), ("tasks2", 2, 0, 1)]
+
+    tasks = load_all(file)
+    assert [t.title for t in tasks] == ["Water plants", "Buy milk", "Call bob", "Pay rent",
+                                       "Same id, other task"]
+    assert tasks[0].id == mine.id and tasks[3].id == "aaaa1111"
+    assert len({t.id for t in tasks}) == 5   # the clashing id was replaced
+    assert (tasks[2].description, tasks[2].priority, tasks[2].tags) == ("at 5", "medium", [])
+    assert (tasks[3].due, tasks[3].priority, tasks[3].completed) == ("2030-01-01", "high", True)
+
+    with FileBackend(file) as store:   # again: nothing new
+        stats = migrate(store, list(legacy))
+    assert [s["added"] for s in stats.values()] == [0, 0, 0]
+    assert len(load_all(file)) == 5
+
+
+def test_migrate_in_place_keeps_the_legacy_file(tmp_path: Path, legacy):
+    file = _write(tmp_path, "tasks.json", TASKS1)
+    with FileBackend(file) as store:
+        stats = migrate(store, [file, legacy[2]])
+    kept = file.with_name("tasks.json" + LEGACY_SUFFIX)
+    assert stats[str(file)]["kept"] == kept
+    assert json.loads(kept.read_text()) == TASKS1
+    assert detect(file) == "tasks2"
+    assert [t.title for t in load_all(file)] == ["Buy milk", "Call bob", "Pay rent", "Same id, other task"]
+
+    with FileBackend(file) as store:
+        with pytest.raises(ValueError, match="store itself"):
+            migrate(store, [file])
+
+
+def test_failed_migration_leaves_the_legacy_file_in_place(tmp_path: Path, legacy, monkeypatch):
+    file = _write(tmp_path, "tasks.json", TASKS1)
+    before = sorted(p.name for p in tmp_path.iterdir())
+    real = FileBackend.extend
+
+    def failing(self, records, batch=10000):
+        def interrupted():
+            yield from itertools.islice(records, 2)
+            raise OSError("disk full")
+        real(self, interrupted(), batch)
+    monkeypatch.setattr(FileBackend, "extend", failing)
+    with FileBackend(file) as store:
+        with pytest.raises(OSError, match="disk full"):
+            migrate(store, [file, legacy[2]])
+    assert json.loads(file.read_text()) == TASKS1
+    assert sorted(p.name for p in tmp_path.iterdir()) == before
+
+    monkeypatch.setattr(FileBackend, "extend", real)
+    with FileBackend(file) as store:
+        assert migrate(store, [file])[str(file)]["added"] == 2
+    assert detect(file) == "tasks2"
+    assert json.loads(file.with_name("tasks.json" + LEGACY_SUFFIX).read_text()) == TASKS1
+
+
+@pytest.mark.parametrize("name", ["tasks.shards", "tasks.db"])
+def test_migrate_into_other_backends(tmp_path: Path, legacy, name: str):
+    with open_backend(tmp_path / name) as store:
+        stats = migrate(store, list(legacy))
+    assert sum(s["added"] for s in stats.values()) == 5
+    with open_backend(tmp_path / name) as store:
+        assert sorted(t.title for t in store.iter_tasks()) == [
+            "Buy milk", "Call bob", "Pay rent", "Same id, other task", "Water plants"]
+
+
+def test_cli_migrates_the_default_files(tmp_path: Path, monkeypatch, capsys):
+    data = tmp_path / "data"
+    data.mkdir()
+    monkeypatch.setattr(cli, "DEFAULT_DATA_FILE", data / "tasks.json")
+    assert cli_main(["migrate"]) == 1
+    assert default_sources(data) == []   # the new, empty store is not a legacy file
+
+    _write(data, "tasks.json", TASKS1_STORE)
+    _write(data, "tasks2.json", TASKS2)
+    assert cli_main(["migrate"]) == 0
+    out = capsys.readouterr().out.splitlines()
+    assert out[0] == f"MIGRATED {data / 'tasks.json'} (tasks1-store): 2 added, 0 duplicates, 0 skipped"
+    assert out[1] == f"KEPT the tasks1-store file as {data / 'tasks.json'}{LEGACY_SUFFIX}"
+    assert out[2].endswith("(tasks2): 2 added, 0 duplicates, 1 skipped")
+    assert default_sources(data) == [data / "tasks2.json"]   # tasks.json is tasks3 now
+    assert cli_main(["--file", str(data / "tasks.json"), "migrate", str(tmp_path / "missing.json")]) == 2
+
+
+def test_dump_iter_streams_the_same_bytes(tmp_path: Path):
+    records = list(generate(25, seed=1))
+    for n in (0, 1, 10, 25):
+        snapshot.dump(tmp_path / "a.json", records[:n])
+        assert snapshot.dump_iter(tmp_path / "b.json", iter(records[:n]), batch=10) == n
+        assert (tmp_path / "a.json").read_bytes() == (tmp_path / "b.json").read_bytes()
+
+
+def test_replacing_keeps_the_old_file_on_failure(tmp_path: Path):
+    path = tmp_path / "tasks.json"
+    path.write_bytes(b"old")
+    with pytest.raises(RuntimeError):
+        with fsutil.replacing(path) as f:
+            f.write(b"half")
+            raise RuntimeError
+    assert path.read_bytes() == b"old"
+    assert [p.name for p in tmp_path.iterdir()] == ["tasks.json"]
+
+
+def test_hash_set_grows():
+    s = _HashSet(slots=8)
+    try:
+        assert all(s.add(h) for h in range(1, 1001))
+        assert not any(s.add(h) for h in range(1, 1001))
+        assert s.count == 1000 and len(s.slots) == 2048
+    finally:
+        s.close()
@@ -0,0 +1,44 @@
+# tasks3/tests/test_model.py
+import json
+from datetime import date, timedelta
+
+import pytest
+
+from tasks3.model import Task, parse_due
+
+
+def test_task_is_slotted_and_to_dict_unchanged():
+    t = Task(id="abc", title="T", due="2025-11-03", priority="bogus", tags=["a", "b"])
+    assert not hasattr(t, "__dict__")
+    assert json.dumps(t.to_dict()) == json.dumps({
+        "id": "abc", "title": "T", "description": "", "due": "2025-11-03",
+        "priority": "medium", "tags": ["a", "b"], "completed": False,
+    })
+
+
+def test_from_dicts_matches_constructor():
+    raws = [
+        {"id": "1", "title": "a", "description": "d", "due": "2025-01-02",
+         "priority": "high", "tags": ["x"], "completed": True},
+        {"id": "2", "title": "b", "description": "", "due": None,
+         "priority": "weird", "tags": [], "completed": False},
+    ]
+    assert Task.from_dicts(raws) == [Task(**r) for r in raws]
+    assert [t.to_dict() for t in Task.from_dicts(raws)] == [Task(**r).to_dict() for r in raws]
+
+
+def test_due_parsed_once_and_reparsed_on_change():
+    yesterday = (date.today() - timedelta(days=1)).strftime("%Y-%m-%d")
+    t = Task(id="1", title="t", due=yesterday)
+    assert t.is_overdue() and not t.is_due_today()
+    t.due = date.today().strftime("%Y-%m-%d")
+    assert t.is_due_today() and not t.is_overdue()
+
+
+def test_parse_due_accepts_what_strptime_accepts():
+    assert parse_due("2025-1-3") == date(2025, 1, 3).toordinal()
+    assert parse_due("2025-11-03") == date(2025, 11, 3).toordinal()
+    with pytest.raises(ValueError):
+        parse_due("2025-13-01")
+    with pytest.raises(ValueError):
+        Task(id="1", title="t", due="nope")
@@ -0,0 +1,47 @@
+# tasks3/tests/test_output.py
+import csv
+import io
+import json
+from pathlib import Path
+
+from tasks3 import output
+from tasks3.cli import main as cli_main
+from tasks3.model import Task
+from tasks3.output import write_tasks
+from tasks3.store import add_task, load_all
+
+TASKS = [
+    Task("a1", "Tabs\tand\nnewlines", "desc, with comma", "2025-01-02", "high", ["x", "y"], True),
+    Task("b2", 'Quote " here', "", None, "low", [], False),
+]
+
+
+def _write(fmt, fields=None):
+    buf = io.StringIO()
+    assert write_tasks(TASKS, buf, fmt, fields) == 2
+    return buf.getvalue()
+
+
+def test_formats_round_trip(monkeypatch):
+    monkeypatch.setattr(output, "BATCH", 1)
+    assert [json.loads(line) for line in _write("jsonl").splitlines()] == [t.to_dict() for t in TASKS]
+    assert _write("ids") == "a1\nb2\n"
+    rows = list(csv.reader(io.StringIO(_write("csv", ["id", "title", "tags", "due"]))))
+    assert rows == [["id", "title", "tags", "due"],
+                    ["a1", "Tabs\tand\nnewlines", "x,y", "2025-01-02"], ["b2", 'Quote " here', "", ""]]
+    tsv = _write("tsv", ["id", "title", "completed"]).splitlines()
+    assert tsv == ["id\ttitle\tcompleted", "a1\tTabs\\tand\\nnewlines\ttrue", 'b2\tQuote " here\tfalse']
+    assert _write("text").splitlines()[-1] == "b2 :: Quote \" here :: [] :: prio=low :: due=None :: done=False"
+
+
+def test_cli_format_and_fields(tmp_path: Path, capsys):
+    file = tmp_path / "tasks.json"
+    for i in range(3):
+        add_task(file, f"Task {i}", tags=["t"])
+    assert cli_main(["--file", str(file), "list", "--format", "jsonl", "--fields", "id,title"]) == 0
+    rows = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert rows == [{"id": t.id, "title": t.title} for t in load_all(file)]
+    assert cli_main(["--file", str(file), "search", "task", "--format", "ids", "--limit", "2"]) == 0
+    assert capsys.readouterr().out.splitlines() == [t.id for t in load_all(file)[:2]]
+    assert cli_main(["--file", str(file), "list", "--format", "csv", "--fields", "id,nope"]) == 2
+    assert "nope" in capsys.readouterr().err
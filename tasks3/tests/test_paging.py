@@ -0,0 +1,81 @@
+# tasks3/tests/test_paging.py
+from pathlib import Path
+
+import pytest
+
+from tasks3.bench.generate import generate
+from tasks3.cli import main as cli_main
+from tasks3.model import Task
+from tasks3.paging import SORT_KEYS, CursorError, encode_cursor, page
+from tasks3.store import save_all
+
+TASKS = Task.from_dicts(generate(500, seed=5))
+
+
+@pytest.mark.parametrize("sort", [None, *SORT_KEYS])
+def test_pages_match_full_sort(sort):
+    full = TASKS if sort is None else sorted(TASKS, key=SORT_KEYS[sort])
+    assert page(iter(TASKS), sort, 20, 40)[0] == full[40:60]
+    assert page(iter(TASKS), sort)[0] == full
+    # walking the cursors visits everything once, in order
+    seen, cursor = [], None
+    while True:
+        got, cursor = page(iter(TASKS), sort, 64, 0, cursor)
+        seen += got
+        if cursor is None:
+            break
+    assert seen == full
+
+
+def test_page_is_streamed_not_sorted(monkeypatch):
+    consumed = []
+
+    def stream():
+        for t in TASKS:
+            consumed.append(t)
+            yield t
+    got, cursor = page(stream(), None, 5)
+    assert got == TASKS[:5] and len(consumed) == 6 and cursor
+
+
+def test_bad_cursor():
+    _, cursor = page(iter(TASKS), "due", 5)
+    with pytest.raises(CursorError):
+        page(iter(TASKS), "title", 5, 0, cursor)
+    with pytest.raises(CursorError):
+        page(iter(TASKS), None, 5, 0, "!!")
+
+
+@pytest.mark.parametrize("sort, key", [
+    (None, "5"), (None, -1), (None, True), (None, [5]),
+    ("due", 5), ("due", [0, 1]), ("due", [0, "1", "x"]), ("due", [0, 1, 2]),
+    ("priority", [0, 0, 1, "x", "y"]), ("title", ["a", 1]), ("title", [["a"], "b"]),
+])
+def test_cursor_with_a_bad_key(tmp_path: Path, capsys, sort, key):
+    cursor = encode_cursor(sort, key)
+    with pytest.raises(CursorError):
+        page(iter(TASKS), sort, 5, 0, cursor)
+    file = tmp_path / "tasks.json"
+    save_all(file, TASKS[:10])
+    args = ["--file", str(file), "list", "--limit", "3", "--cursor", cursor]
+    assert cli_main(args + (["--sort", sort] if sort else [])) == 2
+    assert capsys.readouterr().err == "tasks3: malformed cursor\n"
+
+
+def test_cli_sort_limit_cursor(tmp_path: Path, capsys):
+    file = tmp_path / "tasks.json"
+    save_all(file, TASKS)
+    args = ["--file", str(file), "filter", "open", "--sort", "priority", "--limit", "3"]
+    assert cli_main(args) == 0
+    out, err = capsys.readouterr()
+    want = sorted((t for t in TASKS if not t.completed), key=SORT_KEYS["priority"])
+    assert [line.split(" :: ")[0] for line in out.splitlines()] == [t.id for t in want[:3]]
+    cursor = err.split("next cursor: ")[1].strip()
+    assert cli_main(args + ["--cursor", cursor]) == 0
+    out = capsys.readouterr().out
+    assert [line.split(" :: ")[0] for line in out.splitlines()] == [t.id for t in want[3:6]]
+    assert cli_main(["--file", str(file), "list", "--offset", "498"]) == 0
+    assert len(capsys.readouterr().out.splitlines()) == 2
+    with pytest.raises(SystemExit):
+        cli_main(args + ["--cursor", cursor, "--offset", "1"])
+    assert "not allowed with argument" in capsys.readouterr().err
@@ -0,0 +1,82 @@
+# tasks3/tests/test_query.py
+from datetime import date, timedelta
+from pathlib import Path
+
+import pytest
+
+from tasks3 import shardstore
+from tasks3.bench.generate import generate
+from tasks3.cli import main as cli_main
+from tasks3.model import Task
+from tasks3.query import Query, QueryError
+from tasks3.store import add_task, filter_tasks, load_all, mark_complete, query_tasks, save_all, search
+
+QUERIES = [
+    "", "open", "done tag:work", "open tag:work prio:high report", '"lecture notes"',
+    "tag:home OR tag:work prio:low", "-tag:work open", "NOT open prio:high",
+    "overdue", "today OR overdue", "due<today", "due>=today due<=2099-01-01",
+    "due:none done", "due:today", "RePoRt -text:slides", "id:00000000", "ax",
+    "tag:nope OR #12", "tag:work OR ab", "ab OR prio:high due<today",
+]
+
+
+def _naive(tasks, text):
+    return [t for t in tasks if Query(text).match(t.to_dict())]
+
+
+def _seed(file: Path):
+    today = date.today()
+    tasks = Task.from_dicts(generate(400, seed=7))
+    tasks[0].due = today.isoformat()
+    save_all(file, tasks)
+    add_task(file, "Fresh report", due=(today - timedelta(days=3)).isoformat(), tags=["work"])
+    mark_complete(file, tasks[1].id)
+
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.db", "tasks.shards"])
+@pytest.mark.parametrize("cached", [False, True])
+def test_query_matches_naive_scan(tmp_path: Path, request, monkeypatch, name, cached):
+    if not cached:
+        request.getfixturevalue("no_store_cache")
+    monkeypatch.setattr(shardstore, "PARALLEL_BYTES", 0)
+    monkeypatch.setattr(shardstore, "_cpus", lambda: 2)
+    file = tmp_path / name
+    _seed(file)
+    tasks = load_all(file)
+    for text in QUERIES:
+        for _ in range(2):  # second time with the indexes built
+            got = query_tasks(file, text)
+            assert got == _naive(tasks, text), (name, text)
+    assert query_tasks(file, "prio:high", view=True) == _naive(tasks, "prio:high")
+
+
+def test_query_agrees_with_filter_and_search(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    _seed(file)
+    assert query_tasks(file, "overdue") == filter_tasks(file, "overdue")
+    assert query_tasks(file, "tag:work") == filter_tasks(file, "tag", "work")
+    assert query_tasks(file, '"review slides"') == search(file, "review slides")
+
+
+def test_planner_uses_indexes():
+    q = Query("tag:work report OR prio:high")
+    assert {c.__name__ for c in q.indexes()} == {"TextIndex", "FieldIndex"}
+    assert Query("-tag:work id:x ab").indexes() == set()
+
+
+@pytest.mark.parametrize("bad", ["OR open", "open OR", "zzz:1", "prio:urgent",
+                                 "due<someday", "due<none", "tag<x", "open NOT"])
+def test_bad_queries(bad):
+    with pytest.raises(QueryError):
+        Query(bad)
+
+
+def test_cli_query(tmp_path: Path, capsys):
+    file = tmp_path / "tasks.json"
+    add_task(file, "Write report", tags=["work"], priority="high")
+    add_task(file, "Read report", tags=["home"])
+    assert cli_main(["--file", str(file), "query", "report", "NOT", "tag:home"]) == 0
+    out = capsys.readouterr().out
+    assert "Write report" in out and "Read report" not in out
+    assert cli_main(["--file", str(file), "query", "prio:urgent"]) == 2
+    assert "bad query" in capsys.readouterr().err
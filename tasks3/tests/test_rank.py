@@ -0,0 +1,86 @@
+# tasks3/tests/test_rank.py
+from pathlib import Path
+
+import pytest
+
+from tasks3.backend import open_backend
+from tasks3.bench.generate import generate
+from tasks3.cli import main as cli_main
+from tasks3.index import RANK_SUFFIX, RankIndex, sidecar_path, within_edits
+from tasks3.model import Task
+from tasks3.store import add_task, compact, mark_complete, ranked_search, save_all
+
+
+def _recs(*titles, desc=""):
+    return [{"id": str(i), "title": t, "description": desc, "tags": []} for i, t in enumerate(titles)]
+
+
+def test_bm25_ordering():
+    recs = _recs("budget meeting", "meeting", "meeting about the budget and the other budget",
+                 "nothing relevant") + [
+        {"id": "d", "title": "misc", "description": "budget", "tags": []},
+        {"id": "t", "title": "misc", "description": "", "tags": ["budget"]},
+    ]
+    idx = RankIndex.build(recs)
+    order = [recs[p]["id"] for _, p in idx.top("budget", 10)]
+    # title beats tags beats description; shorter titles win
+    assert order[:2] == ["0", "2"] and order.index("t") < order.index("d")
+    assert "3" not in order and "1" not in order
+    assert [recs[p]["id"] for _, p in idx.top("budget meeting", 1)] == ["0"]
+    assert idx.top("zzz", 5) == [] and RankIndex().top("x", 5) == []
+
+
+def test_fuzzy():
+    assert within_edits("reprot", "report", 2) == 2
+    assert within_edits("report", "rport", 1) == 1
+    assert within_edits("report", "slides", 2) is None
+    idx = RankIndex.build(_recs("quarterly report", "slides", "item 12345"))
+    assert idx.top("reprot", 5) == []
+    assert [p for _, p in idx.top("reprot", 5, fuzzy=2)] == [0]
+    assert idx.top("12344", 5, fuzzy=2) == []  # numbers match exactly
+
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.db", "tasks.shards"])
+def test_backends_agree_and_follow_journal(tmp_path: Path, name: str, no_store_cache):
+    file, ref = tmp_path / name, tmp_path / "ref.json"
+    tasks = Task.from_dicts(generate(300, seed=2))
+    for f in (file, ref):
+        save_all(f, tasks)
+    ranked_search(ref, "report")  # writes the sidecar
+    stamp = sidecar_path(ref, RANK_SUFFIX).stat().st_mtime_ns
+    new = add_task(ref, "Quarterly report report", tags=["report"])
+    add_task(file, new.title, tags=new.tags)
+    mark_complete(ref, tasks[0].id)
+    mark_complete(file, tasks[0].id)
+
+    got = ranked_search(ref, "report", 5)
+    assert got[0].title == new.title  # found through the journal, no rebuild
+    assert sidecar_path(ref, RANK_SUFFIX).stat().st_mtime_ns == stamp
+    # the same scores (ties may come back in another order from shards)
+    with open_backend(file) as a, open_backend(ref) as b:
+        scores = lambda hits: [round(s, 9) for s, _ in hits]
+        assert scores(a.ranked("report", 20)) == scores(b.ranked("report", 20))
+    compact(ref)
+    assert [t.title for t in ranked_search(ref, "report", 5)] == [t.title for t in got]
+
+
+def test_cached_store_ranks_incrementally(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    save_all(file, Task.from_dicts(generate(100, seed=4)))
+    before = ranked_search(file, "invoice dentist", 3, fuzzy=1)
+    t = add_task(file, "Dentist invoice", description="invoice for the dentist")
+    assert ranked_search(file, "invoice dentist", 3)[0].id == t.id
+    assert ranked_search(file, "invoise dentst", 3, fuzzy=1)[0].id == t.id
+    assert len(before) == 3
+
+
+def test_cli_rank(tmp_path: Path, capsys):
+    file = tmp_path / "tasks.json"
+    add_task(file, "Something else", description="mentions report once")
+    add_task(file, "Report", tags=["report"])
+    assert cli_main(["--file", str(file), "search", "report", "--rank", "--format", "ids"]) == 0
+    ids = capsys.readouterr().out.split()
+    assert len(ids) == 2
+    assert cli_main(["--file", str(file), "search", "reprot", "--rank", "--fuzzy", "2",
+                     "--limit", "1", "--format", "ids"]) == 0
+    assert capsys.readouterr().out.split() == ids[:1]
@@ -0,0 +1,63 @@
+# tasks3/tests/test_shards.py
+from pathlib import Path
+
+import pytest
+
+from tasks3 import shardstore
+from tasks3.backend import open_backend
+from tasks3.bench.generate import generate
+from tasks3.model import Task
+from tasks3.shardstore import ShardedBackend, shard_of
+from tasks3.store import add_task, filter_tasks, load_all, mark_complete, save_all, search, transaction
+
+pytestmark = pytest.mark.usefixtures("no_store_cache")
+
+CASES = [("overdue", None), ("today", None), ("priority", "high"), ("tag", "work"),
+         ("open", None), ("done", None), ("bogus", None)]
+
+
+def test_directory_is_sharded(tmp_path: Path):
+    assert isinstance(open_backend(tmp_path / "t.shards"), ShardedBackend)
+    assert isinstance(open_backend(tmp_path), ShardedBackend)
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_sharded_matches_single_file(tmp_path: Path, monkeypatch, parallel: bool):
+    if parallel:
+        monkeypatch.setattr(shardstore, "PARALLEL_BYTES", 0)
+        monkeypatch.setattr(shardstore, "_cpus", lambda: 2)
+    js, sh = tmp_path / "tasks.json", tmp_path / "tasks.shards"
+    tasks = Task.from_dicts(generate(300, seed=3))
+    save_all(js, tasks)
+    save_all(sh, tasks)
+    extra = add_task(sh, "Added report", tags=["work"])
+    add_task(js, extra.title, tags=extra.tags)
+    mark_complete(sh, tasks[0].id)
+    mark_complete(js, tasks[0].id)
+
+    key = lambda t: (t.title, t.completed)
+    assert sorted(map(key, load_all(sh))) == sorted(map(key, load_all(js)))
+    for q in ["report", "#12", "ax", "zzz"]:
+        got = search(sh, q)
+        assert sorted(map(key, got)) == sorted(map(key, search(js, q))), q
+        assert got == search(sh, q)  # stable order
+    for mode, value in CASES:
+        got = filter_tasks(sh, mode, value)
+        assert sorted(map(key, got)) == sorted(map(key, filter_tasks(js, mode, value))), mode
+
+
+def test_writes_touch_one_shard(tmp_path: Path):
+    sh = tmp_path / "tasks.shards"
+    save_all(sh, Task.from_dicts(generate(50)))
+    with ShardedBackend(sh) as b:
+        before = [s.stamp() for s in b.shards]
+        t = add_task(sh, "One shard")
+        after = [s.stamp() for s in b.shards]
+        changed = [i for i, (x, y) in enumerate(zip(before, after)) if x != y]
+        assert changed == [shard_of(t.id, len(b.shards))]
+
+        ids = [x.id for x in load_all(sh)[:10]]
+        with transaction(sh) as tx:
+            for tid in ids:
+                tx.complete(tid)
+    assert all(x.completed for x in load_all(sh) if x.id in ids)
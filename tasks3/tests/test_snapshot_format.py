@@ -0,0 +1,79 @@
+# tasks3/tests/test_snapshot_format.py
+from pathlib import Path
+
+import pytest
+
+from tasks3 import snapshot
+from tasks3.cli import main as cli_main
+from tasks3.store import add_task, compact, iter_tasks, load_all, mark_complete, search
+
+pytestmark = pytest.mark.usefixtures("no_store_cache")
+
+RECORDS = [
+    {"id": "a1", "title": "First", "description": "", "due": "2025-01-02",
+     "priority": "high", "tags": ["x", "y"], "completed": True},
+    {"id": "b2", "title": "Ünïcode \"quoted\"", "description": "multi\nline", "due": None,
+     "priority": "low", "tags": [], "completed": False},
+    # not the usual shape: kept as-is
+    {"id": "c3", "title": "Legacy", "extra": 1},
+    {"id": "d4", "title": "Odd", "description": None, "due": None,
+     "priority": "medium", "tags": ["x"], "completed": 0},
+]
+
+
+@pytest.mark.parametrize("fmt", snapshot.FORMATS)
+def test_round_trip(tmp_path: Path, fmt: str):
+    file = tmp_path / "tasks.json"
+    snapshot.dump(file, RECORDS, fmt)
+    assert snapshot.format_of(file) == fmt
+    assert snapshot.load(file) == RECORDS
+    assert list(snapshot.iter_load(file)) == RECORDS
+    snapshot.dump(file, [], fmt)
+    assert snapshot.load(file) == []
+
+
+def test_dump_keeps_format(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    snapshot.dump(file, RECORDS)
+    assert snapshot.format_of(file) == "json"
+    snapshot.dump(file, RECORDS, "columnar-zlib")
+    snapshot.dump(file, RECORDS[:1])
+    assert snapshot.format_of(file) == "columnar-zlib"
+    with pytest.raises(ValueError):
+        snapshot.dump(file, RECORDS, "xml")
+
+
+def test_columnar_is_smaller(tmp_path: Path):
+    recs = [{"id": f"{i:08x}", "title": f"Task {i}", "description": "", "due": None,
+             "priority": "medium", "tags": ["work"], "completed": i % 3 == 0} for i in range(500)]
+    sizes = {}
+    for fmt in snapshot.FORMATS:
+        file = tmp_path / f"{fmt}.json"
+        snapshot.dump(file, recs, fmt)
+        sizes[fmt] = file.stat().st_size
+    assert sizes["columnar"] < sizes["json"] / 2
+    assert sizes["columnar-zlib"] < sizes["columnar"]
+
+
+def test_store_keeps_format_through_journal(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    a = add_task(file, "Alpha report")
+    add_task(file, "Beta")
+    assert cli_main(["--file", str(file), "convert", "columnar-lzma"]) == 0
+    assert snapshot.format_of(file) == "columnar-lzma"
+    c = add_task(file, "Gamma report")
+    mark_complete(file, a.id)
+    assert [t.title for t in search(file, "report")] == ["Alpha report", "Gamma report"]
+    compact(file)
+    assert snapshot.format_of(file) == "columnar-lzma"
+    assert [(t.id, t.completed) for t in iter_tasks(file)][::2] == [(a.id, True), (c.id, False)]
+    assert cli_main(["--file", str(file), "convert", "json"]) == 0
+    assert snapshot.format_of(file) == "json"
+    assert len(load_all(file)) == 3
+
+
+def test_convert_rejected_for_sqlite(tmp_path: Path, capsys):
+    file = tmp_path / "tasks.db"
+    add_task(file, "A")
+    assert cli_main(["--file", str(file), "convert", "columnar"]) == 2
+    assert "snapshot formats" in capsys.readouterr().err
@@ -0,0 +1,67 @@
+# tasks3/tests/test_startup.py
+from pathlib import Path
+
+import pytest
+
+from tasks3.bench.startup import HEAVY_MODULES, STARTUP_COMMANDS, import_times, unexpected_modules
+from tasks3.bench.generate import write_store
+from tasks3.cli import _quick_args, build_parser, main as cli_main, parse_args
+from tasks3.store import add_task, load_all
+
+pytestmark = pytest.mark.usefixtures("no_store_cache")
+
+
+@pytest.mark.parametrize("argv", [
+    ["add", "Buy milk"],
+    ["-f", "x.json", "add", "Buy milk", "-d", "2%", "--due", "2030-01-02",
+     "--priority", "high", "-t", "a", "--tag", "b"],
+    ["add", "-"],
+    ["complete"],
+    ["complete", "-"],
+    ["--file", "x.json", "complete", "ab12cd34", "ef56"],
+    ["list"],
+])
+def test_quick_parse_matches_argparse(argv):
+    quick = _quick_args(argv)
+    assert quick is not None
+    assert vars(quick) == vars(build_parser().parse_args(argv))
+
+
+@pytest.mark.parametrize("argv", [
+    [], ["--help"], ["add"], ["add", "a", "b"], ["add", "x", "--priority", "urgent"],
+    ["add", "x", "--due", "1", "--due", "2"], ["add", "x", "-t"], ["add", "x", "-t", "-d"],
+    ["add", "x", "--tag=a"], ["list", "--limit", "3"], ["list", "extra"],
+    ["--profile", "list"], ["-f", "--", "list"], ["search", "x"], ["serve"],
+])
+def test_everything_else_goes_to_argparse(argv):
+    assert _quick_args(argv) is None
+
+
+def test_quick_commands_run(tmp_path: Path, capsys):
+    file = tmp_path / "tasks.json"
+    assert cli_main(["--file", str(file), "add", "Quick", "-t", "x", "-t", "y"]) == 0
+    t = load_all(file)[0]
+    assert (t.title, t.tags) == ("Quick", ["x", "y"])
+    assert cli_main(["--file", str(file), "complete", t.id]) == 0
+    assert cli_main(["--file", str(file), "list"]) == 0
+    assert capsys.readouterr().out.splitlines()[-1].endswith("done=True")
+    with pytest.raises(SystemExit):
+        parse_args(["add", "x", "--priority", "urgent"])
+
+
+@pytest.fixture(scope="module")
+def startup_store(tmp_path_factory) -> Path:
+    path = write_store(tmp_path_factory.mktemp("startup") / "tasks.json", 100)
+    add_task(path, "journalled")
+    import_times(path, ["list"])   # bytecode caches
+    return path
+
+
+@pytest.mark.parametrize("name", sorted(STARTUP_COMMANDS))
+def test_quick_commands_import_little(startup_store: Path, name: str):
+    # what is imported, not how long it takes: the import-time budget is
+    # checked by `python -m tasks3.bench --startup`
+    times = import_times(startup_store, STARTUP_COMMANDS[name])
+    assert "tasks3.cli" in times
+    assert [m for m in HEAVY_MODULES if m in times] == []
+    assert unexpected_modules(times) == []
@@ -0,0 +1,31 @@
+# tasks3/tests/test_stream.py
+import io
+from pathlib import Path
+
+import pytest
+
+from tasks3 import snapshot
+from tasks3.store import add_task, compact, iter_tasks, load_all, mark_complete
+
+pytestmark = pytest.mark.usefixtures("no_store_cache")
+
+
+def test_iter_array_small_chunks():
+    text = '[ {"a": "x]y", "b": [1, 2]} ,\n {"a": "\\u00e9"}, {}]'
+    got = list(snapshot.iter_array(io.StringIO(text), chunk=3))
+    assert got == [{"a": "x]y", "b": [1, 2]}, {"a": "é"}, {}]
+    assert list(snapshot.iter_array(io.StringIO("  []"))) == []
+    with pytest.raises(ValueError):
+        list(snapshot.iter_array(io.StringIO('[{"a": 1}')))
+
+
+def test_iter_tasks_matches_load_all(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    a = add_task(file, "A")
+    add_task(file, "B")
+    compact(file)
+    c = add_task(file, "C")
+    mark_complete(file, a.id)
+    mark_complete(file, c.id)
+    assert list(iter_tasks(file)) == load_all(file)
+    assert [(t.id, t.completed) for t in iter_tasks(file)][::2] == [(a.id, True), (c.id, True)]
@@ -0,0 +1,120 @@
+# tasks3/tests/test_watch.py
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from tasks3 import snapshot
+from tasks3.cli import build_parser
+from tasks3.filestore import FileBackend
+from tasks3.memstore import MemoryBackend
+from tasks3.store import add_task, compact, mark_complete
+from tasks3.watch import LiveView, Watcher, view_matcher
+
+pytestmark = pytest.mark.usefixtures("no_store_cache")
+
+
+def _no_snapshot_reads(monkeypatch):
+    def fail(*a):
+        raise AssertionError("read the snapshot")
+    for name in ("load", "iter_load", "load_stat", "iter_load_stat"):
+        monkeypatch.setattr(snapshot, name, fail)
+
+
+def test_sync_reads_only_the_new_journal_lines(tmp_path: Path, monkeypatch):
+    file = tmp_path / "tasks.json"
+    tasks = [add_task(file, f"Task {i}") for i in range(5)]
+    compact(file)
+    mem = MemoryBackend(FileBackend(file))
+    assert mem.sync() == set()
+
+    with monkeypatch.context() as m:
+        _no_snapshot_reads(m)
+        new = add_task(file, "Outside")
+        mark_complete(file, tasks[2].id)
+        assert mem.sync() == {2, 5}
+        assert mem.records[5]["title"] == "Outside" and mem.records[2]["completed"]
+        assert mem.sync() == set()
+        # our own writes are not read back
+        mem.complete(tasks[0].id)
+        mem.flush()
+        assert mem.sync() == set()
+        assert [t.id for t in mem.iter_search("outside")] == [new.id]   # indexes caught up
+
+    compact(file)   # a new snapshot: read it again
+    assert mem.sync() is None
+    assert [r["completed"] for r in mem.records] == [True, False, True, False, False, False]
+
+
+def test_live_view_diffs(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    a = add_task(file, "Write report")
+    b = add_task(file, "Call bob")
+    view = LiveView(MemoryBackend(FileBackend(file)),
+                    view_matcher(SimpleNamespace(view="filter", mode="open", value=None)))
+    assert [(s, r["id"]) for s, r in view.update()] == [("+", a.id), ("+", b.id)]
+    assert view.update() == []
+    mark_complete(file, a.id)
+    c = add_task(file, "Another report")
+    assert [(s, r["id"]) for s, r in view.update()] == [("-", a.id), ("+", c.id)]
+
+    search = LiveView(MemoryBackend(FileBackend(file)),
+                      view_matcher(SimpleNamespace(view="search", query="REPORT")))
+    assert {r["id"] for _, r in search.update()} == {a.id, c.id}
+    mark_complete(file, c.id)
+    assert [(s, r["id"], r["completed"]) for s, r in search.update()] == [("~", c.id, True)]
+    compact(file)
+    assert search.update() == []   # reloaded, nothing new
+
+
+@pytest.mark.parametrize("poll", [False, True])
+def test_watcher_wakes_for_the_store_only(tmp_path: Path, poll: bool):
+    file = tmp_path / "tasks.json"
+    add_task(file, "First")
+    w = Watcher(FileBackend(file).files(), interval=0.02, poll=poll)
+    try:
+        assert w.wait(0.1) is False
+        if not w.polling:
+            (tmp_path / "unrelated.txt").write_text("x")
+            assert w.wait(0.1) is False
+        timer = threading.Timer(0.05, add_task, (file, "Second"))
+        timer.start()
+        t0 = time.monotonic()
+        assert w.wait(5) is True
+        assert time.monotonic() - t0 < 4
+        timer.join()
+    finally:
+        w.close()
+
+
+def test_watch_parses():
+    args = build_parser().parse_args(["watch", "--poll", "filter", "tag", "--value", "x"])
+    assert (args.cmd, args.view, args.mode, args.value, args.poll) == ("watch", "filter", "tag", "x", True)
+    args = build_parser().parse_args(["watch", "query", "open", "tag:x"])
+    assert (args.view, args.expr, args.interval) == ("query", ["open", "tag:x"], 1.0)
+
+
+def test_cli_watch_prints_changes(tmp_path: Path):
+    file = tmp_path / "tasks.json"
+    a = add_task(file, "Open one")
+    env = dict(os.environ, TASKS3_NO_DAEMON="1")
+    src = str(Path(__file__).resolve().parents[1] / "src")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [src, env.get("PYTHONPATH")]))
+    proc = subprocess.Popen(
+        [sys.executable, "-c", "from tasks3.cli import main; raise SystemExit(main())",
+         "--file", str(file), "watch", "filter", "open"],
+        env=env, stdout=subprocess.PIPE, text=True)
+    try:
+        assert proc.stdout.readline().startswith(f"{a.id} :: Open one")
+        b = add_task(file, "Open two")
+        assert proc.stdout.readline().startswith(f"+ {b.id} :: Open two")
+        mark_complete(file, a.id)
+        assert proc.stdout.readline() == f"- {a.id} :: Open one\n"
+    finally:
+        proc.terminate()
+        proc.wait(5)